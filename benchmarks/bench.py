@@ -0,0 +1,241 @@
+"""
+Offline benchmark and load test against the mock provider server
+
+Scenarios:
+    api     N concurrent users calling utils.api_clients.get_chat_completion
+    stream  N concurrent users consuming utils.api_clients.stream_chat_completion
+    app     N concurrent users driving render_chat through Streamlit's AppTest,
+            backed by the in-memory FakeSupabase
+
+Examples:
+    python -m benchmarks.bench --users 20 --requests 10
+    python -m benchmarks.bench --scenario app --users 5 --save-baseline
+    python -m benchmarks.bench --check          # exit 1 on regression vs baseline
+
+Reports throughput, p50/p95/p99 latency, time to first token and peak
+Python memory; baselines are stored in benchmarks/baseline.json.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.fake_supabase import FakeSupabase
+from benchmarks.mock_server import MockConfig, provider_environment, start_mock_server
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+
+# A run regresses when it is this much worse than the baseline
+REGRESSION_TOLERANCE = 0.2
+
+PROVIDERS = [
+    ("openai", "gpt-4o-mini"),
+    ("anthropic", "claude-3-5-haiku-20241022"),
+    ("google", "gemini-1.5-flash"),
+    ("perplexity", "sonar"),
+]
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def run_users(users, requests_per_user, user_task):
+    """Run user_task(user_index, request_index) for every simulated user concurrently"""
+    latencies, ttfts, errors = [], [], []
+    lock = threading.Lock()
+
+    def simulate(user_index):
+        for request_index in range(requests_per_user):
+            start = time.perf_counter()
+            try:
+                ttft = user_task(user_index, request_index)
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    if ttft is not None:
+                        ttfts.append(ttft)
+            except Exception as e:
+                with lock:
+                    errors.append(type(e).__name__)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(simulate, range(users)))
+    wall_time = time.perf_counter() - start
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "error_classes": sorted(set(errors)),
+        "wall_time_s": wall_time,
+        "throughput_rps": len(latencies) / wall_time if wall_time else 0.0,
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p95_s": percentile(latencies, 95),
+        "latency_p99_s": percentile(latencies, 99),
+        "ttft_p50_s": percentile(ttfts, 50),
+        "ttft_p95_s": percentile(ttfts, 95),
+        "peak_memory_mb": peak_memory / 1e6,
+    }
+
+def user_messages(user_index, request_index):
+    return [{"role": "user", "content": f"User {user_index} question {request_index}: summarize the plan."}]
+
+def api_scenario(users, requests_per_user):
+    from utils.api_clients import get_chat_completion
+
+    def task(user_index, request_index):
+        provider, model = PROVIDERS[(user_index + request_index) % len(PROVIDERS)]
+        get_chat_completion(provider, model, user_messages(user_index, request_index), f"mock-key-{user_index}")
+        return None
+
+    return run_users(users, requests_per_user, task)
+
+def stream_scenario(users, requests_per_user):
+    from utils.api_clients import stream_chat_completion
+
+    def task(user_index, request_index):
+        provider, model = PROVIDERS[(user_index + request_index) % len(PROVIDERS)]
+        start = time.perf_counter()
+        ttft = None
+        for _ in stream_chat_completion(provider, model, user_messages(user_index, request_index), f"mock-key-{user_index}"):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+        return ttft
+
+    return run_users(users, requests_per_user, task)
+
+def app_scenario(users, requests_per_user):
+    from streamlit.testing.v1 import AppTest
+    import utils.supabase_client
+    from utils.key_store import KeyStore, load_master_key
+
+    fake_supabase = FakeSupabase(latency=0.005)
+    # The app builds its client through create_client; hand it the fake instead
+    utils.supabase_client.create_client = lambda url, key, options=None: fake_supabase
+
+    # The app reads API keys from the per-user key store, so seed a throwaway one
+    state_dir = Path(tempfile.mkdtemp(prefix="bench-app-"))
+    key_store_config = {"path": str(state_dir / "keys"), "secret": "bench-key-store"}
+    key_store = KeyStore(key_store_config["path"], master_key=load_master_key(key_store_config["secret"]))
+    for user_index in range(users):
+        provider, _ = PROVIDERS[user_index % len(PROVIDERS)]
+        key_store.set_key(f"user-{user_index}", provider, f"mock-key-{user_index}")
+
+    def task(user_index, request_index):
+        provider, model = PROVIDERS[user_index % len(PROVIDERS)]
+        user = SimpleNamespace(id=f"user-{user_index}", email=f"user{user_index}@example.com")
+        chat = {"id": f"chat-{user_index}", "title": "Bench", "provider": provider, "model": model}
+
+        app = AppTest.from_file(str(ROOT / "streamlit_app.py"), default_timeout=60)
+        app.secrets["supabase"] = {"url": "http://fake-supabase", "key": "fake-key"}
+        app.secrets["key_store"] = key_store_config
+        app.secrets["model_catalog"] = {"path": str(state_dir / "models")}
+        app.session_state["user"] = user
+        app.session_state["selected_chat"] = chat
+        app.run()
+        app.chat_input[0].set_value(user_messages(user_index, request_index)[0]["content"]).run()
+        if app.exception:
+            raise RuntimeError(app.exception[0].message)
+        return None
+
+    try:
+        result = run_users(users, requests_per_user, task)
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+    result["supabase_requests"] = fake_supabase.requests
+    return result
+
+SCENARIOS = {
+    "api": api_scenario,
+    "stream": stream_scenario,
+    "app": app_scenario,
+}
+
+def check_regressions(results, baseline):
+    """Compare results to the baseline and return a list of regression messages"""
+    regressions = []
+    for scenario, result in results.items():
+        reference = baseline.get(scenario)
+        if not reference:
+            continue
+        for metric in ("latency_p95_s", "latency_p99_s", "ttft_p95_s", "peak_memory_mb"):
+            if result.get(metric) is None or reference.get(metric) is None:
+                continue
+            if result[metric] > reference[metric] * (1 + REGRESSION_TOLERANCE):
+                regressions.append(f"{scenario}.{metric}: {result[metric]:.3f} > baseline {reference[metric]:.3f}")
+        if result["throughput_rps"] < reference["throughput_rps"] * (1 - REGRESSION_TOLERANCE):
+            regressions.append(
+                f"{scenario}.throughput_rps: {result['throughput_rps']:.2f} < baseline {reference['throughput_rps']:.2f}"
+            )
+        if result["errors"] > reference.get("errors", 0):
+            regressions.append(f"{scenario}.errors: {result['errors']} > baseline {reference.get('errors', 0)}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the chatbot against mock providers")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS) + ["all"], default="all")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent simulated users")
+    parser.add_argument("--requests", type=int, default=5, help="Requests per user")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock seconds before first byte")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="Mock streamed tokens per second")
+    parser.add_argument("--response-tokens", type=int, default=64)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline")
+    parser.add_argument("--check", action="store_true", help="Fail if results regress against the baseline")
+    parser.add_argument("--output", help="Also write results to this JSON file")
+    args = parser.parse_args()
+
+    config = MockConfig(args.latency, args.token_rate, args.response_tokens, args.error_rate)
+    server, base_url = start_mock_server(config)
+    # Must be set before utils.api_clients is imported
+    os.environ.update(provider_environment(base_url))
+
+    scenarios = sorted(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    results = {}
+    for name in scenarios:
+        print(f"Running {name}: {args.users} users x {args.requests} requests", file=sys.stderr)
+        results[name] = SCENARIOS[name](args.users, args.requests)
+        results[name]["users"] = args.users
+
+    server.shutdown()
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+        baseline.update(results)
+        BASELINE_PATH.write_text(json.dumps(baseline, indent=2) + "\n")
+        print(f"Baseline saved to {BASELINE_PATH}", file=sys.stderr)
+
+    if args.check:
+        if not BASELINE_PATH.exists():
+            print("No baseline found, run with --save-baseline first", file=sys.stderr)
+            sys.exit(2)
+        regressions = check_regressions(results, json.loads(BASELINE_PATH.read_text()))
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+In-memory stand-in for the Supabase client used by the app
+
+Implements the subset of the postgrest query builder the app calls
+(select/eq/ilike/or_/order/range/limit, insert/update/upsert/delete) plus
+an auth stub, with an optional per-request latency to model the network.
+"""
+import copy
+import itertools
+import re
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+class FakeQuery:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.action = "select"
+        self.payload = None
+        self.filters = []
+        self.orders = []
+        self.offset = 0
+        self.row_limit = None
+        self.columns = None
+        self.on_conflict = None
+
+    # Builders
+
+    def select(self, columns="*", count=None):
+        self.action = "select"
+        self.columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        return self
+
+    def insert(self, rows):
+        self.action = "insert"
+        self.payload = rows
+        return self
+
+    def upsert(self, rows, on_conflict=None):
+        self.action = "upsert"
+        self.payload = rows
+        self.on_conflict = on_conflict
+        return self
+
+    def update(self, changes):
+        self.action = "update"
+        self.payload = changes
+        return self
+
+    def delete(self):
+        self.action = "delete"
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: _compare(row.get(column), "eq", value))
+        return self
+
+    def neq(self, column, value):
+        self.filters.append(lambda row: _compare(row.get(column), "neq", value))
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda row: _compare(row.get(column), "lt", value))
+        return self
+
+    def lte(self, column, value):
+        self.filters.append(lambda row: _compare(row.get(column), "lte", value))
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: _compare(row.get(column), "gt", value))
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: _compare(row.get(column), "gte", value))
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def ilike(self, column, pattern):
+        regex = re.compile("^" + re.escape(pattern).replace("%", ".*").replace("_", ".") + "$", re.IGNORECASE | re.DOTALL)
+        self.filters.append(lambda row: regex.match(str(row.get(column) or "")) is not None)
+        return self
+
+    def or_(self, expression):
+        self.filters.append(_parse_logic("or", expression))
+        return self
+
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def range(self, start, end):
+        self.offset = start
+        self.row_limit = end - start + 1
+        return self
+
+    def limit(self, count):
+        self.row_limit = count
+        return self
+
+    def execute(self):
+        time.sleep(self.db.latency)
+        with self.db.lock:
+            self.db.requests += 1
+            return getattr(self, f"_{self.action}")()
+
+    # Actions
+
+    def _rows(self):
+        return self.db.tables.setdefault(self.table, [])
+
+    def _matching(self):
+        return [row for row in self._rows() if all(f(row) for f in self.filters)]
+
+    def _select(self):
+        rows = self._matching()
+        for column, desc in reversed(self.orders):
+            rows.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+        rows = rows[self.offset:]
+        if self.row_limit is not None:
+            rows = rows[:self.row_limit]
+        if self.columns:
+            rows = [{column: row.get(column) for column in self.columns} for row in rows]
+        return FakeResponse(copy.deepcopy(rows))
+
+    def _insert(self):
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        inserted = []
+        for row in rows:
+            row = dict(row)
+            row.setdefault("id", next(self.db.ids))
+            row.setdefault("created_at", time.strftime("%Y-%m-%dT%H:%M:%S"))
+            self._rows().append(row)
+            inserted.append(copy.deepcopy(row))
+        return FakeResponse(inserted)
+
+    def _upsert(self):
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        keys = (self.on_conflict or "").split(",") if self.on_conflict else None
+        upserted = []
+        for row in rows:
+            match_keys = keys or ([k for k in ("id", "key") if k in row][:1])
+            existing = next(
+                (r for r in self._rows() if match_keys and all(r.get(k) == row.get(k) for k in match_keys)),
+                None
+            )
+            if existing is not None:
+                existing.update(row)
+                upserted.append(copy.deepcopy(existing))
+            else:
+                self.payload = row
+                upserted.extend(self._insert().data)
+        return FakeResponse(upserted)
+
+    def _update(self):
+        updated = []
+        for row in self._matching():
+            row.update(self.payload)
+            updated.append(copy.deepcopy(row))
+        return FakeResponse(updated)
+
+    def _delete(self):
+        matching = self._matching()
+        ids = {id(row) for row in matching}
+        self.db.tables[self.table] = [row for row in self._rows() if id(row) not in ids]
+        return FakeResponse(copy.deepcopy(matching))
+
+def _compare(value, op, target):
+    if value is None:
+        return False
+    if not isinstance(value, str):
+        try:
+            target = type(value)(target)
+        except (TypeError, ValueError):
+            value = str(value)
+    if op == "eq":
+        return value == target
+    if op == "neq":
+        return value != target
+    if op == "lt":
+        return value < target
+    if op == "lte":
+        return value <= target
+    if op == "gt":
+        return value > target
+    if op == "gte":
+        return value >= target
+    raise ValueError(f"Unsupported operator {op}")
+
+def _split_top_level(expression):
+    parts, depth, quoted, current = [], 0, False, ""
+    for char in expression:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        if char == "," and depth == 0 and not quoted:
+            parts.append(current)
+            current = ""
+        else:
+            current += char
+    if current:
+        parts.append(current)
+    return parts
+
+def _parse_logic(operator, expression):
+    """Parse a PostgREST logic tree such as a.lt.1,and(b.eq.2,c.gt.3)"""
+    conditions = []
+    for part in _split_top_level(expression):
+        nested = re.match(r"^(and|or)\((.*)\)$", part)
+        if nested:
+            conditions.append(_parse_logic(nested.group(1), nested.group(2)))
+            continue
+        column, op, value = part.split(".", 2)
+        value = value[1:-1] if value.startswith('"') and value.endswith('"') else value
+        conditions.append(lambda row, column=column, op=op, value=value: _compare(row.get(column), op, value))
+    combine = all if operator == "and" else any
+    return lambda row: combine(condition(row) for condition in conditions)
+
+class FakeAuth:
+    def __init__(self, db):
+        self.db = db
+
+    def sign_in_with_password(self, credentials):
+        time.sleep(self.db.latency)
+        user = SimpleNamespace(id=str(uuid.uuid5(uuid.NAMESPACE_URL, credentials["email"])), email=credentials["email"])
+        session = SimpleNamespace(access_token="fake-access-token", refresh_token="fake-refresh-token", expires_in=3600)
+        return SimpleNamespace(user=user, session=session)
+
+    def sign_up(self, credentials):
+        return self.sign_in_with_password(credentials)
+
+class FakeSupabase:
+    """Thread-safe in-memory Supabase client"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.tables = {}
+        self.lock = threading.RLock()
+        self.ids = itertools.count(1)
+        self.requests = 0
+        self.auth = FakeAuth(self)
+
+    def table(self, name):
+        return FakeQuery(self, name)
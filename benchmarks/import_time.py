@@ -0,0 +1,106 @@
+"""
+Startup import-time benchmark and budget check
+
+Imports the modules streamlit_app.py loads at startup in a fresh interpreter
+under `python -X importtime`, then reports the slowest imports, the total
+time and peak RSS. Fails when the total exceeds the budget or when a
+provider SDK is imported at startup instead of on first use.
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --budget-ms 1500 --top 15
+"""
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# What streamlit_app.py imports before the first provider call
+STARTUP_MODULES = [
+    "streamlit",
+    "components.auth",
+    "components.sidebar",
+    "components.chat_interface",
+    "components.settings",
+    "components.admin",
+    "utils.supabase_client",
+    "utils.local_storage",
+    "utils.session_state",
+    "utils.metrics",
+]
+
+# Provider SDKs that must only load when a provider is first used
+LAZY_MODULES = [
+    "openai",
+    "anthropic",
+    "google.generativeai",
+    "grpc",
+    "extra_streamlit_components",
+]
+
+DEFAULT_BUDGET_MS = 2000
+
+_PROBE = """
+import json, resource, sys
+{imports}
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{"rss_kb": rss_kb, "modules": sorted(sys.modules)}}))
+"""
+
+def parse_importtime(stderr):
+    """Parse `-X importtime` output into {module: (self_us, cumulative_us)}"""
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+def measure(modules):
+    """Import modules in a fresh interpreter and return timings, loaded modules and peak RSS"""
+    imports = "\n".join(f"import {module}" for module in modules)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(imports=imports)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "import failed")
+
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    timings = parse_importtime(result.stderr)
+    return timings, set(probe["modules"]), probe["rss_kb"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure startup import time")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="Maximum total import time")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to show")
+    args = parser.parse_args()
+
+    timings, loaded, rss_kb = measure(STARTUP_MODULES)
+
+    # Top-level imports carry the cumulative time of everything beneath them
+    total_ms = sum(timings[name][1] for name in STARTUP_MODULES if name in timings) / 1000
+    slowest = sorted(timings.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+
+    print(f"Startup imports: {total_ms:.0f} ms total, peak RSS {rss_kb / 1024:.0f} MB")
+    for name, (self_us, cumulative_us) in slowest:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"startup imports took {total_ms:.0f} ms, budget is {args.budget_ms:.0f} ms")
+    for module in LAZY_MODULES:
+        if module in loaded:
+            failures.append(f"{module} is imported at startup; it should load on first use")
+
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
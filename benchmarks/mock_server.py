@@ -0,0 +1,295 @@
+"""
+Local mock of the OpenAI, Anthropic, Gemini and Perplexity chat APIs
+
+Serves:
+    POST /v1/chat/completions                       OpenAI, Perplexity and OpenAI-compatible
+    POST /v1/messages                               Anthropic
+    POST /v1beta/models/{model}:generateContent     Gemini
+    POST /v1beta/models/{model}:streamGenerateContent
+
+Point the app at it with:
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8900
+    GEMINI_BASE_URL=http://127.0.0.1:8900
+    PERPLEXITY_BASE_URL=http://127.0.0.1:8900/v1
+
+Run standalone with: python -m benchmarks.mock_server --port 8900 --latency 0.3
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_GEMINI_PATH = re.compile(r"^/v1beta/models/(?P<model>[^:]+):(?P<method>generateContent|streamGenerateContent)")
+
+class MockConfig:
+    """Behaviour of the mock providers"""
+
+    def __init__(self, latency=0.2, token_rate=200.0, response_tokens=64, error_rate=0.0, error_status=429):
+        # Seconds before the first byte of a response
+        self.latency = latency
+        # Tokens per second while streaming (non-streamed replies wait for all of them)
+        self.token_rate = token_rate
+        # Words in every reply
+        self.response_tokens = response_tokens
+        # Fraction of requests that fail with error_status
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+    def reply_tokens(self):
+        return [f"token{i}" for i in range(self.response_tokens)]
+
+class MockProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = MockConfig()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/v1/models", "/v1beta/models"):
+            self._send_json(200, {"data": [{"id": "mock-model", "object": "model"}], "models": []})
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        time.sleep(self.config.latency)
+
+        if random.random() < self.config.error_rate:
+            headers = {"retry-after": "1"} if self.config.error_status == 429 else {}
+            self._send_json(self.config.error_status, {"error": {"message": "Injected error", "type": "mock_error"}}, headers)
+            return
+
+        path = self.path.split("?")[0]
+        gemini = _GEMINI_PATH.match(path)
+
+        if path.endswith("/chat/completions"):
+            self._openai(body)
+        elif path.endswith("/messages"):
+            self._anthropic(body)
+        elif gemini:
+            self._gemini(gemini.group("model"), gemini.group("method") == "streamGenerateContent")
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {path}"}})
+
+    # Providers
+
+    def _openai(self, body):
+        tokens = self.config.reply_tokens()
+        model = body.get("model", "mock-model")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        if not body.get("stream"):
+            self._wait_for_tokens(len(tokens))
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(tokens)},
+                    "finish_reason": "stop"
+                }],
+                "usage": self._usage(body.get("messages", []), len(tokens))
+            })
+            return
+
+        self._start_sse()
+        for i, token in enumerate(tokens):
+            self._wait_for_tokens(1)
+            self._send_sse({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": token if i == 0 else " " + token}, "finish_reason": None}]
+            })
+        self._send_sse({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+        })
+        self._send_raw_sse("[DONE]")
+        self._end_chunks()
+
+    def _anthropic(self, body):
+        tokens = self.config.reply_tokens()
+        model = body.get("model", "mock-model")
+        message_id = f"msg_{uuid.uuid4().hex[:12]}"
+        usage = self._usage(body.get("messages", []), len(tokens))
+
+        if not body.get("stream"):
+            self._wait_for_tokens(len(tokens))
+            self._send_json(200, {
+                "id": message_id,
+                "type": "message",
+                "role": "assistant",
+                "model": model,
+                "content": [{"type": "text", "text": " ".join(tokens)}],
+                "stop_reason": "end_turn",
+                "stop_sequence": None,
+                "usage": {"input_tokens": usage["prompt_tokens"], "output_tokens": usage["completion_tokens"]}
+            })
+            return
+
+        self._start_sse()
+        self._send_sse({
+            "type": "message_start",
+            "message": {
+                "id": message_id, "type": "message", "role": "assistant", "model": model,
+                "content": [], "stop_reason": None, "stop_sequence": None,
+                "usage": {"input_tokens": usage["prompt_tokens"], "output_tokens": 0}
+            }
+        }, event="message_start")
+        self._send_sse({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}},
+                       event="content_block_start")
+        for i, token in enumerate(tokens):
+            self._wait_for_tokens(1)
+            self._send_sse({
+                "type": "content_block_delta", "index": 0,
+                "delta": {"type": "text_delta", "text": token if i == 0 else " " + token}
+            }, event="content_block_delta")
+        self._send_sse({"type": "content_block_stop", "index": 0}, event="content_block_stop")
+        self._send_sse({
+            "type": "message_delta",
+            "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+            "usage": {"output_tokens": len(tokens)}
+        }, event="message_delta")
+        self._send_sse({"type": "message_stop"}, event="message_stop")
+        self._end_chunks()
+
+    def _gemini(self, model, stream):
+        tokens = self.config.reply_tokens()
+
+        def chunk(text, finished):
+            candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+            if finished:
+                candidate["finishReason"] = "STOP"
+            return {"candidates": [candidate], "modelVersion": model}
+
+        if not stream:
+            self._wait_for_tokens(len(tokens))
+            self._send_json(200, chunk(" ".join(tokens), True))
+            return
+
+        # The REST transport reads a streamed JSON array unless alt=sse is requested
+        sse = "alt=sse" in self.path
+        if sse:
+            self._start_sse()
+        else:
+            self._start_chunks("application/json")
+            self._send_chunk(b"[")
+
+        for i, token in enumerate(tokens):
+            self._wait_for_tokens(1)
+            data = chunk(token if i == 0 else " " + token, i == len(tokens) - 1)
+            if sse:
+                self._send_sse(data)
+            else:
+                self._send_chunk(((b"," if i else b"") + json.dumps(data).encode("utf-8")))
+
+        if not sse:
+            self._send_chunk(b"]")
+        self._end_chunks()
+
+    # Helpers
+
+    def _wait_for_tokens(self, count):
+        if self.config.token_rate > 0:
+            time.sleep(count / self.config.token_rate)
+
+    def _usage(self, messages, completion_tokens):
+        prompt_tokens = sum(len(str(msg.get("content", "")).split()) for msg in messages)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_chunks(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+    def _start_sse(self):
+        self._start_chunks("text/event-stream")
+
+    def _send_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_sse(self, payload, event=None):
+        prefix = f"event: {event}\n" if event else ""
+        self._send_chunk(f"{prefix}data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+    def _send_raw_sse(self, data):
+        self._send_chunk(f"data: {data}\n\n".encode("utf-8"))
+
+    def _end_chunks(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+def start_mock_server(config=None, host="127.0.0.1", port=0):
+    """Start the mock server on a background thread and return (server, base_url)"""
+    handler = type("ConfiguredMockProviderHandler", (MockProviderHandler,), {"config": config or MockConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-provider-server", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+def provider_environment(base_url):
+    """Environment variables that point every provider client at the mock server"""
+    return {
+        "OPENAI_BASE_URL": f"{base_url}/v1",
+        "ANTHROPIC_BASE_URL": base_url,
+        "GEMINI_BASE_URL": base_url,
+        "PERPLEXITY_BASE_URL": f"{base_url}/v1",
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock LLM provider server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before the first byte")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="Streamed tokens per second")
+    parser.add_argument("--response-tokens", type=int, default=64)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=429)
+    args = parser.parse_args()
+
+    config = MockConfig(args.latency, args.token_rate, args.response_tokens, args.error_rate, args.error_status)
+    server, base_url = start_mock_server(config, args.host, args.port)
+    print(f"Mock providers listening on {base_url}")
+    for name, value in provider_environment(base_url).items():
+        print(f"  export {name}={value}")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
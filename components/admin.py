@@ -0,0 +1,47 @@
+import streamlit as st
+from utils.metrics import get_recent_metrics, summarize_metrics
+from utils.provider_registry import get_import_times
+from utils.router import get_router
+from utils.session_memory import get_all_session_usage
+
+def is_admin(user):
+    """Check whether a user is listed in the admin_emails secret"""
+    admin_emails = st.secrets.get("admin_emails", [])
+    return getattr(user, "email", None) in admin_emails
+
+def render_admin():
+    """Render provider latency and throughput metrics for admins"""
+    
+    st.subheader("Provider Performance")
+    
+    import_times = get_import_times()
+    if import_times:
+        st.caption("Provider SDKs loaded in this process: " + ", ".join(
+            f"{module.rsplit('.', 1)[-1]} ({seconds * 1000:.0f} ms)" for module, seconds in import_times.items()
+        ))
+    
+    # Conversation memory held by each live session in this process
+    session_usage = get_all_session_usage()
+    if session_usage:
+        with st.expander(f"Session memory ({len(session_usage)} sessions)"):
+            st.dataframe(session_usage, use_container_width=True, hide_index=True)
+    
+    records = get_recent_metrics()
+    if not records:
+        st.info("No provider calls recorded yet in this server process.")
+        return
+    
+    st.caption(f"Last {len(records)} provider calls in this server process")
+    st.dataframe(summarize_metrics(records), use_container_width=True, hide_index=True)
+    
+    with st.expander("Recent calls"):
+        st.dataframe(
+            [metrics.to_dict() for metrics in reversed(records[-100:])],
+            use_container_width=True,
+            hide_index=True
+        )
+    
+    routing_stats = get_router().snapshot()
+    if routing_stats:
+        st.caption("Routing targets (rolling window)")
+        st.dataframe(routing_stats, use_container_width=True, hide_index=True)
@@ -1,8 +1,30 @@
 import streamlit as st
-import extra_streamlit_components as stx
+from utils.auth_session import end_session, maintain_session, restore_session, start_session, write_pending_cookies
 
 def render_auth(supabase):
-    """Render authentication UI and handle login/signup process"""
+    """
+    Render authentication UI and handle login/signup process
+    
+    supabase must be the session's own client (get_session_supabase()), since
+    signing in makes it query as the signed-in user. Returning browsers are
+    signed in from their auth cookies; a valid access token is verified
+    locally, so this needs no call to Supabase Auth.
+    """
+    
+    write_pending_cookies()
+    
+    if st.session_state.get("user") is None:
+        restore_session(supabase)
+    elif not maintain_session(supabase) and st.session_state.get("user") is None:
+        st.warning("Your session has expired. Please log in again.")
+    
+    # A refresh that timed out or hit a server error keeps the session and is retried
+    if st.session_state.pop("auth_unavailable", False):
+        st.warning("Couldn't reach the sign-in service to renew your session. Retrying on your next action.")
+        if st.session_state.get("user") is not None:
+            # The access token has expired, so nothing can be loaded until the refresh succeeds
+            st.button("Retry", key="auth_retry")
+            st.stop()
     
     if "user" in st.session_state and st.session_state.user is not None:
         # Show logout option if user is logged in
@@ -10,7 +32,7 @@ def render_auth(supabase):
         st.sidebar.write(f"Logged in as: {email}")
         
         if st.sidebar.button("Logout"):
-            del st.session_state.user
+            end_session()
             st.rerun()
         return st.session_state.user
     
@@ -26,7 +48,7 @@ def render_auth(supabase):
             if submit:
                 try:
                     response = supabase.auth.sign_in_with_password({"email": email, "password": password})
-                    st.session_state.user = response.user
+                    start_session(supabase, response)
                     st.rerun()
                 except Exception as e:
                     st.error(f"Login failed: {str(e)}")
@@ -1,93 +1,298 @@
 import streamlit as st
-from utils.api_clients import get_chat_completion
+from utils.api_clients import stream_chat_completion
+from utils.async_clients import run_compare
+from utils.jobs import get_job_manager
 from utils.local_storage import get_api_keys
+from utils.provider_registry import get_capabilities
+from utils.message_store import get_message_writer, load_messages
+from utils.model_catalog import get_model_catalog
+from utils.rate_limit import current_session_id
+from utils.response_cache import get_response_cache
+from utils.session_memory import ChatMessage, compact_messages, get_session_memory
+from utils.router import get_router, parse_policy
 
-def render_chat(chat_id, provider, model):
-    """Render chat interface for a specific chat"""
+# Number of messages loaded and shown at a time
+MESSAGE_PAGE_SIZE = 50
+
+@st.fragment
+def render_chat(chat_id, provider, model, supabase=None, routing=None):
+    """
+    Render chat interface for a specific chat
+    
+    Runs as a fragment: sending a message or loading older ones reruns only
+    the chat panel, not the sidebar, settings or auth.
+    """
+    
+    # Messages are saved in the background so the UI never waits on the DB
+    message_writer = get_message_writer() if supabase is not None else None
     
     # Create a unique key for this chat's messages in session state
     chat_messages_key = f"messages_{chat_id}"
     
-    # Initialize chat history in session state if it doesn't exist
+    # Keyset cursor for loading older messages, and how many messages are shown
+    older_cursor_key = f"older_cursor_{chat_id}"
+    visible_count_key = f"visible_count_{chat_id}"
+    
+    # Restore this chat if it was evicted to save memory, and evict idle chats over the cap
+    get_session_memory().open_chat(st.session_state, chat_id)
+    
+    # Initialize chat history in session state with the most recent page of messages
     if chat_messages_key not in st.session_state:
         st.session_state[chat_messages_key] = []
+        st.session_state[older_cursor_key] = None
+        st.session_state[visible_count_key] = MESSAGE_PAGE_SIZE
         
-        # Try to load messages from Supabase (commented out until fully implemented)
-        # try:
-        #     messages = supabase.table("messages").select("*").eq("chat_id", chat_id).order("created_at").execute()
-        #     if hasattr(messages, 'data') and messages.data:
-        #         st.session_state[chat_messages_key] = [{"role": m["role"], "content": m["content"]} for m in messages.data]
-        # except Exception as e:
-        #     st.error(f"Error loading messages: {str(e)}")
+        if supabase is not None:
+            try:
+                messages, cursor = load_messages(supabase, chat_id, limit=MESSAGE_PAGE_SIZE)
+                st.session_state[chat_messages_key] = compact_messages(messages)
+                st.session_state[older_cursor_key] = cursor
+            except Exception as e:
+                st.error(f"Error loading messages: {str(e)}")
+    
+    # Chats with a routing policy spread requests over several provider/model targets
+    try:
+        routing_policy = parse_policy(routing)
+    except (ValueError, KeyError) as e:
+        st.error(f"Invalid routing policy, using {provider}/{model} only: {str(e)}")
+        routing_policy = None
     
     # Get API keys from local storage
     api_keys = get_api_keys()
     api_key = api_keys.get(provider)
     
-    if not api_key:
+    if not api_key and not routing_policy and get_capabilities(provider).requires_api_key:
         st.warning(f"Please add your {provider.capitalize()} API key in the settings panel on the right.")
         st.info("After adding your API key, click 'Save' to store it for future use.")
         return
     
+    # A likely mistyped model name is flagged from the catalog cache; sending
+    # stays possible since a key can use models its list doesn't show
+    model_warning = None if routing_policy else get_model_catalog().validate(provider, model, api_key)
+    if model_warning:
+        st.warning(f"{model_warning} You can choose another model in the chat's settings (⚙️).")
+    
+    # Identical prompts can be answered from the response cache unless this chat opts out
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        use_cache = st.toggle(
+            "Reuse cached answers",
+            value=True,
+            key=f"use_cache_{chat_id}",
+            help="Answer repeated questions from the response cache instead of calling the provider"
+        )
+        if not use_cache:
+            response_cache = None
+    
+    # Generations run as background jobs, so a rerun, another chat or a
+    # reconnected browser can re-attach to this chat's in-flight response
+    job_manager = get_job_manager()
+    attached_job_key = f"attached_job_{chat_id}"
+    job = job_manager.get(chat_id)
+    if job is not None and job.running:
+        st.session_state[attached_job_key] = job.id
+    elif job is not None and st.session_state.get(attached_job_key) == job.id:
+        # Finished while this session was away; add its reply to the history
+        collect_job(chat_id, job)
+        job = None
+    else:
+        job = None
+    
     # Create a container for messages with fixed height and scrolling
     message_container = st.container(height=500, border=False)
     
     # Create a separate container for the input at the bottom
     input_container = st.container()
     
-    # Process user input from the bottom container first
+    # Read user input from the bottom container first
     with input_container:
-        prompt = st.chat_input(f"Message {provider}/{model}...")
+        generating = job is not None and job.running
+        if generating and st.button("Stop generating", key=f"stop_{chat_id}"):
+            job.cancel()
+        
+        prompt = st.chat_input(f"Message {provider}/{model}...", disabled=generating)
         
         if prompt:
-            # Add user message to chat history
-            st.session_state[chat_messages_key].append({"role": "user", "content": prompt})
-            
-            # Process response (outside of both containers)
+            user_message = ChatMessage("user", prompt)
             try:
-                # Get response from the selected AI provider
-                response = get_chat_completion(
-                    provider=provider,
-                    model=model,
-                    messages=st.session_state[chat_messages_key],
-                    api_key=api_key
+                job = start_generation(
+                    chat_id, provider, model, st.session_state[chat_messages_key] + [user_message],
+                    api_keys, routing_policy, response_cache, message_writer, supabase
                 )
-                
-                # Add assistant response to chat history
-                st.session_state[chat_messages_key].append({
-                    "role": "assistant",
-                    "content": response
-                })
-                
-                # Force a rerun to display new messages
-                st.rerun()
-                
             except Exception as e:
+                # Another generation for this chat, or an unreachable job state backend;
+                # the prompt isn't added to the history, so nothing needs rolling back
+                job = None
                 st.error(f"Error: {str(e)}")
-                # Keep the error visible but don't add to chat history
+            else:
+                # Add user message to chat history
+                st.session_state[chat_messages_key].append(user_message)
+                st.session_state[visible_count_key] += 1
+                if message_writer:
+                    message_writer.enqueue(chat_id, "user", prompt, client=supabase)
+                st.session_state[attached_job_key] = job.id
     
     # Display chat messages in the message container
     with message_container:
-        for message in st.session_state[chat_messages_key]:
+        messages = st.session_state[chat_messages_key]
+        visible_count = st.session_state[visible_count_key]
+        
+        # Only the most recent window is rendered, so reruns cost the same however long the chat is
+        if len(messages) > visible_count or st.session_state[older_cursor_key] is not None:
+            if st.button("Load older messages", key=f"load_older_{chat_id}"):
+                load_older_messages(supabase, chat_id)
+                st.rerun(scope="fragment")
+        
+        for message in messages[-visible_count:]:
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
+        
+        if job is not None:
+            # Stream the job's output as it arrives, starting with whatever is already buffered
+            with st.chat_message("assistant"):
+                # Shows the queue position while the provider key is at its rate limit
+                status_placeholder = st.empty()
+                
+                def show_status(message):
+                    if message:
+                        status_placeholder.caption(message)
+                    else:
+                        status_placeholder.empty()
+                
+                st.write_stream(job.follow(on_status=show_status))
+                status_placeholder.empty()
+                
+                if job.status == "error":
+                    # Keep the error visible but don't add to chat history
+                    st.error(f"Error: {job.error}")
+                elif job.result is not None:
+                    metrics = job.result.metrics
+                    st.caption(
+                        f"{metrics.provider}/{metrics.model} · " + (
+                            "cached" if metrics.cached else
+                            f"first token {metrics.ttft or 0:.2f}s · total {metrics.latency:.2f}s"
+                        )
+                    )
+            
+            collect_job(chat_id, job)
     
-    # Save messages to Supabase (commented out until fully implemented)
-    # try:
-    #     # Save user message
-    #     supabase.table("messages").insert({
-    #         "chat_id": chat_id,
-    #         "role": "user",
-    #         "content": prompt,
-    #         "created_at": time.strftime('%Y-%m-%d %H:%M:%S')
-    #     }).execute()
-    #     
-    #     # Save assistant message
-    #     supabase.table("messages").insert({
-    #         "chat_id": chat_id,
-    #         "role": "assistant",
-    #         "content": response,
-    #         "created_at": time.strftime('%Y-%m-%d %H:%M:%S')
-    #     }).execute()
-    # except Exception as e:
-    #     st.error(f"Error saving messages: {str(e)}") 
\ No newline at end of file
+    # Side-by-side answers from several models for one prompt
+    with st.expander("Compare models"):
+        render_compare(chat_id, st.session_state[chat_messages_key], api_keys, f"{provider}/{model}")
+
+def start_generation(chat_id, provider, model, history, api_keys, routing_policy, response_cache, message_writer, supabase=None):
+    """Start a background job that streams the reply and saves it when done"""
+    history = list(history)
+    
+    def stream_factory(job):
+        def on_complete(result):
+            job.result = result
+        
+        def on_wait(position, seconds):
+            if position:
+                job.set_wait_message(f"Waiting for {provider} rate limit · position {position} in queue · about {seconds:.0f}s")
+            else:
+                job.set_wait_message(f"{provider} is busy, retrying in {seconds:.0f}s")
+        
+        if routing_policy:
+            return get_router().stream(
+                routing_policy, history, api_keys,
+                cache=response_cache, on_complete=on_complete, cancelled=job.cancel_event
+            )
+        return stream_chat_completion(
+            provider=provider,
+            model=model,
+            messages=history,
+            api_key=api_keys.get(provider),
+            cache=response_cache,
+            on_complete=on_complete,
+            on_wait=on_wait,
+            cancelled=job.cancel_event
+        )
+    
+    def save_reply(job):
+        # Saved from the worker so the reply is kept even if nobody is watching;
+        # a discarded job's chat has been deleted
+        if message_writer and job.status in ("done", "cancelled") and job.text and not job.discarded:
+            message_writer.enqueue(chat_id, "assistant", job.text, client=supabase)
+    
+    return get_job_manager().start(chat_id, stream_factory, on_finish=save_reply, session_id=current_session_id())
+
+def collect_job(chat_id, job):
+    """Add a finished job's reply to this session's chat history"""
+    if st.session_state.pop(f"attached_job_{chat_id}", None) != job.id:
+        return
+    if job.status in ("done", "cancelled") and job.text:
+        st.session_state[f"messages_{chat_id}"].append(ChatMessage("assistant", job.text))
+        st.session_state[f"visible_count_{chat_id}"] += 1
+
+def load_older_messages(supabase, chat_id):
+    """Show the next page of older messages, fetching it from Supabase if needed"""
+    chat_messages_key = f"messages_{chat_id}"
+    older_cursor_key = f"older_cursor_{chat_id}"
+    visible_count_key = f"visible_count_{chat_id}"
+    
+    messages = st.session_state[chat_messages_key]
+    cursor = st.session_state[older_cursor_key]
+    
+    if len(messages) < st.session_state[visible_count_key] + MESSAGE_PAGE_SIZE and cursor is not None and supabase is not None:
+        try:
+            older, cursor = load_messages(supabase, chat_id, limit=MESSAGE_PAGE_SIZE, before=cursor)
+            st.session_state[chat_messages_key] = compact_messages(older) + messages
+            st.session_state[older_cursor_key] = cursor
+        except Exception as e:
+            st.error(f"Error loading messages: {str(e)}")
+            return
+    
+    st.session_state[visible_count_key] += MESSAGE_PAGE_SIZE
+
+def render_compare(chat_id, history, api_keys, default_targets):
+    """Render a compare view that sends one prompt to several models at once"""
+    
+    targets_text = st.text_input(
+        "Models",
+        value=default_targets,
+        key=f"compare_targets_{chat_id}",
+        help="Comma-separated provider/model pairs, e.g. openai/gpt-4o, anthropic/claude-3-5-sonnet-20241022"
+    )
+    compare_prompt = st.text_area("Prompt", key=f"compare_prompt_{chat_id}")
+    
+    if not st.button("Compare", key=f"compare_button_{chat_id}") or not compare_prompt:
+        return
+    
+    targets = parse_targets(targets_text)
+    if not targets:
+        st.warning("Enter at least one provider/model pair.")
+        return
+    
+    # One column per model, filled in as each answer arrives
+    placeholders = []
+    for column, (target_provider, target_model) in zip(st.columns(len(targets)), targets):
+        with column:
+            st.markdown(f"**{target_provider}/{target_model}**")
+            placeholders.append(st.empty())
+            placeholders[-1].info("Waiting for response...")
+    
+    def show_result(index, result):
+        with placeholders[index].container():
+            if result["error"]:
+                st.error(result["error"])
+            else:
+                st.markdown(result["content"])
+            st.caption(f"{result['latency']:.2f}s")
+    
+    run_compare(
+        targets,
+        history + [{"role": "user", "content": compare_prompt}],
+        api_keys,
+        on_result=show_result
+    )
+
+def parse_targets(targets_text):
+    """Parse "provider/model, provider/model" into (provider, model) pairs"""
+    targets = []
+    for item in targets_text.split(","):
+        provider, _, model = item.strip().partition("/")
+        if provider and model:
+            targets.append((provider.lower(), model))
+    return targets
@@ -1,11 +1,19 @@
 import streamlit as st
 from utils.local_storage import get_api_keys, save_api_key
+from utils.client_pool import get_client_pool
+from utils.response_cache import get_response_cache
+from utils.session_memory import get_session_memory
 
+@st.fragment
 def render_settings():
-    """Render API settings panel"""
+    """Render API settings panel (a fragment, so typing a key only reruns this panel)"""
     
     st.subheader("API Settings")
-    st.write("Your API keys are stored locally on your device and never sent to our servers.")
+    st.write("Your API keys are encrypted at rest and only available to your account.")
+    
+    saved_provider = st.session_state.pop("saved_api_key", None)
+    if saved_provider:
+        st.success(f"{saved_provider.capitalize()} API key saved successfully!")
     
     # Get existing API keys
     api_keys = get_api_keys()
@@ -19,7 +27,7 @@ def render_settings():
             help="Get your API key from https://platform.openai.com/account/api-keys"
         )
         if st.button("Save OpenAI Key"):
-            save_api_key("openai", openai_key)
+            save_and_apply("openai", openai_key)
     
     with st.expander("Anthropic API Key"):
         anthropic_key = st.text_input(
@@ -29,7 +37,7 @@ def render_settings():
             help="Get your API key from https://console.anthropic.com/settings/keys"
         )
         if st.button("Save Anthropic Key"):
-            save_api_key("anthropic", anthropic_key)
+            save_and_apply("anthropic", anthropic_key)
     
     with st.expander("Google AI API Key"):
         google_key = st.text_input(
@@ -39,7 +47,7 @@ def render_settings():
             help="Get your API key from Google AI Studio"
         )
         if st.button("Save Google Key"):
-            save_api_key("google", google_key)
+            save_and_apply("google", google_key)
     
     with st.expander("Perplexity API Key"):
         perplexity_key = st.text_input(
@@ -49,4 +57,54 @@ def render_settings():
             help="Get your API key from https://www.perplexity.ai/settings/api"
         )
         if st.button("Save Perplexity Key"):
-            save_api_key("perplexity", perplexity_key) 
\ No newline at end of file
+            save_and_apply("perplexity", perplexity_key)
+    
+    with st.expander("Mistral API Key"):
+        mistral_key = st.text_input(
+            "Mistral API Key",
+            type="password",
+            value=api_keys.get("mistral", ""),
+            help="Get your API key from https://console.mistral.ai/api-keys"
+        )
+        if st.button("Save Mistral Key"):
+            save_and_apply("mistral", mistral_key)
+    
+    with st.expander("Meta Llama API Key"):
+        meta_key = st.text_input(
+            "Meta Llama API Key",
+            type="password",
+            value=api_keys.get("meta", ""),
+            help="API key of the Llama host (Together AI by default, see META_BASE_URL)"
+        )
+        if st.button("Save Meta Llama Key"):
+            save_and_apply("meta", meta_key)
+    
+    # Client reuse across all sessions on this server
+    pool_stats = get_client_pool().stats()
+    st.caption(
+        f"Provider clients: {pool_stats['size']} pooled, "
+        f"{pool_stats['reuse_rate']:.0%} client reuse rate"
+    )
+    
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        cache_stats = response_cache.stats()
+        st.caption(
+            f"Response cache: {cache_stats['hit_rate']:.0%} hit rate "
+            f"({cache_stats['hits']} exact, {cache_stats['semantic_hits']} similar, {cache_stats['misses']} misses)"
+        )
+    
+    # Conversation history this session keeps in memory
+    memory_usage = get_session_memory().usage(st.session_state)
+    st.caption(
+        f"Session memory: {memory_usage['resident_bytes'] / 1024:.0f} KB of "
+        f"{memory_usage['max_bytes'] / 1024 / 1024:.0f} MB in {memory_usage['resident_chats']} open chats, "
+        f"{memory_usage['evicted_chats']} idle chats moved to disk"
+    )
+
+def save_and_apply(provider, key):
+    """Save a key, then rerun the whole app so the chat panel picks it up"""
+    if save_api_key(provider, key):
+        # The success message would be lost in the rerun, so it is shown after it
+        st.session_state.saved_api_key = provider
+        st.rerun()
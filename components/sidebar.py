@@ -1,27 +1,66 @@
 import streamlit as st
+import json
 import time
 import uuid
+from utils.chat_archive import import_chats, prepare_export
+from utils.chat_store import create_chat, delete_chat, get_chat, has_routing_column, list_chats, update_chat
+from utils.jobs import get_job_manager
+from utils.local_storage import get_api_keys
+from utils.model_catalog import describe_model, get_model_catalog
+from utils.search_index import get_search_index
+from utils.provider_registry import list_providers
+from utils.router import parse_policy
+
+# Model picker entry that switches to a free-text model name
+OTHER_MODEL = "Other (enter a name)"
 
 def render_sidebar(supabase, user):
     """Render sidebar with chat management"""
     
-    st.sidebar.title("Chats")
+    # Searching, paging and editing only rerun the chat list fragment
+    with st.sidebar:
+        render_chat_list(supabase, user)
+    
+    selected_chat = st.session_state.get("selected_chat")
+    if selected_chat:
+        return selected_chat["id"], selected_chat["provider"], selected_chat["model"]
+    return None, None, None
+
+@st.fragment
+def render_chat_list(supabase, user):
+    """Render the chat list, search and edit form as an independently rerunning fragment"""
+    
+    st.title("Chats")
     
     # Debug user ID
-    st.sidebar.write(f"User ID: {user.id}")
-    st.sidebar.write(f"User ID type: {type(user.id)}")
+    st.write(f"User ID: {user.id}")
+    st.write(f"User ID type: {type(user.id)}")
     
-    # Fetch user's chats from Supabase
+    # Search and paging for the chat list
+    search = st.text_input("Search chats", key="chat_search", placeholder="Search by title")
+    if st.session_state.get("chat_list_search") != search:
+        st.session_state.chat_list_search = search
+        st.session_state.chat_list_page = 0
+    page = st.session_state.get("chat_list_page", 0)
+    
+    # Fetch one page of the user's chats (cached between reruns)
     try:
-        chats_response = supabase.table("chats").select("*").eq("user_id", user.id).execute()
-        # Make sure we have the correct format
-        chats_data = chats_response.data if hasattr(chats_response, 'data') else []
+        chats_data, has_more = list_chats(supabase, user.id, search=search, page=page)
     except Exception as e:
-        st.sidebar.error(f"Error loading chats: {str(e)}")
-        chats_data = []  # Just store the data directly as a list
+        st.error(f"Error loading chats: {str(e)}")
+        chats_data, has_more = [], False
+    
+    # Keep chat ownership and titles current in the local search index
+    search_index = get_search_index()
+    if search_index is not None and chats_data:
+        search_index.register_chats(user.id, chats_data)
+    
+    # Full-text search over the contents of every chat
+    if search_index is not None:
+        render_message_search(supabase, user, search_index)
     
     # New chat button
-    if st.sidebar.button("+ New Chat"):
+    if st.button("+ New Chat"):
         # Get provider and model for new chat
         new_provider = "openai"  # Default provider
         new_model = "gpt-3.5-turbo"  # Default model
@@ -36,72 +75,140 @@ def render_sidebar(supabase, user):
         }
         
         try:
-            result = supabase.table("chats").insert(new_chat).execute()
-            st.rerun()
+            result = create_chat(supabase, user.id, new_chat)
+            st.session_state.chat_list_page = 0
+            st.rerun(scope="fragment")
         except Exception as e:
-            st.sidebar.error(f"Error creating chat: {str(e)}")
+            st.error(f"Error creating chat: {str(e)}")
     
     # Display existing chats
-    selected_chat_id = None
-    selected_provider = None
-    selected_model = None
-    
     if chats_data:
-        st.sidebar.write("Your Chats:")
+        st.write("Your Chats:")
+        # Chats with a response still generating in the background
+        generating_chat_ids = get_job_manager().active_chat_ids()
         for chat in chats_data:
-            col1, col2 = st.sidebar.columns([4, 1])
+            col1, col2 = st.columns([4, 1])
             with col1:
-                if st.button(chat["title"], key=f"chat_{chat['id']}"):
-                    selected_chat_id = chat["id"]
-                    selected_provider = chat["provider"]
-                    selected_model = chat["model"]
-                    
-                    # Store in session state
+                label = f"⏳ {chat['title']}" if chat["id"] in generating_chat_ids else chat["title"]
+                if st.button(label, key=f"chat_{chat['id']}"):
+                    # Store in session state and rerun the whole app to open it
                     st.session_state.selected_chat = chat
+                    st.rerun()
             
             with col2:
                 if st.button("⚙️", key=f"settings_{chat['id']}"):
                     st.session_state.edit_chat = chat
+    elif search:
+        st.info("No chats match your search.")
     else:
-        st.sidebar.info("No chats yet. Create a new one!")
+        st.info("No chats yet. Create a new one!")
+    
+    # Page navigation
+    if page > 0 or has_more:
+        col1, col2 = st.columns(2)
+        with col1:
+            if page > 0 and st.button("← Newer", key="chat_page_prev"):
+                st.session_state.chat_list_page = page - 1
+                st.rerun(scope="fragment")
+        with col2:
+            if has_more and st.button("Older →", key="chat_page_next"):
+                st.session_state.chat_list_page = page + 1
+                st.rerun(scope="fragment")
+    
+    # Backup and migration of all of the user's chats
+    render_archive_tools(supabase, user, search_index)
     
     # Chat editing modal (could be implemented with a custom component or a separate section)
     if "edit_chat" in st.session_state:
         chat = st.session_state.edit_chat
         
-        st.sidebar.subheader("Edit Chat")
+        st.subheader("Edit Chat")
         
-        new_title = st.sidebar.text_input("Title", value=chat["title"])
+        new_title = st.text_input("Title", value=chat["title"])
         
         # Provider selection
-        provider_options = ["openai", "anthropic", "google", "perplexity", "meta", "mistral"]
-        new_provider = st.sidebar.selectbox(
+        provider_options = list_providers()
+        new_provider = st.selectbox(
             "Provider",
             provider_options,
             index=provider_options.index(chat["provider"]) if chat["provider"] in provider_options else 0
         )
         
-        # Model suggestions (but allow free text input)
-        suggested_models = get_model_options(new_provider)
-        with st.sidebar.expander("View suggested models"):
-            st.write(", ".join(suggested_models))
-        
-        # Text input for any model name
-        new_model = st.sidebar.text_input(
-            "Model Name", 
-            value=chat["model"],
-            help="You can enter any model name supported by the provider"
+        # Type-ahead over the models this user's key can use, served from the catalog cache
+        api_key = get_api_keys().get(new_provider)
+        model_catalog = get_model_catalog()
+        model_ids = [info.id for info in model_catalog.get_models(new_provider, api_key)]
+        current_model = chat["model"] if new_provider == chat["provider"] else None
+        model_options = model_ids + [OTHER_MODEL]
+        if current_model in model_ids:
+            model_index = model_ids.index(current_model)
+        else:
+            model_index = len(model_ids) if current_model else 0
+        picked_model = st.selectbox(
+            "Model",
+            model_options,
+            index=model_index,
+            help="Type to filter the models available to your API key"
         )
         
-        col1, col2 = st.sidebar.columns(2)
+        # Text input for any model name the list doesn't have
+        if picked_model == OTHER_MODEL:
+            new_model = st.text_input(
+                "Model Name",
+                value=current_model or "",
+                help="You can enter any model name supported by the provider"
+            ).strip()
+        else:
+            new_model = picked_model
+        if new_model:
+            st.caption(describe_model(model_catalog.get_model_info(new_provider, new_model, api_key)))
+            # Only a warning: keys can often use models their list doesn't show
+            model_warning = model_catalog.validate(new_provider, new_model, api_key)
+            if model_warning:
+                st.warning(model_warning)
+        
+        # Optional failover / hedging across several provider/model targets
+        current_routing = chat.get("routing")
+        if has_routing_column():
+            new_routing = st.text_area(
+                "Routing policy (JSON, optional)",
+                value=json.dumps(current_routing) if current_routing else "",
+                placeholder='{"mode": "ordered", "hedge": true, "targets": ["openai/gpt-4o", "anthropic/claude-3-5-sonnet-20241022"]}',
+                help="Targets are tried in order (or by weight with mode \"weighted\"); hedge races a second target when the first is slower than its p95"
+            )
+        else:
+            new_routing = ""
+            st.caption("Add a routing column to the chats table to enable routing policies (see the README).")
+        
+        col1, col2 = st.columns(2)
         with col1:
             if st.button("Save"):
+                try:
+                    routing = json.loads(new_routing) if new_routing.strip() else None
+                    parse_policy(routing)
+                except (ValueError, KeyError) as e:
+                    st.error(f"Invalid routing policy: {str(e)}")
+                    st.stop()
+                
+                if not new_model:
+                    st.error("Enter a model name.")
+                    st.stop()
+                
                 # Update chat in Supabase
-                supabase.table("chats").update({
+                changes = {
                     "title": new_title,
                     "provider": new_provider,
-                    "model": new_model
-                }).eq("id", chat["id"]).execute()
+                    "model": new_model,
+                    "routing": routing
+                }
+                update_chat(supabase, user.id, chat["id"], changes)
+                if search_index is not None:
+                    search_index.rename_chat(user.id, chat["id"], new_title)
+                
+                # Keep the open chat in sync with the edited record
+                selected = st.session_state.get("selected_chat")
+                if selected and selected["id"] == chat["id"]:
+                    st.session_state.selected_chat = dict(selected, **changes)
                 
                 del st.session_state.edit_chat
                 st.rerun()
@@ -109,58 +216,83 @@ def render_sidebar(supabase, user):
         with col2:
             if st.button("Cancel"):
                 del st.session_state.edit_chat
-                st.rerun()
+                st.rerun(scope="fragment")
             
-        if st.sidebar.button("Delete Chat", type="primary", use_container_width=True):
-            supabase.table("chats").delete().eq("id", chat["id"]).execute()
+        if st.button("Delete Chat", type="primary", use_container_width=True):
+            # Stop a reply still being generated, so it isn't saved to the deleted chat
+            get_job_manager().cancel(chat["id"], discard=True)
+            delete_chat(supabase, user.id, chat["id"])
+            if search_index is not None:
+                search_index.remove_chat(chat["id"])
             del st.session_state.edit_chat
             if "selected_chat" in st.session_state and st.session_state.selected_chat["id"] == chat["id"]:
                 del st.session_state.selected_chat
             st.rerun()
+
+def render_message_search(supabase, user, search_index):
+    """Render a search box over all of the user's messages with ranked snippets"""
+    query = st.text_input("Search messages", key="message_search", placeholder="Search inside your chats")
+    if not query.strip():
+        return
+    
+    # Chats written before the index existed are indexed in the background on first use
+    search_index.backfill(supabase, user.id)
+    
+    results = search_index.search(user.id, query)
+    if not results:
+        st.info("No messages match your search.")
+        return
     
-    return selected_chat_id, selected_provider, selected_model
+    for index, result in enumerate(results):
+        label = result["title"] or "Untitled chat"
+        if st.button(label, key=f"search_result_{index}_{result['chat_id']}"):
+            chat = get_chat(supabase, result["chat_id"])
+            if chat is not None:
+                st.session_state.selected_chat = chat
+                st.rerun()
+        st.caption(("You: " if result["role"] == "user" else "") + result["snippet"])
 
-def get_model_options(provider):
-    """Get suggested models for a provider (informational only)"""
-    if provider == "openai":
-        return [
-            # Latest models
-            "gpt-4o", "gpt-4o-mini", "o1", "o1-mini", "o1-preview", "o3-mini",
-            # Core models
-            "gpt-4-turbo", "gpt-4", "gpt-3.5-turbo",
-            # Dated versions
-            "gpt-4o-2024-05-13", "gpt-4-turbo-2024-04-09", "gpt-3.5-turbo-0125"
-        ]
-    elif provider == "anthropic":
-        return [
-            # Latest Claude 3.5 models
-            "claude-3-5-sonnet-20241022", "claude-3-5-sonnet-20240620", 
-            "claude-3-5-haiku-20241022",
-            # Claude 3 models
-            "claude-3-opus-20240229", "claude-3-sonnet-20240229", 
-            "claude-3-haiku-20240307",
-            # Legacy models
-            "claude-2.1", "claude-2", "claude-instant-1.2"
-        ]
-    elif provider == "google":
-        return [
-            "gemini-1.5-pro", "gemini-1.5-flash", "gemini-pro", "gemini-ultra"
-        ]
-    elif provider == "perplexity":
-        return [
-            "sonar", "sonar-pro", "sonar-reasoning", "sonar-reasoning-pro"
-        ]
-    elif provider == "meta" or provider == "llama":
-        return [
-            "meta-llama/Llama-3.3-70B-Instruct-Turbo", 
-            "meta-llama/Llama-3.2-90B-Vision-Instruct-Turbo",
-            "meta-llama/Meta-Llama-3.1-405B-Instruct-Turbo", 
-            "meta-llama/Meta-Llama-3-70B-Instruct-Turbo"
-        ]
-    elif provider == "mistral":
-        return [
-            "mistralai/Mistral-Small-24B-Instruct-2501",
-            "mistralai/Mistral-7B-Instruct-v0.3",
-            "mistral", "mistral-medium", "mistral-large"
-        ]
-    return [] 
\ No newline at end of file
+def render_archive_tools(supabase, user, search_index):
+    """Render export to and import from a compressed archive of the user's chats"""
+    with st.expander("Export / import chats"):
+        if st.button("Prepare export", key="prepare_export"):
+            export = None
+            with st.spinner("Exporting chats..."):
+                try:
+                    export = prepare_export(supabase, user.id)
+                except Exception as e:
+                    st.error(f"Export failed: {str(e)}")
+            
+            # Only offered on this run: the button loads the whole archive into
+            # memory, so it isn't rebuilt on every later rerun of the chat list
+            if export is not None:
+                path, chat_count, message_count = export
+                with open(path, "rb") as archive:
+                    st.download_button(
+                        f"Download {chat_count} chats ({message_count} messages)",
+                        archive,
+                        file_name=f"chats-{time.strftime('%Y-%m-%d')}.jsonl.gz",
+                        mime="application/gzip",
+                        key="download_export"
+                    )
+        
+        uploaded = st.file_uploader("Import an archive", type=["gz"], key="import_archive")
+        if uploaded is not None and st.button("Import", key="import_chats"):
+            with st.spinner("Importing chats..."):
+                try:
+                    result = import_chats(
+                        supabase,
+                        user.id,
+                        uploaded,
+                        on_chat=(lambda chat: search_index.register_chats(user.id, [chat])) if search_index else None,
+                        on_messages=search_index.index_messages if search_index else None
+                    )
+                except Exception as e:
+                    st.error(f"Import failed: {str(e)}")
+                    return
+            message = f"Imported {result['chats']} chats and {result['messages']} messages."
+            if result["complete"]:
+                st.success(message)
+            else:
+                st.warning(message + " The archive was incomplete, so some chats may be missing.")
+            st.session_state.chat_list_page = 0
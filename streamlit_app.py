@@ -3,32 +3,59 @@ import streamlit as st
 # This must be the first Streamlit command
 st.set_page_config(page_title="Multi-Provider Chatbot", layout="wide")
 
-from openai import OpenAI
-from anthropic import Anthropic
-import google.generativeai as genai
-
 # Components
 from components.auth import render_auth
 from components.sidebar import render_sidebar
 from components.chat_interface import render_chat
 from components.settings import render_settings
+from components.admin import is_admin, render_admin
 
 # Utilities
-from utils.supabase_client import init_supabase
+from utils.supabase_client import get_session_supabase
 from utils.local_storage import get_api_keys, save_api_key
-from utils.session_state import initialize_session_state
+from utils.session_state import initialize_session_state, restore_user_state, save_user_state
+from utils.state_backend import get_state_backend
+from utils.chat_store import configure_chat_list_cache
+from utils.metrics import configure_metrics_sinks
+from utils.provider_registry import register_openai_compatible
+from utils.rate_limit import load_rate_limits
+from utils.message_store import get_message_writer
+from utils.search_index import get_search_index
 
 # Initialize session state
 initialize_session_state()
 
-# Initialize Supabase client
-supabase = init_supabase()
+# This session's own Supabase client, which queries as the signed-in user
+supabase = get_session_supabase()
+
+# Register metrics sinks (JSONL file, Prometheus endpoint) once per process
+configure_metrics_sinks()
+
+# Per-provider requests/min and tokens/min limits shared by every session
+load_rate_limits()
+
+# With a shared [state] backend, other worker processes see this one's chat list changes
+configure_chat_list_cache(get_state_backend())
+
+# Index messages for search as the background writer saves them
+search_index = get_search_index()
+if search_index is not None:
+    get_message_writer().add_listener(search_index.index_messages)
+
+# Self-hosted OpenAI-compatible endpoints, e.g. [custom_providers.ollama] base_url = "http://localhost:11434/v1"
+for name, provider_config in st.secrets.get("custom_providers", {}).items():
+    register_openai_compatible(
+        name,
+        provider_config["base_url"],
+        requires_api_key=provider_config.get("requires_api_key", False),
+        context_size=provider_config.get("context_size", 32768)
+    )
 
 # App title
 st.title("💬 Multi-Provider Chatbot")
 st.write(
     "Chat with various AI models from OpenAI, Anthropic, Google, and Perplexity. "
-    "Your API keys are stored locally on your device."
+    "Your API keys are encrypted at rest and only available to your account."
 )
 
 # Authentication section
@@ -36,6 +63,9 @@ user = render_auth(supabase)
 
 # If user is authenticated, show the main app
 if user:
+    # Pick up the chat this user had open, even if it was on another worker process
+    restore_user_state(user)
+    
     # Sidebar for chat management
     selected_chat, selected_provider, selected_model = render_sidebar(supabase, user)
     
@@ -44,12 +74,14 @@ if user:
     
     with col1:
         # Render chat interface
-        if "selected_chat" in st.session_state:
+        if st.session_state.get("selected_chat"):
             selected_chat = st.session_state.selected_chat
             render_chat(
                 chat_id=selected_chat["id"],
                 provider=selected_chat["provider"],
-                model=selected_chat["model"]
+                model=selected_chat["model"],
+                supabase=supabase,
+                routing=selected_chat.get("routing")
             )
         else:
             st.info("Select a chat from the sidebar or create a new one.")
@@ -57,5 +89,12 @@ if user:
     with col2:
         # API settings
         render_settings()
+    
+    # Provider latency metrics for admins
+    if is_admin(user):
+        with st.expander("Admin: provider metrics"):
+            render_admin()
+    
+    save_user_state(user)
 else:
     st.info("Please log in or sign up to use the chatbot.")
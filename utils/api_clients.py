@@ -1,9 +1,13 @@
-import openai
-from anthropic import Anthropic
-import google.generativeai as genai
-import requests
+from itertools import chain
+from utils.context_window import (
+    RESPONSE_TOKEN_RESERVE, build_summary_request, count_message_tokens, fit_messages, get_prompt_budget
+)
+from utils.metrics import CallTracker, CompletionResult
+from utils.model_catalog import get_context_length
+from utils.provider_registry import get_adapter
+from utils.rate_limit import call_with_retries, current_session_id, get_rate_limiter
 
-def get_chat_completion(provider, model, messages, api_key):
+def get_chat_completion(provider, model, messages, api_key, cache=None):
     """
     Get chat completion from various providers, supporting any model name
     
@@ -12,111 +16,182 @@ def get_chat_completion(provider, model, messages, api_key):
         model (str): Any model name supported by the provider
         messages (list): Chat history in the format [{"role": "user", "content": "..."}, ...]
         api_key (str): API key for the selected provider
+        cache (ResponseCache): Optional cache checked before calling the provider
         
     Returns:
         str: AI response
     """
     
-    if provider == "openai":
-        return get_openai_completion(model, messages, api_key)
-    elif provider == "anthropic":
-        return get_anthropic_completion(model, messages, api_key)
-    elif provider == "google":
-        return get_google_completion(model, messages, api_key)
-    elif provider == "perplexity":
-        return get_perplexity_completion(model, messages, api_key)
-    elif provider == "meta" or provider == "llama":
-        return get_meta_completion(model, messages, api_key)
-    elif provider == "mistral":
-        return get_mistral_completion(model, messages, api_key)
-    else:
-        # Allow for custom providers by defaulting to OpenAI-compatible API
-        return get_generic_completion(provider, model, messages, api_key)
+    return get_chat_completion_result(provider, model, messages, api_key, cache=cache).text
 
-def get_openai_completion(model, messages, api_key):
-    """Get completion from OpenAI"""
-    client = openai.OpenAI(api_key=api_key)
+def get_chat_completion_result(provider, model, messages, api_key, cache=None, on_wait=None):
+    """
+    Get chat completion like get_chat_completion, as a CompletionResult with call metrics
     
-    response = client.chat.completions.create(
-        model=model,
-        messages=messages,
-    )
+    The call waits its turn under the key's rate limits and is retried on
+    rate limits and server errors. on_wait is called with (queue position,
+    seconds) while waiting; position 0 means waiting to retry.
+    """
     
-    return response.choices[0].message.content
-
-def get_anthropic_completion(model, messages, api_key):
-    """Get completion from Anthropic"""
-    client = Anthropic(api_key=api_key)
-    
-    # Convert messages to Anthropic format
-    system_message = ""
-    human_messages = []
-    
-    for msg in messages:
-        if msg["role"] == "system":
-            system_message = msg["content"]
-        elif msg["role"] == "user":
-            human_messages.append(msg["content"])
-        # Assistant messages are included implicitly in the response
-    
-    # For demonstration, we'll just use the last user message
-    if not human_messages:
-        raise ValueError("No user messages found")
-    
-    response = client.messages.create(
-        model=model,
-        system=system_message,
-        messages=[{"role": "user", "content": human_messages[-1]}],
-        max_tokens=1024
-    )
-    
-    return response.content[0].text
+    messages = as_message_dicts(messages)
+    
+    if cache is not None:
+        cached = cache.get(provider, model, messages)
+        if cached is not None:
+            tracker = CallTracker(provider, model, messages, cached=True)
+            return CompletionResult(cached, tracker.finish(cached))
+    
+    request_messages = prepare_messages(provider, model, messages, api_key, cache=cache)
+    limiter, estimate, reacquire = acquire_rate_limit(provider, api_key, request_messages, on_wait)
+    tracker = CallTracker(provider, model, request_messages)
+    try:
+        response = call_with_retries(
+            lambda: dispatch_completion(provider, model, request_messages, api_key),
+            limiter=limiter,
+            on_retry=retry_reporter(tracker, on_wait),
+            acquire=reacquire
+        )
+    except Exception as e:
+        tracker.finish(error=e)
+        raise
+    metrics = tracker.finish(response)
+    limiter.adjust(metrics.prompt_tokens + (metrics.completion_tokens or 0) - charged_tokens(estimate, metrics))
+    
+    if cache is not None:
+        cache.set(provider, model, messages, response)
+    return CompletionResult(response, metrics)
 
-def get_google_completion(model, messages, api_key):
-    """Get completion from Google Gemini"""
-    genai.configure(api_key=api_key)
-    
-    # Convert messages to Gemini format
-    gemini_messages = []
-    for msg in messages:
-        if msg["role"] == "user":
-            gemini_messages.append({"role": "user", "parts": [{"text": msg["content"]}]})
-        elif msg["role"] == "assistant":
-            gemini_messages.append({"role": "model", "parts": [{"text": msg["content"]}]})
-    
-    model = genai.GenerativeModel(model)
-    response = model.generate_content(gemini_messages)
-    
-    return response.text
-
-def get_perplexity_completion(model, messages, api_key):
-    """Get completion from Perplexity"""
-    url = "https://api.perplexity.ai/chat/completions"
-    
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
+def acquire_rate_limit(provider, api_key, messages, on_wait=None, cancelled=None):
+    """
+    Wait for the key's rate limiter to admit a request
     
-    # Convert messages format if needed
-    data = {
-        "model": model,
-        "messages": messages
-    }
+    Returns:
+        tuple: (limiter, tokens charged, reacquire) where reacquire() waits
+            for admission again before a retry, charging the same tokens
+    """
+    limiter = get_rate_limiter(provider, api_key)
+    estimate = count_message_tokens(messages) + RESPONSE_TOKEN_RESERVE
+    session_id = current_session_id()
     
-    response = requests.post(url, json=data, headers=headers)
-    response.raise_for_status()
+    def reacquire():
+        limiter.acquire(estimate, session_id=session_id, on_wait=on_wait, cancelled=cancelled)
     
-    return response.json()["choices"][0]["message"]["content"]
+    reacquire()
+    return limiter, estimate, reacquire
+
+def charged_tokens(estimate, metrics):
+    """Tokens charged to the limiter for a call: the estimate once per attempt"""
+    return estimate * (1 + metrics.retries)
+
+def retry_reporter(tracker, on_wait=None):
+    """Build a retry callback that counts retries and reports the backoff wait"""
+    def on_retry(attempt, delay, error):
+        tracker.retried()
+        if on_wait:
+            on_wait(0, delay)
+    return on_retry
+
+def as_message_dicts(messages):
+    """Copy a history into plain {"role", "content"} dicts, as provider SDKs expect"""
+    return [{"role": msg["role"], "content": msg["content"]} for msg in messages]
+
+def dispatch_completion(provider, model, messages, api_key):
+    """Send messages unchanged to the provider's adapter"""
+    return get_adapter(provider).complete(model, messages, api_key)
 
-def get_meta_completion(model, messages, api_key):
-    # Implementation for meta completion
-    pass
+def prepare_messages(provider, model, messages, api_key, cache=None):
+    """Fit the chat history into the model's token budget, summarizing older turns"""
+    
+    def summarize(previous_summary, dropped):
+        # A regular call, so it is rate limited, retried, measured and cached like any other
+        request = build_summary_request(previous_summary, dropped)
+        return get_chat_completion_result(provider, model, request, api_key, cache=cache).text
+    
+    adapter = get_adapter(provider)
+    budget = get_prompt_budget(model, context_limit=get_context_length(provider, model, api_key))
+    messages = fit_messages(model, messages, summarize=summarize, budget=budget)
+    if not adapter.capabilities.system_prompt:
+        messages = merge_system_messages(messages)
+    return messages
 
-def get_mistral_completion(model, messages, api_key):
-    # Implementation for mistral completion
-    pass
+def merge_system_messages(messages):
+    """Fold system messages into the first user message for providers without a system role"""
+    system_text = "\n\n".join(msg["content"] for msg in messages if msg["role"] == "system")
+    merged = [msg for msg in messages if msg["role"] != "system"]
+    if system_text and merged and merged[0]["role"] == "user":
+        merged[0] = {"role": "user", "content": f"{system_text}\n\n{merged[0]['content']}"}
+    elif system_text:
+        merged.insert(0, {"role": "user", "content": system_text})
+    return merged
+
+def stream_chat_completion(provider, model, messages, api_key, cache=None, on_complete=None, on_wait=None, cancelled=None):
+    """
+    Stream chat completion from various providers as text deltas
+    
+    Args:
+        provider (str): AI provider (openai, anthropic, google, perplexity, etc.)
+        model (str): Any model name supported by the provider
+        messages (list): Chat history in the format [{"role": "user", "content": "..."}, ...]
+        api_key (str): API key for the selected provider
+        cache (ResponseCache): Optional cache checked before calling the provider
+        on_complete (callable): Called with a CompletionResult once the stream ends
+        on_wait (callable): Called with (queue position, seconds) while waiting on rate limits or a retry
+        cancelled (threading.Event): Once set, waits for the rate limiter or a retry
+            give up with concurrent.futures.CancelledError
+        
+    Yields:
+        str: Pieces of the AI response as they arrive
+    """
+    
+    # Copy the history since the caller appends to it after streaming
+    messages = as_message_dicts(messages)
+    
+    if cache is not None:
+        cached = cache.get(provider, model, messages)
+        if cached is not None:
+            tracker = CallTracker(provider, model, messages, cached=True, streamed=True)
+            tracker.first_token()
+            yield cached
+            metrics = tracker.finish(cached)
+            if on_complete:
+                on_complete(CompletionResult(cached, metrics))
+            return
+    
+    request_messages = prepare_messages(provider, model, messages, api_key, cache=cache)
+    limiter, estimate, reacquire = acquire_rate_limit(provider, api_key, request_messages, on_wait, cancelled)
+    tracker = CallTracker(provider, model, request_messages, streamed=True)
+    
+    def open_stream():
+        stream = stream_provider_completion(provider, model, request_messages, api_key, on_connect=tracker.connected)
+        return stream, next(stream, None)
+    
+    chunks = []
+    try:
+        # Only the request up to the first delta is retried; after that text has been shown
+        stream, first = call_with_retries(
+            open_stream,
+            limiter=limiter,
+            on_retry=retry_reporter(tracker, on_wait),
+            acquire=reacquire,
+            cancelled=cancelled
+        )
+        for chunk in chain([first] if first is not None else [], stream):
+            tracker.first_token()
+            chunks.append(chunk)
+            yield chunk
+    except Exception as e:
+        tracker.finish("".join(chunks), error=e)
+        raise
+    
+    response = "".join(chunks)
+    metrics = tracker.finish(response)
+    limiter.adjust(metrics.prompt_tokens + (metrics.completion_tokens or 0) - charged_tokens(estimate, metrics))
+    
+    if cache is not None:
+        cache.set(provider, model, messages, response)
+    if on_complete:
+        on_complete(CompletionResult(response, metrics))
 
-def get_generic_completion(provider, model, messages, api_key):
-    # Implementation for generic completion
-    pass 
\ No newline at end of file
+def stream_provider_completion(provider, model, messages, api_key, on_connect=None):
+    """Stream messages unchanged from the provider's adapter"""
+    yield from get_adapter(provider).stream(model, messages, api_key, on_connect=on_connect)
@@ -0,0 +1,106 @@
+import asyncio
+import time
+from utils.api_clients import as_message_dicts, prepare_messages
+from utils.context_window import RESPONSE_TOKEN_RESERVE, count_message_tokens
+from utils.metrics import CallTracker
+from utils.provider_registry import get_adapter, get_capabilities
+from utils.rate_limit import acall_with_retries, current_session_id, get_rate_limiter
+
+async def aget_chat_completion(provider, model, messages, api_key, session_id=None):
+    """
+    Get chat completion from various providers without blocking the event loop
+
+    Args:
+        provider (str): AI provider (openai, anthropic, google, perplexity, etc.)
+        model (str): Any model name supported by the provider
+        messages (list): Chat history in the format [{"role": "user", "content": "..."}, ...]
+        api_key (str): API key for the selected provider
+        session_id (str): Streamlit session the call is queued under for rate limiting
+
+    Returns:
+        str: AI response
+    """
+
+    # Fitting may call the provider to summarize older turns, so keep it off the loop
+    messages = await asyncio.to_thread(prepare_messages, provider, model, as_message_dicts(messages), api_key)
+
+    # Waiting for the key's rate limiter blocks, so it runs in a thread too
+    limiter = get_rate_limiter(provider, api_key)
+    estimate = count_message_tokens(messages) + RESPONSE_TOKEN_RESERVE
+
+    def acquire():
+        return asyncio.to_thread(limiter.acquire, estimate, session_id)
+
+    await acquire()
+
+    adapter = get_adapter(provider)
+    return await acall_with_retries(
+        lambda: adapter.acomplete(model, messages, api_key), limiter=limiter, acquire=acquire
+    )
+
+async def compare_completions(targets, messages, api_keys, timeout=60, on_result=None):
+    """
+    Send the same messages to several provider/model pairs concurrently
+
+    Args:
+        targets (list): (provider, model) pairs
+        messages (list): Chat history in the format [{"role": "user", "content": "..."}, ...]
+        api_keys (dict): API keys by provider
+        timeout (float): Seconds before a single call is cancelled
+        on_result (callable): Called with (index, result) as each call finishes
+
+    Returns:
+        list: One result dict per target with provider, model, content, error and latency
+    """
+
+    session_id = current_session_id()
+
+    async def run(index, provider, model):
+        start = time.perf_counter()
+        content, error = None, None
+
+        api_key = api_keys.get(provider)
+        if not api_key and get_capabilities(provider).requires_api_key:
+            error = f"No {provider} API key configured"
+        else:
+            tracker = CallTracker(provider, model, messages)
+            try:
+                content = await asyncio.wait_for(
+                    aget_chat_completion(provider, model, messages, api_key, session_id),
+                    timeout
+                )
+                tracker.finish(content)
+            except asyncio.TimeoutError as e:
+                error = f"Timed out after {timeout}s"
+                tracker.finish(error=e)
+            except Exception as e:
+                error = str(e)
+                tracker.finish(error=e)
+
+        return index, {
+            "provider": provider,
+            "model": model,
+            "content": content,
+            "error": error,
+            "latency": time.perf_counter() - start,
+        }
+
+    tasks = [asyncio.create_task(run(i, provider, model)) for i, (provider, model) in enumerate(targets)]
+    results = [None] * len(tasks)
+
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            index, result = await next_result
+            results[index] = result
+            if on_result:
+                on_result(index, result)
+    finally:
+        # Cancel anything still in flight if the caller bails out early
+        for task in tasks:
+            task.cancel()
+
+    return results
+
+def run_compare(targets, messages, api_keys, timeout=60, on_result=None):
+    """Run compare_completions from synchronous code such as a Streamlit script"""
+    return asyncio.run(compare_completions(targets, messages, api_keys, timeout, on_result))
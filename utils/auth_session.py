@@ -0,0 +1,320 @@
+import datetime
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+from utils.supabase_client import authorize_client, create_supabase_client, reset_session_supabase
+
+ACCESS_COOKIE = "chatbot_access_token"
+REFRESH_COOKIE = "chatbot_refresh_token"
+
+# Days a browser keeps the refresh token between visits
+REFRESH_COOKIE_DAYS = 30
+
+# Seconds before access token expiry at which a background refresh starts
+REFRESH_MARGIN = 300
+
+# Seconds to wait for a refresh when the access token has already expired
+REFRESH_TIMEOUT = 10
+
+# Seconds of clock skew tolerated when checking token expiry
+CLOCK_LEEWAY = 30
+
+# Seconds a fetched JWKS is reused before being fetched again
+JWKS_TTL = 3600
+
+# Seconds a finished refresh is kept, so other tabs holding the same (now rotated) refresh token share it
+REFRESH_RESULT_TTL = 120
+
+# Signing algorithms Supabase Auth uses; anything else in a token header is rejected
+ALLOWED_ALGORITHMS = ("HS256", "RS256", "ES256")
+
+class SessionUser:
+    """
+    The signed-in user, read from verified access token claims
+
+    Has the attributes the app uses from Supabase's User (id, email and the
+    metadata dicts), so restored sessions need no get_user() call.
+    """
+
+    def __init__(self, claims):
+        self.id = claims["sub"]
+        self.email = claims.get("email")
+        self.role = claims.get("role")
+        self.app_metadata = claims.get("app_metadata", {})
+        self.user_metadata = claims.get("user_metadata", {})
+        self.claims = claims
+
+    def __repr__(self):
+        return f"SessionUser({self.id!r}, {self.email!r})"
+
+class TokenVerifier:
+    """
+    Verifies Supabase access tokens locally
+
+    HS256 tokens are checked against the project's JWT secret; RS256/ES256
+    tokens against the project's JWKS, fetched once and cached for JWKS_TTL.
+    """
+
+    def __init__(self, supabase_url, jwt_secret=None):
+        self.jwks_url = supabase_url.rstrip("/") + "/auth/v1/.well-known/jwks.json"
+        self.jwt_secret = jwt_secret
+        self._jwks_client = None
+        self._lock = threading.Lock()
+
+    def verify(self, token):
+        """Get a token's claims, raising jwt.InvalidTokenError if it is invalid or expired"""
+        import jwt
+
+        algorithm = jwt.get_unverified_header(token).get("alg")
+        if algorithm not in ALLOWED_ALGORITHMS:
+            raise jwt.InvalidTokenError(f"Unexpected token algorithm: {algorithm}")
+        if algorithm == "HS256":
+            if not self.jwt_secret:
+                raise jwt.InvalidTokenError("No [supabase] jwt_secret configured to verify HS256 tokens")
+            key = self.jwt_secret
+        else:
+            key = self._get_jwks_client().get_signing_key_from_jwt(token).key
+        return jwt.decode(token, key, algorithms=[algorithm], audience="authenticated", leeway=CLOCK_LEEWAY)
+
+    def _get_jwks_client(self):
+        with self._lock:
+            if self._jwks_client is None:
+                from jwt import PyJWKClient
+                self._jwks_client = PyJWKClient(self.jwks_url, cache_keys=True, lifespan=JWKS_TTL)
+            return self._jwks_client
+
+class TokenRefresher:
+    """
+    Runs Supabase token refreshes on worker threads
+
+    Refresh tokens are single use, so concurrent refreshes of the same token
+    (a rerun racing a background refresh, or two tabs) share one request and
+    its result. A failed refresh is not shared, so the next caller retries.
+    """
+
+    def __init__(self, supabase, workers=4):
+        self.supabase = supabase
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="auth-refresh")
+        self._refreshes = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, refresh_token):
+        """Get a future for the auth response refreshing refresh_token"""
+        key = hashlib.sha256(refresh_token.encode("utf-8")).hexdigest()
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            entry = self._refreshes.get(key)
+            if entry is None or (entry[0].done() and entry[0].exception() is not None):
+                entry = (self._executor.submit(self._refresh, refresh_token), now)
+                self._refreshes[key] = entry
+            return entry[0]
+
+    def _refresh(self, refresh_token):
+        return self.supabase.auth.refresh_session(refresh_token)
+
+    def _prune(self, now):
+        for key, (future, started) in list(self._refreshes.items()):
+            if future.done() and now - started > REFRESH_RESULT_TTL:
+                del self._refreshes[key]
+
+def is_refresh_rejected(error):
+    """
+    Whether a refresh failed because Supabase Auth rejected the refresh token
+
+    True for an invalid, expired, reused or revoked token (a 4xx auth API
+    error); False for timeouts, dropped connections, rate limits and server
+    errors, which are worth retrying with the same token.
+    """
+    status = getattr(error, "status", None)
+    return isinstance(status, int) and 400 <= status < 500 and status not in (408, 429)
+
+def session_from_response(response):
+    """Get the tokens to keep from a Supabase auth response"""
+    return {
+        "access_token": response.session.access_token,
+        "refresh_token": response.session.refresh_token,
+        "expires_at": response.session.expires_at,
+    }
+
+@st.cache_resource
+def get_token_verifier():
+    """
+    Get the process-wide access token verifier
+
+    Projects still signing tokens with the legacy shared secret need it set
+    as [supabase] jwt_secret; projects with signing keys need nothing extra.
+    """
+    config = st.secrets["supabase"]
+    return TokenVerifier(config["url"], jwt_secret=config.get("jwt_secret"))
+
+@st.cache_resource
+def get_token_refresher():
+    """
+    Get the process-wide token refresher
+
+    It has a client of its own, since a refresh signs the client it runs on
+    in as the refreshed user.
+    """
+    return TokenRefresher(create_supabase_client())
+
+def start_session(supabase, response):
+    """
+    Keep a sign-in or refresh response in this session and remember it in the browser
+
+    supabase is the session's own client, which then queries as this user.
+    """
+    st.session_state.user = response.user
+    st.session_state.signed_out = False
+    st.session_state.auth_session = session_from_response(response)
+    authorize_client(supabase, st.session_state.auth_session["access_token"])
+    queue_session_cookies(st.session_state.auth_session)
+
+def end_session():
+    """Sign this browser out"""
+    st.session_state.user = None
+    st.session_state.pop("auth_session", None)
+    reset_session_supabase()
+    # The cookies this session connected with are still in st.context; don't restore from them
+    st.session_state.signed_out = True
+    st.session_state.pending_auth_cookies = {ACCESS_COOKIE: None, REFRESH_COOKIE: None}
+
+def restore_session(supabase):
+    """
+    Sign the user in from the browser's auth cookies
+
+    A still-valid access token is verified locally with no network call;
+    otherwise the refresh token is exchanged for a new session. Either way
+    the token is applied to supabase, the session's own client.
+
+    Returns:
+        The user, or None if the cookies hold no usable session
+    """
+    if st.session_state.get("signed_out"):
+        return None
+
+    cookies = read_cookies()
+    access_token = cookies.get(ACCESS_COOKIE)
+    refresh_token = cookies.get(REFRESH_COOKIE)
+
+    if access_token:
+        try:
+            claims = get_token_verifier().verify(access_token)
+        except Exception:
+            claims = None
+        if claims is not None:
+            authorize_client(supabase, access_token)
+            st.session_state.user = SessionUser(claims)
+            st.session_state.auth_session = {
+                "access_token": access_token,
+                "refresh_token": refresh_token,
+                "expires_at": claims["exp"],
+            }
+            return st.session_state.user
+
+    if refresh_token:
+        try:
+            start_session(supabase, get_token_refresher().refresh(refresh_token).result(timeout=REFRESH_TIMEOUT))
+            return st.session_state.user
+        except Exception as e:
+            if is_refresh_rejected(e):
+                # Revoked or expired refresh token: forget it and show the login form
+                end_session()
+            else:
+                # Supabase Auth is slow or unreachable: keep the cookies and try again on the next run
+                st.session_state.auth_unavailable = True
+    return None
+
+def maintain_session(supabase):
+    """
+    Keep the signed-in session's access token fresh
+
+    Starts a background refresh REFRESH_MARGIN seconds before expiry and
+    picks up its result on a later rerun; only waits for it once the token
+    has actually expired. Returns False if the session could not be renewed:
+    the user is signed out if the refresh token was rejected, and kept (with
+    auth_unavailable set) if Supabase Auth could not be reached, so the
+    refresh is retried on the next run.
+    """
+    auth_session = st.session_state.get("auth_session")
+    if not auth_session:
+        return True
+
+    remaining = auth_session["expires_at"] - time.time()
+    if remaining > REFRESH_MARGIN:
+        return True
+
+    if not auth_session.get("refresh_token"):
+        # Nothing to renew with, so the session ends with its access token
+        if remaining > 0:
+            return True
+        end_session()
+        return False
+
+    future = get_token_refresher().refresh(auth_session["refresh_token"])
+    if not future.done() and remaining > 0:
+        return True
+    try:
+        start_session(supabase, future.result(timeout=REFRESH_TIMEOUT))
+        return True
+    except Exception as e:
+        if is_refresh_rejected(e):
+            end_session()
+            return False
+        if remaining > 0:
+            # The current token still works; the refresh is retried on a later run
+            return True
+        st.session_state.auth_unavailable = True
+        return False
+
+def read_cookies():
+    """Get the cookies the browser sent when this session connected"""
+    try:
+        return dict(st.context.cookies)
+    except Exception:
+        return {}
+
+def queue_session_cookies(session):
+    """
+    Schedule the auth cookies to be written on the next run
+
+    Cookies are written by a browser component, which has no chance to run
+    if the script reruns in the same pass, so writes wait for
+    write_pending_cookies() at the start of the next run.
+    """
+    st.session_state.pending_auth_cookies = {
+        ACCESS_COOKIE: (session["access_token"], datetime.datetime.fromtimestamp(session["expires_at"])),
+        REFRESH_COOKIE: (
+            session["refresh_token"],
+            datetime.datetime.now() + datetime.timedelta(days=REFRESH_COOKIE_DAYS)
+        ),
+    }
+
+def write_pending_cookies():
+    """Write or delete queued auth cookies in the browser"""
+    pending = st.session_state.pop("pending_auth_cookies", None)
+    if not pending:
+        return
+
+    # Imported here since the component is only needed on sign-in, sign-out and refresh
+    import extra_streamlit_components as stx
+
+    config = st.secrets.get("auth", None) or {}
+    cookie_manager = stx.CookieManager(key="auth_cookie_manager")
+    for name, value in pending.items():
+        if value is None:
+            cookie_manager.delete(name, key=f"delete_{name}")
+        else:
+            token, expires_at = value
+            # Set from JavaScript, so the cookie cannot be HttpOnly; Secure and SameSite still apply
+            cookie_manager.set(
+                name,
+                token,
+                expires_at=expires_at,
+                key=f"set_{name}",
+                path="/",
+                secure=config.get("secure_cookies", True),
+                same_site="strict"
+            )
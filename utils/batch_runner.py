@@ -0,0 +1,289 @@
+"""
+Headless bulk completion runner for evaluations and backfills
+
+Reads one request per JSONL line:
+    {"id": "q1", "provider": "openai", "model": "gpt-4o-mini", "messages": [...]}
+    {"id": "q2", "prompt": "Summarize ..."}          (uses --provider / --model)
+
+and appends one result per line to the output file:
+    {"id": "q1", "provider": "openai", "model": "gpt-4o-mini", "content": "...", "error": null}
+
+Running again with the same output file resumes the job: ids already in the
+output are skipped, and provider batches that were already submitted are
+polled instead of being submitted again.
+
+    python -m utils.batch_runner prompts.jsonl results.jsonl --provider openai --model gpt-4o-mini
+    python -m utils.batch_runner prompts.jsonl results.jsonl --mode batch --poll-interval 60
+
+--mode direct sends requests through a bounded worker pool, with the app's
+rate limiting and retries. --mode batch submits OpenAI and Anthropic requests
+to their discounted batch APIs and runs other providers directly. API keys
+are read from <PROVIDER>_API_KEY environment variables.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from utils.api_clients import as_message_dicts, get_chat_completion_result, prepare_messages
+from utils.provider_registry import get_adapter, get_capabilities
+from utils.rate_limit import configure_rate_limits
+
+# Requests per submitted batch (OpenAI allows 50,000 per batch, Anthropic 100,000)
+BATCH_CHUNK_SIZE = 10000
+
+# Lines written between fsyncs of the output file
+FSYNC_EVERY = 100
+
+def get_api_key(provider):
+    """Get a provider's key from the environment, e.g. OPENAI_API_KEY"""
+    return os.environ.get(f"{provider.upper()}_API_KEY")
+
+def read_requests(path, default_provider=None, default_model=None):
+    """Yield normalized requests from a JSONL file; lines without an id get one from their line number"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            messages = item.get("messages") or [{"role": "user", "content": item["prompt"]}]
+            provider = item.get("provider") or default_provider
+            model = item.get("model") or default_model
+            if not provider or not model:
+                raise ValueError(f"Line {line_number}: no provider/model and no --provider/--model default")
+            yield {
+                "id": str(item.get("id", f"line-{line_number}")),
+                "custom_id": f"r{line_number}",
+                "provider": provider,
+                "model": model,
+                "messages": messages,
+            }
+
+def load_completed(output_path, retry_errors=False):
+    """Get the ids already in the output file (only successful ones with retry_errors)"""
+    completed = set()
+    if not Path(output_path).exists():
+        return completed
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                # A line cut off by a crash is rerun
+                continue
+            if not (retry_errors and item.get("error")):
+                completed.add(item["id"])
+    return completed
+
+class ResultWriter:
+    """Appends results to the output JSONL from any thread, fsyncing periodically"""
+
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self.written = 0
+        self.errors = 0
+        self.started = time.monotonic()
+
+    def write(self, request, content=None, error=None):
+        line = json.dumps({
+            "id": request["id"],
+            "provider": request["provider"],
+            "model": request["model"],
+            "content": content,
+            "error": error,
+        }, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.written += 1
+            self.errors += 1 if error else 0
+            self._unsynced += 1
+            if self._unsynced >= FSYNC_EVERY:
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+            if self.written % FSYNC_EVERY == 0:
+                self.report()
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        print(
+            f"{self.written} done, {self.errors} errors, {self.written / max(elapsed, 1e-9):.1f} req/s",
+            file=sys.stderr
+        )
+
+    def close(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+class BatchState:
+    """Submitted provider batches, saved next to the output so a restarted run polls them again"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.batches = json.loads(self.path.read_text()) if self.path.exists() else []
+
+    def pending_ids(self):
+        return {request_id for batch in self.batches if not batch["done"] for request_id in batch["requests"]}
+
+    def add(self, provider, batch_id, requests):
+        self.batches.append({
+            "provider": provider,
+            "batch_id": batch_id,
+            # Only what is needed to write results; the messages are already with the provider
+            "requests": {
+                request["id"]: {key: request[key] for key in ("id", "custom_id", "provider", "model")}
+                for request in requests
+            },
+            "done": False,
+        })
+        self.save()
+
+    def save(self):
+        # Write then rename, so a crash never leaves a half-written state file
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.batches))
+        os.replace(tmp_path, self.path)
+
+def run_direct(requests, writer, workers=16):
+    """Run requests through a bounded worker pool, writing results as they finish"""
+    def run(request):
+        result = get_chat_completion_result(
+            request["provider"], request["model"], request["messages"], get_api_key(request["provider"])
+        )
+        return result.text
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-runner") as executor:
+        pending = {}
+        for request in requests:
+            # Keep only a few requests per worker in flight, so huge inputs are never all in memory
+            if len(pending) >= workers * 2:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    write_future(writer, pending.pop(future), future)
+            pending[executor.submit(run, request)] = request
+
+        for future in list(pending):
+            write_future(writer, pending.pop(future), future)
+
+def write_future(writer, request, future):
+    try:
+        writer.write(request, content=future.result())
+    except Exception as e:
+        writer.write(request, error=f"{type(e).__name__}: {e}")
+
+def submit_batches(requests, state, chunk_size=BATCH_CHUNK_SIZE):
+    """
+    Submit requests to provider batch APIs in chunks
+
+    Returns the requests whose provider has no batch API, to be run directly.
+    """
+    by_provider = {}
+    for request in requests:
+        by_provider.setdefault(request["provider"], []).append(request)
+
+    direct = []
+    for provider, provider_requests in by_provider.items():
+        adapter = get_adapter(provider)
+        api_key = get_api_key(provider)
+        if not adapter.capabilities.batch:
+            direct.extend(provider_requests)
+            continue
+
+        for start in range(0, len(provider_requests), chunk_size):
+            chunk = provider_requests[start:start + chunk_size]
+            batch_requests = [
+                (request["custom_id"], request["model"],
+                 prepare_messages(provider, request["model"], as_message_dicts(request["messages"]), api_key))
+                for request in chunk
+            ]
+            try:
+                batch_id = adapter.submit_batch(batch_requests, api_key)
+            except NotImplementedError:
+                direct.extend(provider_requests[start:])
+                break
+            state.add(provider, batch_id, chunk)
+            print(f"Submitted {provider} batch {batch_id} with {len(chunk)} requests", file=sys.stderr)
+    return direct
+
+def poll_batches(state, writer, poll_interval=60):
+    """Wait for every pending batch to end and write its results"""
+    while True:
+        pending = [batch for batch in state.batches if not batch["done"]]
+        if not pending:
+            return
+
+        for batch in pending:
+            provider = batch["provider"]
+            try:
+                results = get_adapter(provider).get_batch_results(batch["batch_id"], get_api_key(provider))
+            except Exception as e:
+                print(f"Polling {provider} batch {batch['batch_id']} failed, will retry: {e}", file=sys.stderr)
+                continue
+            if results is None:
+                continue
+
+            requests_by_custom_id = {request["custom_id"]: request for request in batch["requests"].values()}
+            for custom_id, content, error in results:
+                request = requests_by_custom_id.pop(custom_id, None)
+                if request is not None:
+                    writer.write(request, content=content, error=error)
+            for request in requests_by_custom_id.values():
+                writer.write(request, error="No result returned by the batch")
+
+            batch["done"] = True
+            state.save()
+            print(f"{provider} batch {batch['batch_id']} finished", file=sys.stderr)
+
+        if any(not batch["done"] for batch in state.batches):
+            time.sleep(poll_interval)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of chat requests headlessly")
+    parser.add_argument("input", help="Input JSONL of requests")
+    parser.add_argument("output", help="Output JSONL of results (appended to, enabling resume)")
+    parser.add_argument("--provider", help="Provider for requests that don't name one")
+    parser.add_argument("--model", help="Model for requests that don't name one")
+    parser.add_argument("--mode", choices=["direct", "batch"], default="direct")
+    parser.add_argument("--workers", type=int, default=16, help="Concurrent requests in direct mode")
+    parser.add_argument("--chunk-size", type=int, default=BATCH_CHUNK_SIZE, help="Requests per provider batch")
+    parser.add_argument("--poll-interval", type=float, default=60, help="Seconds between batch status checks")
+    parser.add_argument("--retry-errors", action="store_true", help="Rerun requests whose earlier result was an error")
+    parser.add_argument("--rate-limits", help='Per-provider limits as JSON, e.g. {"openai": {"rpm": 500, "tpm": 200000}}')
+    args = parser.parse_args()
+
+    if args.rate_limits:
+        configure_rate_limits(json.loads(args.rate_limits))
+
+    if args.provider and not get_api_key(args.provider) and get_capabilities(args.provider).requires_api_key:
+        sys.exit(f"Set {args.provider.upper()}_API_KEY to run {args.provider} requests")
+
+    completed = load_completed(args.output, retry_errors=args.retry_errors)
+    writer = ResultWriter(args.output)
+
+    try:
+        if args.mode == "batch":
+            state = BatchState(args.output + ".batches.json")
+            skip = completed | state.pending_ids()
+            requests = [request for request in read_requests(args.input, args.provider, args.model) if request["id"] not in skip]
+            direct = submit_batches(requests, state, chunk_size=args.chunk_size)
+            run_direct(direct, writer, workers=args.workers)
+            poll_batches(state, writer, poll_interval=args.poll_interval)
+        else:
+            requests = (
+                request for request in read_requests(args.input, args.provider, args.model)
+                if request["id"] not in completed
+            )
+            run_direct(requests, writer, workers=args.workers)
+    finally:
+        writer.report()
+        writer.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import gzip
+import io
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from utils.chat_store import create_chat, iter_user_chats
+from utils.message_store import iter_chat_messages
+
+ARCHIVE_FORMAT = "chatbot-archive"
+ARCHIVE_VERSION = 1
+
+# Rows fetched from Supabase per request when exporting
+EXPORT_CHUNK_SIZE = 500
+
+# Messages per bulk insert when importing
+IMPORT_BATCH_SIZE = 500
+
+# Seconds a prepared export file is kept for download
+EXPORT_RETENTION = 3600
+
+# Chat columns carried over on import (ids and ownership are assigned anew)
+CHAT_FIELDS = ("title", "provider", "model", "routing", "created_at")
+
+def get_export_dir():
+    """Get the directory holding prepared export files"""
+    path = Path.home() / ".streamlit_chatbot" / "exports"
+    path.mkdir(parents=True, exist_ok=True, mode=0o700)
+    return path
+
+def write_record(archive, record):
+    archive.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+
+def export_chats(supabase, user_id, output, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Write a user's chats and messages to a binary file object as gzip JSONL
+
+    The archive is a header line, then each chat followed by its messages
+    oldest first, then a manifest line with the totals, which import uses
+    to tell a complete archive from a truncated one. Rows are read in
+    keyset-paginated chunks and written as they arrive.
+
+    Returns:
+        tuple: (number of chats, number of messages)
+    """
+    chat_count = 0
+    message_count = 0
+    with gzip.GzipFile(fileobj=output, mode="wb") as archive:
+        write_record(archive, {
+            "type": "archive",
+            "format": ARCHIVE_FORMAT,
+            "version": ARCHIVE_VERSION,
+            "exported_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        })
+        for chat in iter_user_chats(supabase, user_id, chunk_size=chunk_size):
+            write_record(archive, dict({"type": "chat", "id": chat["id"]}, **{field: chat.get(field) for field in CHAT_FIELDS}))
+            chat_count += 1
+            for message in iter_chat_messages(supabase, chat["id"], chunk_size=chunk_size):
+                write_record(archive, {
+                    "type": "message",
+                    "chat": chat["id"],
+                    "role": message["role"],
+                    "content": message["content"],
+                    "created_at": message["created_at"],
+                })
+                message_count += 1
+        write_record(archive, {"type": "manifest", "chats": chat_count, "messages": message_count})
+    return chat_count, message_count
+
+def prepare_export(supabase, user_id):
+    """
+    Export a user's chats to a new file in the export directory
+
+    Exports older than EXPORT_RETENTION are removed first.
+
+    Returns:
+        tuple: (file path, number of chats, number of messages)
+    """
+    directory = get_export_dir()
+    cutoff = time.time() - EXPORT_RETENTION
+    for old_file in directory.glob("*.jsonl.gz"):
+        try:
+            if old_file.stat().st_mtime < cutoff:
+                old_file.unlink()
+        except OSError:
+            pass
+
+    fd, path = tempfile.mkstemp(dir=directory, prefix="chats-", suffix=".jsonl.gz")
+    try:
+        with os.fdopen(fd, "wb") as output:
+            chat_count, message_count = export_chats(supabase, user_id, output)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path, chat_count, message_count
+
+def import_chats(supabase, user_id, archive_file, batch_size=IMPORT_BATCH_SIZE, on_chat=None, on_messages=None):
+    """
+    Add the chats and messages in a gzip JSONL archive to a user's account
+
+    The archive is read line by line and messages are inserted in batches,
+    so memory use doesn't grow with the archive. Chats get new ids owned by
+    user_id.
+
+    Args:
+        on_chat (callable): Called with each created chat row
+        on_messages (callable): Called with each inserted batch of message rows
+
+    Returns:
+        dict: {"chats", "messages", "complete"}; complete is False if the
+            archive ended before its manifest (a truncated download)
+
+    Raises:
+        ValueError: If the file is not a chat archive this version can read
+    """
+    chat_ids = {}
+    batch = []
+    result = {"chats": 0, "messages": 0, "complete": False}
+
+    def flush():
+        if batch:
+            supabase.table("messages").insert(batch).execute()
+            result["messages"] += len(batch)
+            if on_messages:
+                on_messages(list(batch))
+            batch.clear()
+
+    with gzip.GzipFile(fileobj=archive_file, mode="rb") as archive:
+        lines = io.TextIOWrapper(archive, encoding="utf-8")
+        header = json.loads(lines.readline() or "{}")
+        if header.get("format") != ARCHIVE_FORMAT or header.get("version", 0) > ARCHIVE_VERSION:
+            raise ValueError("Not a chat archive, or one from a newer version of the app")
+
+        for line in lines:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            record_type = record.get("type")
+
+            if record_type == "chat":
+                chat = {field: record.get(field) for field in CHAT_FIELDS}
+                chat["user_id"] = user_id
+                created = create_chat(supabase, user_id, chat)
+                rows = created.data if hasattr(created, "data") else []
+                if not rows:
+                    raise ValueError(f"Creating chat '{record.get('title')}' returned no row")
+                chat_ids[record["id"]] = rows[0]["id"]
+                result["chats"] += 1
+                if on_chat:
+                    on_chat(rows[0])
+
+            elif record_type == "message":
+                chat_id = chat_ids.get(record["chat"])
+                if chat_id is None:
+                    raise ValueError("Archive has a message before its chat")
+                batch.append({
+                    "chat_id": chat_id,
+                    "role": record["role"],
+                    "content": record["content"],
+                    "created_at": record["created_at"],
+                })
+                if len(batch) >= batch_size:
+                    flush()
+
+            elif record_type == "manifest":
+                result["complete"] = True
+
+    flush()
+    return result
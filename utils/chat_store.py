@@ -0,0 +1,209 @@
+import threading
+import time
+
+# Only the columns the sidebar and chat panel need
+CHAT_LIST_COLUMNS = "id, title, provider, model, routing, created_at"
+
+# The same without the routing column, for databases that haven't added it yet
+LEGACY_CHAT_LIST_COLUMNS = "id, title, provider, model, created_at"
+
+# Number of chats shown per sidebar page
+CHAT_PAGE_SIZE = 20
+
+# Seconds before a cached page is refetched, to pick up changes from other workers
+CHAT_LIST_TTL = 60
+
+class ChatListCache:
+    """
+    Per-user cache of chat list pages shared by all sessions in this process
+
+    Pages are keyed by (search, page). The sidebar's own writes keep the
+    cache current: updates and deletes patch cached rows in place, while an
+    insert shifts every page and clears that user's entries.
+
+    With a shared state backend, writes also bump a per-user version there,
+    so other worker processes drop their copies of that user's pages.
+    """
+
+    def __init__(self, ttl=CHAT_LIST_TTL):
+        self.ttl = ttl
+        self.state_backend = None
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def version(self, user_id):
+        """Get the user's chat list version (always 0 without a shared state backend)"""
+        if self.state_backend is None:
+            return 0
+        try:
+            return self.state_backend.get("chat_list_version", str(user_id)) or 0
+        except Exception:
+            return 0
+
+    def get(self, user_id, search, page, version=0):
+        with self._lock:
+            entry = self._pages.get((user_id, search, page))
+            if entry is None or time.monotonic() - entry[2] > self.ttl or entry[3] != version:
+                return None
+            return entry[0], entry[1]
+
+    def set(self, user_id, search, page, rows, has_more, version=0):
+        with self._lock:
+            self._pages[(user_id, search, page)] = (rows, has_more, time.monotonic(), version)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            for key in [key for key in self._pages if key[0] == user_id]:
+                del self._pages[key]
+        self._bump(user_id)
+
+    def update_chat(self, user_id, chat_id, changes):
+        with self._lock:
+            for key, (rows, has_more, stored_at, version) in list(self._pages.items()):
+                if key[0] != user_id:
+                    continue
+                patched = [dict(row, **changes) if row["id"] == chat_id else row for row in rows]
+                self._pages[key] = (patched, has_more, stored_at, version)
+        self._bump(user_id)
+
+    def remove_chat(self, user_id, chat_id):
+        with self._lock:
+            for key, (rows, has_more, stored_at, version) in list(self._pages.items()):
+                if key[0] != user_id:
+                    continue
+                self._pages[key] = ([row for row in rows if row["id"] != chat_id], has_more, stored_at, version)
+        self._bump(user_id)
+
+    def _bump(self, user_id):
+        if self.state_backend is None:
+            return
+        try:
+            self.state_backend.update("chat_list_version", str(user_id), lambda version: (version or 0) + 1)
+        except Exception:
+            # Other workers pick the change up when their pages expire
+            pass
+
+_chat_list_cache = ChatListCache()
+
+# Cleared the first time Supabase reports that chats has no routing column
+_routing_column = True
+
+def has_routing_column():
+    """Whether the chats table has the routing column (assumed until a query says otherwise)"""
+    return _routing_column
+
+def is_missing_routing_column(error):
+    # PostgREST reports 42703 "column chats.routing does not exist" on reads and PGRST204 on writes
+    message = str(error)
+    return "routing" in message and ("42703" in message or "PGRST204" in message or "does not exist" in message)
+
+def select_chats(supabase, build):
+    """
+    Run build(select query on chats) and return its rows
+
+    Selects CHAT_LIST_COLUMNS, or LEGACY_CHAT_LIST_COLUMNS once the database
+    turns out not to have the routing column.
+    """
+    global _routing_column
+    if _routing_column:
+        try:
+            response = build(supabase.table("chats").select(CHAT_LIST_COLUMNS)).execute()
+            return response.data if hasattr(response, "data") else []
+        except Exception as e:
+            if not is_missing_routing_column(e):
+                raise
+            _routing_column = False
+    response = build(supabase.table("chats").select(LEGACY_CHAT_LIST_COLUMNS)).execute()
+    return response.data if hasattr(response, "data") else []
+
+def write_chat(write, row):
+    """Run write(row), dropping the routing field if the database has no routing column"""
+    global _routing_column
+    if _routing_column or "routing" not in row:
+        try:
+            return write(row)
+        except Exception as e:
+            if "routing" not in row or not is_missing_routing_column(e):
+                raise
+            _routing_column = False
+    return write({key: value for key, value in row.items() if key != "routing"})
+
+def configure_chat_list_cache(state_backend):
+    """Share chat list invalidations with other worker processes through a shared state backend"""
+    _chat_list_cache.state_backend = state_backend if state_backend is not None and state_backend.shared else None
+
+def list_chats(supabase, user_id, search="", page=0, page_size=CHAT_PAGE_SIZE):
+    """
+    Get one page of a user's chats, newest first, from cache or Supabase
+
+    Returns:
+        tuple: (chat rows, whether more pages exist)
+    """
+    search = search.strip()
+    # Read before fetching, so a write elsewhere during the fetch still invalidates the page
+    version = _chat_list_cache.version(user_id)
+    cached = _chat_list_cache.get(user_id, search, page, version)
+    if cached is not None:
+        return cached
+
+    # Fetch one extra row to know whether there is a next page
+    start = page * page_size
+
+    def build(query):
+        query = query.eq("user_id", user_id)
+        if search:
+            query = query.ilike("title", f"%{search}%")
+        return query.order("created_at", desc=True).range(start, start + page_size)
+
+    rows = select_chats(supabase, build)
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    _chat_list_cache.set(user_id, search, page, rows, has_more, version)
+    return rows, has_more
+
+def iter_user_chats(supabase, user_id, chunk_size=500):
+    """
+    Yield all of a user's chats, oldest first, fetching them in keyset-paginated chunks
+
+    Only one chunk is held at a time, however many chats the user has.
+    """
+    cursor = None
+    while True:
+        def build(query):
+            query = query.eq("user_id", user_id)
+            if cursor is not None:
+                created_at, chat_id = cursor
+                # Values are quoted because timestamps contain PostgREST reserved characters
+                query = query.or_(f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt."{chat_id}")')
+            return query.order("created_at").order("id").limit(chunk_size)
+
+        rows = select_chats(supabase, build)
+
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        cursor = (rows[-1]["created_at"], rows[-1]["id"])
+
+def get_chat(supabase, chat_id):
+    """Get one chat's list columns, or None if it no longer exists"""
+    rows = select_chats(supabase, lambda query: query.eq("id", chat_id).limit(1))
+    return rows[0] if rows else None
+
+def create_chat(supabase, user_id, chat):
+    """Insert a chat and invalidate the user's cached chat list"""
+    result = write_chat(lambda row: supabase.table("chats").insert(row).execute(), chat)
+    _chat_list_cache.invalidate(user_id)
+    return result
+
+def update_chat(supabase, user_id, chat_id, changes):
+    """Update a chat and patch it in the cached chat list"""
+    result = write_chat(lambda row: supabase.table("chats").update(row).eq("id", chat_id).execute(), changes)
+    _chat_list_cache.update_chat(user_id, chat_id, changes)
+    return result
+
+def delete_chat(supabase, user_id, chat_id):
+    """Delete a chat and drop it from the cached chat list"""
+    result = supabase.table("chats").delete().eq("id", chat_id).execute()
+    _chat_list_cache.remove_chat(user_id, chat_id)
+    return result
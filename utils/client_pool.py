@@ -0,0 +1,105 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+class ClientPool:
+    """
+    Thread-safe registry of provider SDK clients shared by all sessions
+
+    Clients are keyed by (provider, api key hash, base URL) so each key keeps
+    its own pooled keep-alive connections. Idle entries expire after `ttl`
+    seconds and the least recently used entry is evicted beyond `max_size`.
+
+    Clients are built outside the pool lock, so a slow build only holds up
+    callers waiting for the same key. Evicted clients are not closed, since
+    other threads may still be streaming through them; their connections
+    close when the last reference is dropped.
+    """
+
+    def __init__(self, max_size=64, ttl=900):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clients = OrderedDict()
+        self._building = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, provider, api_key, base_url, factory):
+        """Return the pooled client for this key, building it with factory() on a miss"""
+        key = (provider, hash_api_key(api_key), base_url)
+        now = time.monotonic()
+
+        with self._lock:
+            # Drop entries that have been idle for too long
+            for entry_key, (client, last_used) in list(self._clients.items()):
+                if now - last_used > self.ttl:
+                    del self._clients[entry_key]
+                    self.evictions += 1
+
+            if key in self._clients:
+                client = self._clients[key][0]
+                self._clients[key] = (client, now)
+                self._clients.move_to_end(key)
+                self.hits += 1
+                return client
+
+            # Another thread may already be building this key's client
+            future = self._building.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._building[key] = future
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            client = factory()
+        except BaseException as e:
+            with self._lock:
+                del self._building[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._building[key]
+            self._clients[key] = (client, time.monotonic())
+            while len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+                self.evictions += 1
+        future.set_result(client)
+        return client
+
+    def stats(self):
+        """Get pool size and client reuse counters (lookups served by an existing client)"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._clients),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "reuse_rate": self.hits / total if total else 0.0,
+            }
+
+    def clear(self):
+        """Drop every pooled client"""
+        with self._lock:
+            self._clients.clear()
+
+def hash_api_key(api_key):
+    """Hash an API key so the raw key is never used as a registry key"""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+_pool = ClientPool()
+
+def get_client_pool():
+    """Get the process-wide client pool"""
+    return _pool
@@ -0,0 +1,220 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from utils.provider_registry import get_capabilities
+
+# Context window sizes in tokens, matched by longest model name prefix
+MODEL_CONTEXT_LIMITS = {
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+    "o1-mini": 128000,
+    "o1": 200000,
+    "o3-mini": 200000,
+    "claude-3": 200000,
+    "claude-2.1": 200000,
+    "claude-2": 100000,
+    "claude-instant": 100000,
+    "gemini-1.5-pro": 2000000,
+    "gemini-1.5-flash": 1000000,
+    "gemini-pro": 32760,
+    "gemini-ultra": 32760,
+    "sonar": 127072,
+    "meta-llama/": 128000,
+    "mistralai/": 32768,
+    "mistral": 32768,
+}
+DEFAULT_CONTEXT_LIMIT = 8192
+
+# Tokens kept free for the model's reply
+RESPONSE_TOKEN_RESERVE = 1024
+
+# Share of the budget the history is cut down to once it overflows, so the
+# summary is rebuilt only after the recent turns grow back to the full budget
+SUMMARY_TARGET_RATIO = 0.5
+
+# Rough per-message overhead of role markers and separators
+MESSAGE_TOKEN_OVERHEAD = 4
+
+# Characters per token for the fallback estimator, calibrated on English chat text
+CHARS_PER_TOKEN = 3.8
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+_encoding = None
+_encoding_loaded = False
+_summary_cache = OrderedDict()
+_summary_cache_lock = threading.Lock()
+SUMMARY_CACHE_SIZE = 256
+
+def get_context_limit(model, provider=None):
+    """
+    Get the context window size of a model
+
+    Models missing from MODEL_CONTEXT_LIMITS get their provider's declared
+    context size, and DEFAULT_CONTEXT_LIMIT when no provider is given.
+    """
+    name = model.lower()
+    matches = [prefix for prefix in MODEL_CONTEXT_LIMITS if name.startswith(prefix)]
+    if not matches:
+        return get_capabilities(provider).context_size if provider else DEFAULT_CONTEXT_LIMIT
+    return MODEL_CONTEXT_LIMITS[max(matches, key=len)]
+
+def get_prompt_budget(model, provider=None, context_limit=None):
+    """Get the number of prompt tokens allowed for a request to this model"""
+    return (context_limit or get_context_limit(model, provider)) - RESPONSE_TOKEN_RESERVE
+
+def count_tokens(text):
+    """Count tokens with tiktoken if it is installed, otherwise estimate them"""
+    global _encoding, _encoding_loaded
+
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = None
+        _encoding_loaded = True
+
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+def count_message_tokens(messages):
+    """Count the tokens of a message list including per-message overhead"""
+    return sum(count_tokens(msg["content"] or "") + MESSAGE_TOKEN_OVERHEAD for msg in messages)
+
+def fit_messages(model, messages, summarize=None, budget=None):
+    """
+    Build the outgoing message list for a request within the model's token budget
+
+    System messages and the most recent turns are kept. Older turns that do not
+    fit are replaced by a rolling summary when a summarize function is given,
+    and dropped otherwise.
+
+    Summarizing cuts the history down to SUMMARY_TARGET_RATIO of the budget,
+    and later requests reuse that summary for as long as the turns after it
+    still fit, so the summary (and with it the provider's cached prompt
+    prefix) only changes each time the budget fills up again.
+
+    Args:
+        model (str): Model the request is for
+        messages (list): Full chat history
+        summarize (callable): summarize(previous_summary, messages) -> str
+        budget (int): Prompt token budget, defaults to get_prompt_budget(model)
+
+    Returns:
+        list: Messages to send
+    """
+    if budget is None:
+        budget = get_prompt_budget(model)
+
+    if count_message_tokens(messages) <= budget:
+        return messages
+
+    system_messages = [msg for msg in messages if msg["role"] == "system"]
+    turns = [msg for msg in messages if msg["role"] != "system"]
+
+    remaining = budget - count_message_tokens(system_messages)
+    if summarize is not None:
+        start, summary = find_cached_summary(get_prefix_hashes(turns[:-1]))
+        if summary is not None and turns[start]["role"] == "user":
+            fitted = system_messages + [summary_message(summary)] + turns[start:]
+            if count_message_tokens(fitted) <= budget:
+                return fitted
+
+        # Cut down to a share of the budget, leaving room for the summary itself
+        remaining = int(budget * SUMMARY_TARGET_RATIO) - count_message_tokens(system_messages) - budget // 8
+
+    # Keep the newest turns that fit, always including the latest one
+    kept = []
+    for msg in reversed(turns):
+        tokens = count_message_tokens([msg])
+        if kept and tokens > remaining:
+            break
+        kept.append(msg)
+        remaining -= tokens
+    kept.reverse()
+
+    dropped = turns[:len(turns) - len(kept)]
+    # Providers expect the conversation to start with a user turn
+    while kept and kept[0]["role"] != "user" and len(kept) > 1:
+        dropped.append(kept.pop(0))
+
+    if not dropped or summarize is None:
+        return system_messages + kept
+
+    summary = get_rolling_summary(dropped, summarize, chunk_tokens=budget // 2)
+    return system_messages + [summary_message(summary)] + kept
+
+def summary_message(summary):
+    return {"role": "system", "content": SUMMARY_PREFIX + summary}
+
+def get_prefix_hashes(messages):
+    """Get a hash of every prefix of a message list"""
+    prefix_hashes = []
+    digest = hashlib.sha256()
+    for msg in messages:
+        digest.update(json.dumps([msg["role"], msg["content"]]).encode("utf-8"))
+        prefix_hashes.append(digest.hexdigest())
+    return prefix_hashes
+
+def find_cached_summary(prefix_hashes):
+    """
+    Find the longest message list prefix with a cached summary
+
+    Returns:
+        tuple: (number of messages summarized, summary), or (0, None)
+    """
+    with _summary_cache_lock:
+        for i in range(len(prefix_hashes) - 1, -1, -1):
+            if prefix_hashes[i] in _summary_cache:
+                _summary_cache.move_to_end(prefix_hashes[i])
+                return i + 1, _summary_cache[prefix_hashes[i]]
+    return 0, None
+
+def get_rolling_summary(dropped, summarize, chunk_tokens=None):
+    """
+    Summarize dropped turns, reusing the cached summary of the longest prefix
+
+    As a chat grows the dropped prefix only gets longer, so each new summary
+    only has to fold the newly dropped turns into the previous one. With
+    chunk_tokens, new turns are folded in chunks of about that size, so a
+    single summary request never outgrows the model's context.
+    """
+    prefix_hashes = get_prefix_hashes(dropped)
+    start, previous_summary = find_cached_summary(prefix_hashes)
+
+    while start < len(dropped):
+        end = start + 1
+        tokens = count_message_tokens(dropped[start:end])
+        while end < len(dropped) and chunk_tokens and tokens + count_message_tokens([dropped[end]]) <= chunk_tokens:
+            tokens += count_message_tokens([dropped[end]])
+            end += 1
+        if not chunk_tokens:
+            end = len(dropped)
+
+        previous_summary = summarize(previous_summary, dropped[start:end])
+        with _summary_cache_lock:
+            _summary_cache[prefix_hashes[end - 1]] = previous_summary
+            while len(_summary_cache) > SUMMARY_CACHE_SIZE:
+                _summary_cache.popitem(last=False)
+        start = end
+
+    return previous_summary
+
+def build_summary_request(previous_summary, messages):
+    """Build the messages asking a model to fold turns into a running summary"""
+    transcript = "\n\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+    instructions = (
+        "Summarize the conversation below so it can replace the original turns as context. "
+        "Keep facts, decisions, names, numbers and open questions. Be concise."
+    )
+    if previous_summary:
+        transcript = f"Existing summary:\n{previous_summary}\n\nNew turns:\n{transcript}"
+    return [
+        {"role": "system", "content": instructions},
+        {"role": "user", "content": transcript},
+    ]
@@ -0,0 +1,38 @@
+import hashlib
+import math
+import re
+
+# Dimension of the hashed embedding vectors
+EMBEDDING_DIM = 256
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+def tokenize(text):
+    """Split text into lowercase word tokens"""
+    return _TOKEN_PATTERN.findall(text.lower())
+
+def embed_text(text, dim=EMBEDDING_DIM):
+    """
+    Compute a local embedding of text without any model download
+
+    Uses feature hashing over words and word bigrams, L2-normalized, which is
+    enough to match near-duplicate questions (reordered or lightly reworded).
+    """
+    vector = [0.0] * dim
+    tokens = tokenize(text)
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % dim
+        sign = 1.0 if digest[4] & 1 else -1.0
+        vector[index] += sign
+
+    norm = math.sqrt(sum(value * value for value in vector))
+    if norm:
+        vector = [value / norm for value in vector]
+    return vector
+
+def cosine_similarity(a, b):
+    """Cosine similarity of two normalized vectors"""
+    return sum(x * y for x, y in zip(a, b))
@@ -0,0 +1,323 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+from utils.rate_limit import bind_session
+from utils.state_backend import get_state_backend
+
+# Seconds a finished job stays in the table for late re-attaching sessions
+JOB_RETENTION = 600
+
+# Seconds between publishing a running job's text to a shared state backend
+PUBLISH_INTERVAL = 0.5
+
+# Seconds without an update after which another worker's running job is presumed dead
+JOB_STALE_AFTER = 120
+
+class GenerationJob:
+    """
+    One completion running out of band, with its output buffered as it arrives
+
+    Any number of sessions can follow() the job; each gets the text produced
+    so far and then new deltas until the job finishes.
+    """
+
+    def __init__(self, chat_id):
+        self.id = str(uuid.uuid4())
+        self.chat_id = chat_id
+        self.status = "running"
+        self.error = None
+        self.result = None
+        self.wait_message = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self._chunks = []
+        self.discarded = False
+        self._cancelled = threading.Event()
+        self._condition = threading.Condition()
+        self.on_change = None
+
+    @property
+    def text(self):
+        with self._condition:
+            return "".join(self._chunks)
+
+    @property
+    def running(self):
+        return self.status == "running"
+
+    def cancel(self, discard=False):
+        """Ask the worker to stop, even while still queued or retrying; with discard the partial reply isn't saved either"""
+        self.discarded = self.discarded or discard
+        self._cancelled.set()
+
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def cancel_event(self):
+        """Event set on cancel, for rate limit and retry waits inside the stream to give up early"""
+        return self._cancelled
+
+    def append(self, delta):
+        with self._condition:
+            self._chunks.append(delta)
+            self.wait_message = None
+            self._condition.notify_all()
+        self._changed()
+
+    def set_wait_message(self, message):
+        with self._condition:
+            self.wait_message = message
+            self._condition.notify_all()
+        self._changed()
+
+    def finish(self, status, error=None):
+        with self._condition:
+            self.status = status
+            self.error = error
+            self.finished_at = time.time()
+            self._condition.notify_all()
+        self._changed(final=True)
+
+    def to_record(self):
+        """Snapshot of the job for other worker processes"""
+        with self._condition:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "text": "".join(self._chunks),
+                "wait_message": self.wait_message,
+                "error": self.error,
+                "updated": time.time(),
+            }
+
+    def _changed(self, final=False):
+        if self.on_change:
+            self.on_change(self, final)
+
+    def follow(self, on_status=None, poll_interval=0.5):
+        """
+        Yield the buffered output, then new deltas until the job finishes
+
+        on_status is called with the job's rate-limit or retry message while
+        no text has arrived yet, from the calling (script) thread.
+        """
+        offset = 0
+        last_message = None
+        while True:
+            with self._condition:
+                if offset == len(self._chunks) and self.running:
+                    self._condition.wait(poll_interval)
+                chunks = self._chunks[offset:]
+                offset += len(chunks)
+                message = self.wait_message
+                finished = not self.running
+
+            if on_status and message != last_message:
+                last_message = message
+                on_status(message)
+            if chunks:
+                yield "".join(chunks)
+            if finished and offset == len(self._chunks):
+                return
+
+class RemoteJob:
+    """
+    A generation running in another worker process, followed through the shared state backend
+
+    Has the GenerationJob attributes the chat panel reads; result is always
+    None since call metrics stay with the worker that ran the call.
+    """
+
+    def __init__(self, chat_id, record, state_backend, retention=JOB_RETENTION):
+        self.chat_id = chat_id
+        self.result = None
+        self._state_backend = state_backend
+        self._retention = retention
+        self._apply(record)
+
+    @property
+    def running(self):
+        return self.status == "running"
+
+    def cancel(self, discard=False):
+        """Ask the worker running the job to stop"""
+        self._state_backend.set("job_cancel", self.id, "discard" if discard else True, ttl=self._retention)
+
+    def follow(self, on_status=None, poll_interval=0.5):
+        """Yield the published output, then newly published text until the job finishes"""
+        offset = 0
+        last_message = None
+        while True:
+            if on_status and self.wait_message != last_message:
+                last_message = self.wait_message
+                on_status(self.wait_message)
+            if len(self.text) > offset:
+                yield self.text[offset:]
+                offset = len(self.text)
+            if not self.running:
+                return
+
+            time.sleep(poll_interval)
+            record = self._state_backend.get("jobs", self.chat_id)
+            if record is None or record["job_id"] != self.id or is_stale(record):
+                # The worker went away without finishing
+                self.status, self.error = "error", "The worker running this response stopped"
+            else:
+                self._apply(record)
+
+    def _apply(self, record):
+        self.id = record["job_id"]
+        self.status = record["status"]
+        self.text = record["text"]
+        self.wait_message = record["wait_message"]
+        self.error = record["error"]
+
+def is_stale(record):
+    return record["status"] == "running" and time.time() - record["updated"] > JOB_STALE_AFTER
+
+class JobManager:
+    """
+    Process-wide table of generation jobs run on a thread pool
+
+    Jobs are keyed by chat, so a rerun, another session or a reconnected
+    browser can re-attach to a chat's in-flight generation, and several
+    chats can generate at once.
+
+    With a shared state backend each job's status and text are also
+    published there, so sessions on other worker processes see the chat as
+    generating, follow its output and can cancel it, and a chat never runs
+    two generations at once across workers.
+    """
+
+    def __init__(self, max_workers=16, retention=JOB_RETENTION, state_backend=None):
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generation")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._state_backend = state_backend if state_backend is not None and state_backend.shared else None
+        self._published_at = {}
+
+    def start(self, chat_id, stream_factory, on_finish=None, session_id=None):
+        """
+        Run a generation for a chat in the background
+
+        Args:
+            chat_id: Chat the generation belongs to
+            stream_factory (callable): Called with the job in the worker
+                thread, returns an iterator of text deltas; it should pass
+                job.cancel_event on so waits before the first delta end early
+            on_finish (callable): Called with the job once it ends, in the
+                worker thread, e.g. to save the reply
+            session_id: Streamlit session the work is rate limited under
+
+        Returns:
+            GenerationJob
+        """
+        job = GenerationJob(chat_id)
+        with self._lock:
+            self._prune()
+            active = self._jobs.get(chat_id)
+            if active is not None and active.running:
+                raise RuntimeError("A response is already being generated for this chat")
+            if self._state_backend is not None:
+                self._claim(job)
+                job.on_change = self._publish
+            self._jobs[chat_id] = job
+
+        self._executor.submit(self._run, job, stream_factory, on_finish, session_id)
+        return job
+
+    def get(self, chat_id):
+        """Get a chat's latest job, running or recently finished, on this or (when shared) another worker"""
+        with self._lock:
+            job = self._jobs.get(chat_id)
+        if job is not None or self._state_backend is None:
+            return job
+
+        record = self._state_backend.get("jobs", chat_id)
+        if record is None or is_stale(record):
+            return None
+        return RemoteJob(chat_id, record, self._state_backend, retention=self.retention)
+
+    def active_chat_ids(self):
+        with self._lock:
+            active = {chat_id for chat_id, job in self._jobs.items() if job.running}
+        if self._state_backend is not None:
+            active.update(
+                chat_id for chat_id, record in self._state_backend.scan("jobs").items()
+                if record["status"] == "running" and not is_stale(record)
+            )
+        return active
+
+    def cancel(self, chat_id, discard=False):
+        """Stop a chat's running job; discard it when the chat is being deleted"""
+        job = self.get(chat_id)
+        if job is not None and job.running:
+            job.cancel(discard=discard)
+
+    def _claim(self, job):
+        # Atomic across workers, so two can't start generating for the same chat
+        def claim(record):
+            if record is not None and record["status"] == "running" and not is_stale(record):
+                raise RuntimeError("A response is already being generated for this chat")
+            return job.to_record()
+
+        self._state_backend.update("jobs", job.chat_id, claim, ttl=self.retention)
+
+    def _publish(self, job, final=False):
+        now = time.monotonic()
+        if not final and now - self._published_at.get(job.id, 0.0) < PUBLISH_INTERVAL:
+            return
+        self._published_at[job.id] = now
+        try:
+            self._state_backend.set("jobs", job.chat_id, job.to_record(), ttl=self.retention)
+            # A cancel requested from another worker
+            cancel_request = None if final else self._state_backend.get("job_cancel", job.id)
+            if cancel_request:
+                job.cancel(discard=cancel_request == "discard")
+        except Exception:
+            # Other workers just see the job go stale; this worker's sessions are unaffected
+            pass
+        if final:
+            self._published_at.pop(job.id, None)
+
+    def _run(self, job, stream_factory, on_finish, session_id):
+        bind_session(session_id)
+        stream = None
+        try:
+            stream = stream_factory(job)
+            for delta in stream:
+                if job.cancelled():
+                    break
+                job.append(delta)
+            job.finish("cancelled" if job.cancelled() else "done")
+        except Exception as e:
+            # Includes the CancelledError of a job stopped before its first token
+            if job.cancelled():
+                job.finish("cancelled")
+            else:
+                job.finish("error", error=str(e))
+        finally:
+            if hasattr(stream, "close"):
+                stream.close()
+            bind_session(None)
+
+        if on_finish:
+            try:
+                on_finish(job)
+            except Exception as e:
+                job.error = job.error or f"Saving the response failed: {str(e)}"
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for chat_id in [chat_id for chat_id, job in self._jobs.items()
+                        if not job.running and job.finished_at < cutoff]:
+            del self._jobs[chat_id]
+
+@st.cache_resource
+def get_job_manager():
+    """Get the process-wide job manager, shared across reruns and sessions"""
+    return JobManager(state_backend=get_state_backend())
@@ -0,0 +1,185 @@
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+import streamlit as st
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: writers are still serialized within the process
+    fcntl = None
+
+# Seconds between checks of a user's key file for changes by other processes
+CHANGE_CHECK_INTERVAL = 1.0
+
+def get_key_store_dir():
+    """Get the directory holding the encrypted per-user key files"""
+    path = Path.home() / ".streamlit_chatbot" / "keys"
+    path.mkdir(parents=True, exist_ok=True, mode=0o700)
+    return path
+
+def load_master_key(secret=None, key_path=None):
+    """
+    Get the Fernet key that encrypts every key file
+
+    Derived from a configured secret when there is one, so several hosts can
+    share the files; otherwise generated once and kept in a 0600 file next to
+    the key files.
+    """
+    if secret:
+        return base64.urlsafe_b64encode(hashlib.sha256(secret.encode("utf-8")).digest())
+
+    from cryptography.fernet import Fernet
+
+    key_path = Path(key_path) if key_path else get_key_store_dir() / "master.key"
+    if key_path.exists():
+        return key_path.read_bytes().strip()
+
+    # Written in full to a temporary file (0600, from mkstemp) and then linked
+    # into place, so no process ever reads a partly written key; the link fails
+    # if another first start got there first, and then its key is used
+    key = Fernet.generate_key()
+    fd, tmp_path = tempfile.mkstemp(dir=key_path.parent, prefix=".tmp-", suffix=".key")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(key)
+            f.flush()
+            os.fsync(f.fileno())
+        os.link(tmp_path, key_path)
+    except FileExistsError:
+        return key_path.read_bytes().strip()
+    finally:
+        os.unlink(tmp_path)
+    return key
+
+class KeyStore:
+    """
+    Encrypted API key store with one file per user
+
+    Each user's keys are a Fernet-encrypted JSON file named by a hash of the
+    user id, which is also stored inside the ciphertext so a file copied to
+    another user's name is rejected. Writes take an exclusive file lock,
+    re-read the latest keys, and replace the file atomically. Reads come from
+    an in-process cache revalidated against the file's mtime at most once
+    per CHANGE_CHECK_INTERVAL.
+    """
+
+    def __init__(self, directory=None, master_key=None):
+        from cryptography.fernet import Fernet
+
+        self.directory = Path(directory) if directory else get_key_store_dir()
+        self.directory.mkdir(parents=True, exist_ok=True, mode=0o700)
+        self._fernet = Fernet(master_key or load_master_key(key_path=self.directory / "master.key"))
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def get_keys(self, user_id):
+        """Get a copy of a user's API keys by provider"""
+        path = self._path(user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(path)
+            if entry is not None and now - entry["checked_at"] < CHANGE_CHECK_INTERVAL:
+                return dict(entry["keys"])
+
+            signature = self._signature(path)
+            if entry is None or entry["signature"] != signature:
+                keys = self._read(path, user_id) if signature is not None else {}
+                entry = {"keys": keys, "signature": signature}
+                self._cache[path] = entry
+            entry["checked_at"] = now
+            return dict(entry["keys"])
+
+    def set_key(self, user_id, provider, key):
+        """Save one provider's key (an empty key removes it)"""
+        def update(keys):
+            if key:
+                keys[provider] = key
+            else:
+                keys.pop(provider, None)
+        self._update(user_id, update)
+
+    def import_keys(self, user_id, keys):
+        """Add keys that the user has not set yet, e.g. from the legacy plaintext file"""
+        def update(existing):
+            for provider, key in keys.items():
+                if key and provider not in existing:
+                    existing[provider] = key
+        self._update(user_id, update)
+
+    def _update(self, user_id, update):
+        path = self._path(user_id)
+        with self._lock, self._file_lock(path):
+            # Re-read under the lock so concurrent writers never drop each other's keys
+            keys = self._read(path, user_id) if path.exists() else {}
+            update(keys)
+            self._write(path, user_id, keys)
+            self._cache[path] = {
+                "keys": keys,
+                "signature": self._signature(path),
+                "checked_at": time.monotonic(),
+            }
+
+    def _path(self, user_id):
+        return self.directory / (hashlib.sha256(str(user_id).encode("utf-8")).hexdigest() + ".keys")
+
+    def _signature(self, path):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _read(self, path, user_id):
+        payload = json.loads(self._fernet.decrypt(path.read_bytes()))
+        if payload.get("user_id") != str(user_id):
+            raise ValueError("Key file does not belong to this user")
+        return payload.get("keys", {})
+
+    def _write(self, path, user_id, keys):
+        token = self._fernet.encrypt(json.dumps({"user_id": str(user_id), "keys": keys}).encode("utf-8"))
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-", suffix=".keys")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(token)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    @contextmanager
+    def _file_lock(self, path):
+        if fcntl is None:
+            yield
+            return
+        with open(path.with_suffix(".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+@st.cache_resource
+def get_key_store():
+    """
+    Get the process-wide key store
+
+    An optional [key_store] section in Streamlit secrets sets `secret` (to
+    derive the encryption key, e.g. when several hosts share the files) and
+    `path` (the directory of key files).
+    """
+    config = st.secrets.get("key_store", None) or {}
+    master_key = load_master_key(config["secret"]) if config.get("secret") else None
+    return KeyStore(config.get("path"), master_key=master_key)
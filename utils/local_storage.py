@@ -1,59 +1,63 @@
 import streamlit as st
 import json
-import os
 from pathlib import Path
+from utils.key_store import get_key_store
 
-# We'll use this as a fallback if cookies don't work
 def get_local_storage_path():
-    """Get path to local storage file"""
-    # Store in user's home directory
-    home = Path.home()
-    config_dir = home / ".streamlit_chatbot"
-    config_dir.mkdir(exist_ok=True)
-    return config_dir / "api_keys.json"
+    """Get path to the legacy plaintext key file (only read to import old keys)"""
+    return Path.home() / ".streamlit_chatbot" / "api_keys.json"
+
+def get_current_user_id():
+    """Get the logged-in user's id, or None"""
+    user = st.session_state.get("user")
+    return getattr(user, "id", None) if user is not None else None
 
 def get_api_keys():
-    """Get API keys from session state or local file"""
-    api_keys = {}
-    
-    # First check session state (for current session)
-    if "api_keys" in st.session_state:
-        api_keys = st.session_state.api_keys
-        return api_keys
-    
-    # Then try to load from file as fallback
+    """Get the current user's API keys from the in-memory key store cache"""
+    user_id = get_current_user_id()
+    if user_id is None:
+        return {}
+
+    key_store = get_key_store()
     try:
-        file_path = get_local_storage_path()
-        if file_path.exists():
-            with open(file_path, "r") as f:
-                api_keys = json.load(f)
-                # Also store in session state for faster access
-                st.session_state.api_keys = api_keys
+        import_legacy_keys(key_store, user_id)
+        return key_store.get_keys(user_id)
     except Exception as e:
         st.error(f"Error loading API keys: {str(e)}")
-    
-    return api_keys
+        return {}
 
 def save_api_key(provider, key):
-    """Save API key to session state and local file"""
-    # Save to session state
-    if "api_keys" not in st.session_state:
-        st.session_state.api_keys = {}
-    
-    st.session_state.api_keys[provider] = key
-    
-    # Also save to file for persistence
+    """Save an API key to the current user's encrypted key store"""
+    user_id = get_current_user_id()
+    if user_id is None:
+        st.error("Please log in to save API keys.")
+        return False
+
     try:
-        file_path = get_local_storage_path()
-        api_keys = get_api_keys()  # Get existing keys
-        api_keys[provider] = key  # Update with new key
-        
-        with open(file_path, "w") as f:
-            json.dump(api_keys, f)
-        
+        get_key_store().set_key(user_id, provider, key)
         st.success(f"{provider.capitalize()} API key saved successfully!")
         return True
     except Exception as e:
         st.error(f"Error saving API key: {str(e)}")
-        st.info("Your API key is saved for this session only.")
-        return False 
\ No newline at end of file
+        return False
+
+def import_legacy_keys(key_store, user_id):
+    """
+    Move keys from the old shared plaintext file into this user's store once
+
+    Only done when [key_store] import_legacy_file = true, since on a shared
+    server the old file may hold someone else's keys. The plaintext file is
+    deleted after the import.
+    """
+    if st.session_state.get("legacy_keys_checked"):
+        return
+    st.session_state.legacy_keys_checked = True
+
+    config = st.secrets.get("key_store", None) or {}
+    file_path = get_local_storage_path()
+    if not config.get("import_legacy_file") or not file_path.exists():
+        return
+
+    with open(file_path, "r") as f:
+        key_store.import_keys(user_id, json.load(f))
+    file_path.unlink()
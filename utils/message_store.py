@@ -0,0 +1,237 @@
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+import streamlit as st
+from utils.rate_limit import is_retryable
+
+logger = logging.getLogger(__name__)
+
+class MessageWriter:
+    """
+    Write-behind queue that saves chat messages to Supabase in bulk
+
+    Messages are queued in memory and a background thread flushes them as a
+    single insert once `batch_size` rows are waiting or `flush_interval`
+    seconds have passed. A batch failing with a transient error (rate limit,
+    server error, dropped connection) stays at the head of the queue and is
+    retried with exponential backoff, so rows of a chat are never reordered.
+    Any other error, or `max_attempts` transient ones, splits the batch into
+    single-row inserts, and rows that still fail (e.g. their chat was
+    deleted) are logged and dropped so they can't hold up everyone else's.
+    Listeners (e.g. the search index) are called with each saved batch.
+
+    Each row is inserted with the client it was queued with, normally the
+    session's own, so inserts pass row level security as the chat's owner.
+    """
+
+    def __init__(self, supabase, batch_size=50, flush_interval=1.0, max_backoff=30.0, max_attempts=8):
+        self.supabase = supabase
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.dropped = 0
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._last_timestamp = None
+        self._flushing = False
+        self._stopped = False
+        self._listeners = []
+        self._thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, chat_id, role, content, client=None):
+        """
+        Queue a message for saving and return the row that will be inserted
+
+        client is the Supabase client to insert it with; the writer's own
+        client is used without one.
+        """
+        with self._condition:
+            row = {
+                "chat_id": chat_id,
+                "role": role,
+                "content": content,
+                "created_at": self._next_timestamp().isoformat(),
+            }
+            self._queue.append((row, client))
+            if len(self._queue) >= self.batch_size:
+                self._condition.notify_all()
+        return row
+
+    def add_listener(self, listener):
+        """Call listener(rows) from the writer thread after each saved batch"""
+        with self._condition:
+            if listener not in self._listeners:
+                self._listeners.append(listener)
+
+    def pending(self):
+        """Number of messages not yet saved"""
+        with self._condition:
+            return len(self._queue)
+
+    def flush(self, timeout=10.0):
+        """Block until the queue is drained or timeout expires; returns True if drained"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            self._condition.notify_all()
+            while self._queue or self._flushing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def stop(self, timeout=10.0):
+        """Flush what is queued and stop the background thread"""
+        self.flush(timeout)
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+    def _next_timestamp(self):
+        # Strictly increasing timestamps keep created_at ordering stable even
+        # when two messages are queued within the same microsecond
+        now = datetime.now(timezone.utc)
+        if self._last_timestamp is not None and now <= self._last_timestamp:
+            now = self._last_timestamp + timedelta(microseconds=1)
+        self._last_timestamp = now
+        return now
+
+    def _run(self):
+        backoff = 0.5
+        attempts = 0
+        while True:
+            with self._condition:
+                # Wait for a full batch, the flush interval or an explicit flush
+                if len(self._queue) < self.batch_size and not self._stopped:
+                    self._condition.wait(self.flush_interval)
+                if self._stopped and not self._queue:
+                    return
+                if not self._queue:
+                    continue
+                # Consecutive rows queued with the same client go in one insert
+                client = self._queue[0][1]
+                batch = []
+                for row, row_client in self._queue:
+                    if row_client is not client or len(batch) >= self.batch_size:
+                        break
+                    batch.append(row)
+                client = client or self.supabase
+                self._flushing = True
+
+            try:
+                client.table("messages").insert(batch).execute()
+                saved = batch
+            except Exception as e:
+                attempts += 1
+                if is_retryable(e) and attempts < self.max_attempts:
+                    logger.warning("Saving %d messages failed, retrying in %.1fs: %s", len(batch), backoff, e)
+                    with self._condition:
+                        self._flushing = False
+                        self._condition.notify_all()
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+                    continue
+                logger.warning("Saving %d messages failed, saving them one at a time: %s", len(batch), e)
+                saved = self._insert_rows(client, batch)
+
+            backoff = 0.5
+            attempts = 0
+            with self._condition:
+                for _ in batch:
+                    self._queue.popleft()
+                self._flushing = False
+                self._condition.notify_all()
+                listeners = list(self._listeners)
+
+            if not saved:
+                continue
+            for listener in listeners:
+                try:
+                    listener(saved)
+                except Exception as e:
+                    logger.warning("Message listener failed: %s", e)
+
+    def _insert_rows(self, client, batch):
+        """Insert rows one by one, dropping those that fail; returns the saved rows"""
+        saved = []
+        for row in batch:
+            try:
+                client.table("messages").insert(row).execute()
+                saved.append(row)
+            except Exception as e:
+                self.dropped += 1
+                logger.error("Dropping message for chat %s that could not be saved: %s", row["chat_id"], e)
+        return saved
+
+def iter_chat_messages(supabase, chat_id, chunk_size=500):
+    """
+    Yield all of a chat's messages, oldest first, fetching them in keyset-paginated chunks
+
+    Yields {"id", "role", "content", "created_at"} rows; only one chunk is
+    held at a time, however long the chat is.
+    """
+    cursor = None
+    while True:
+        query = supabase.table("messages").select("id, role, content, created_at").eq("chat_id", chat_id)
+        if cursor is not None:
+            created_at, message_id = cursor
+            query = query.or_(
+                f'created_at.gt."{created_at}",and(created_at.eq."{created_at}",id.gt."{message_id}")'
+            )
+        response = query.order("created_at").order("id").limit(chunk_size).execute()
+        rows = response.data if hasattr(response, "data") else []
+
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        cursor = (rows[-1]["created_at"], rows[-1]["id"])
+
+def load_messages(supabase, chat_id, limit=50, before=None):
+    """
+    Load one page of a chat's messages, newest page first
+
+    Args:
+        supabase: Supabase client
+        chat_id: Chat to load
+        limit (int): Maximum number of messages in the page
+        before (tuple): (created_at, id) keyset cursor of the oldest message
+            already loaded, or None for the most recent page
+
+    Returns:
+        tuple: (messages oldest first as {"role", "content"} dicts, cursor for
+            the next older page or None when there are no older messages)
+    """
+    query = supabase.table("messages").select("id, role, content, created_at").eq("chat_id", chat_id)
+
+    if before is not None:
+        created_at, message_id = before
+        # Values are quoted because timestamps contain PostgREST reserved characters
+        query = query.or_(
+            f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt."{message_id}")'
+        )
+
+    # Fetch one extra row to know whether an older page exists
+    response = query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1).execute()
+    rows = response.data if hasattr(response, "data") else []
+
+    has_older = len(rows) > limit
+    rows = list(reversed(rows[:limit]))
+
+    messages = [{"role": row["role"], "content": row["content"]} for row in rows]
+    cursor = (rows[0]["created_at"], rows[0]["id"]) if has_older and rows else None
+    return messages, cursor
+
+@st.cache_resource
+def get_message_writer():
+    """Get the process-wide message writer, shared across reruns and sessions"""
+    from utils.supabase_client import init_supabase
+
+    writer = MessageWriter(init_supabase())
+    atexit.register(writer.stop)
+    return writer
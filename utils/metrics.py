@@ -0,0 +1,290 @@
+import json
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import streamlit as st
+from utils.context_window import count_message_tokens, count_tokens
+
+@dataclass
+class CallMetrics:
+    """Timing and token counts of one provider call"""
+    provider: str
+    model: str
+    started_at: float = field(default_factory=time.time)
+    connect_time: float = None
+    ttft: float = None
+    latency: float = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    tokens_per_sec: float = None
+    retries: int = 0
+    error_class: str = None
+    cached: bool = False
+    streamed: bool = False
+
+    def to_dict(self):
+        return asdict(self)
+
+@dataclass
+class CompletionResult:
+    """Completion text together with the metrics of the call that produced it"""
+    text: str
+    metrics: CallMetrics
+
+class CallTracker:
+    """
+    Measure one provider call and report it to the metrics sinks
+
+    connect_time is the time until the provider accepted the request and
+    returned response headers (only observable for streamed calls); ttft is
+    the time until the first text delta.
+    """
+
+    def __init__(self, provider, model, messages, cached=False, streamed=False):
+        self.metrics = CallMetrics(provider=provider, model=model, cached=cached, streamed=streamed)
+        self.metrics.prompt_tokens = count_message_tokens(messages)
+        self._start = time.perf_counter()
+
+    def connected(self):
+        if self.metrics.connect_time is None:
+            self.metrics.connect_time = time.perf_counter() - self._start
+
+    def first_token(self):
+        if self.metrics.ttft is None:
+            self.connected()
+            self.metrics.ttft = time.perf_counter() - self._start
+
+    def retried(self):
+        self.metrics.retries += 1
+
+    def finish(self, text=None, error=None):
+        """Complete the measurement, record it and return the metrics"""
+        metrics = self.metrics
+        metrics.latency = time.perf_counter() - self._start
+        if metrics.ttft is None and text:
+            metrics.ttft = metrics.latency
+        if text:
+            metrics.completion_tokens = count_tokens(text)
+            generation_time = metrics.latency - (metrics.ttft or 0)
+            if generation_time > 0 and metrics.streamed:
+                metrics.tokens_per_sec = metrics.completion_tokens / generation_time
+            elif metrics.latency > 0:
+                metrics.tokens_per_sec = metrics.completion_tokens / metrics.latency
+        if error is not None:
+            metrics.error_class = type(error).__name__
+        record_metrics(metrics)
+        return metrics
+
+class RingBufferSink:
+    """Keep the most recent call metrics in memory"""
+
+    def __init__(self, max_records=5000):
+        self._records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+
+    def record(self, metrics):
+        with self._lock:
+            self._records.append(metrics)
+
+    def records(self):
+        with self._lock:
+            return list(self._records)
+
+class JsonlSink:
+    """Append call metrics to a JSON Lines file"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def record(self, metrics):
+        line = json.dumps(metrics.to_dict())
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+def escape_label_value(value):
+    """Escape a Prometheus label value: backslashes, double quotes and newlines"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(**labels):
+    """Format Prometheus labels as name="value" pairs with escaped values"""
+    return ",".join(f'{name}="{escape_label_value(value)}"' for name, value in labels.items())
+
+class PrometheusSink:
+    """Aggregate call metrics as Prometheus counters and histograms"""
+
+    LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._cache_hits = {}
+        self._errors = {}
+        self._tokens = {}
+        self._histograms = {}
+
+    def record(self, metrics):
+        labels = (metrics.provider, metrics.model)
+        with self._lock:
+            self._calls[labels] = self._calls.get(labels, 0) + 1
+            if metrics.cached:
+                # Answered without calling the provider, so kept out of the latency histograms
+                self._cache_hits[labels] = self._cache_hits.get(labels, 0) + 1
+                return
+            if metrics.error_class:
+                key = labels + (metrics.error_class,)
+                self._errors[key] = self._errors.get(key, 0) + 1
+            for kind, count in (("prompt", metrics.prompt_tokens), ("completion", metrics.completion_tokens)):
+                key = labels + (kind,)
+                self._tokens[key] = self._tokens.get(key, 0) + count
+            for name, value in (("latency", metrics.latency), ("ttft", metrics.ttft)):
+                if value is None:
+                    continue
+                histogram = self._histograms.setdefault((name,) + labels, [[0] * len(self.LATENCY_BUCKETS), 0, 0.0])
+                for i, bound in enumerate(self.LATENCY_BUCKETS):
+                    if value <= bound:
+                        histogram[0][i] += 1
+                histogram[1] += 1
+                histogram[2] += value
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines.append("# TYPE chatbot_provider_calls_total counter")
+            for (provider, model), count in self._calls.items():
+                lines.append(f"chatbot_provider_calls_total{{{format_labels(provider=provider, model=model)}}} {count}")
+            lines.append("# TYPE chatbot_provider_cache_hits_total counter")
+            for (provider, model), count in self._cache_hits.items():
+                lines.append(f"chatbot_provider_cache_hits_total{{{format_labels(provider=provider, model=model)}}} {count}")
+            lines.append("# TYPE chatbot_provider_errors_total counter")
+            for (provider, model, error_class), count in self._errors.items():
+                labels = format_labels(provider=provider, model=model, error=error_class)
+                lines.append(f"chatbot_provider_errors_total{{{labels}}} {count}")
+            lines.append("# TYPE chatbot_provider_tokens_total counter")
+            for (provider, model, kind), count in self._tokens.items():
+                labels = format_labels(provider=provider, model=model, kind=kind)
+                lines.append(f"chatbot_provider_tokens_total{{{labels}}} {count}")
+            for name in ("latency", "ttft"):
+                metric = f"chatbot_provider_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for (hist_name, provider, model), (buckets, count, total) in self._histograms.items():
+                    if hist_name != name:
+                        continue
+                    labels = format_labels(provider=provider, model=model)
+                    for bound, bucket_count in zip(self.LATENCY_BUCKETS, buckets):
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {bucket_count}')
+                    lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {count}')
+                    lines.append(f"{metric}_count{{{labels}}} {count}")
+                    lines.append(f"{metric}_sum{{{labels}}} {total}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="0.0.0.0"):
+        """Serve /metrics on a background HTTP server for Prometheus to scrape"""
+        sink = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = sink.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        return server
+
+# Every process keeps an in-memory ring buffer for the admin panel
+_ring_buffer = RingBufferSink()
+_sinks = [_ring_buffer]
+_sinks_lock = threading.Lock()
+
+def add_metrics_sink(sink):
+    """Register another sink to receive every call's metrics"""
+    with _sinks_lock:
+        if sink not in _sinks:
+            _sinks.append(sink)
+
+@st.cache_resource
+def configure_metrics_sinks():
+    """
+    Register the sinks configured in the [metrics] section of Streamlit secrets
+
+    jsonl_path appends every call to a JSONL file and prometheus_port serves
+    a /metrics endpoint for scraping. Runs once per process.
+    """
+    config = st.secrets.get("metrics", None) or {}
+
+    if config.get("jsonl_path"):
+        add_metrics_sink(JsonlSink(config["jsonl_path"]))
+
+    if config.get("prometheus_port"):
+        sink = PrometheusSink()
+        add_metrics_sink(sink)
+        sink.serve(int(config["prometheus_port"]))
+
+    return True
+
+def record_metrics(metrics):
+    """Send call metrics to every registered sink"""
+    with _sinks_lock:
+        sinks = list(_sinks)
+    for sink in sinks:
+        try:
+            sink.record(metrics)
+        except Exception:
+            # Metrics must never break a chat turn
+            pass
+
+def get_recent_metrics():
+    """Get the call metrics kept in this process's ring buffer"""
+    return _ring_buffer.records()
+
+def percentile(values, q):
+    """Get the q-th percentile (0-100) of values by linear interpolation"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def summarize_metrics(records):
+    """Aggregate call metrics into one row of percentiles per provider/model"""
+    groups = {}
+    for metrics in records:
+        groups.setdefault((metrics.provider, metrics.model), []).append(metrics)
+
+    rows = []
+    for (provider, model), calls in sorted(groups.items()):
+        # Cache hits never reach the provider, so they would drag its percentiles down
+        provider_calls = [m for m in calls if not m.cached and not m.error_class]
+        latencies = [m.latency for m in provider_calls if m.latency is not None]
+        ttfts = [m.ttft for m in provider_calls if m.ttft is not None]
+        rates = [m.tokens_per_sec for m in provider_calls if m.tokens_per_sec]
+        rows.append({
+            "provider": provider,
+            "model": model,
+            "calls": len(calls),
+            "errors": sum(1 for m in calls if m.error_class),
+            "cache hits": sum(1 for m in calls if m.cached),
+            "p50 latency (s)": percentile(latencies, 50),
+            "p95 latency (s)": percentile(latencies, 95),
+            "p99 latency (s)": percentile(latencies, 99),
+            "p50 TTFT (s)": percentile(ttfts, 50),
+            "p95 TTFT (s)": percentile(ttfts, 95),
+            "p99 TTFT (s)": percentile(ttfts, 99),
+            "tokens/s": sum(rates) / len(rates) if rates else None,
+        })
+    return rows
@@ -0,0 +1,303 @@
+import difflib
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+import streamlit as st
+from utils.client_pool import hash_api_key
+from utils.context_window import get_context_limit
+from utils.provider_registry import get_adapter, get_capabilities
+
+# Seconds a fetched model list is used before it is refreshed in the background
+CATALOG_TTL = 86400
+
+# Seconds before a failed fetch is tried again
+FAILED_FETCH_RETRY = 300
+
+# Models offered before a provider's list has been fetched, or when it has no models endpoint
+KNOWN_MODELS = {
+    "openai": [
+        "gpt-4o", "gpt-4o-mini", "o1", "o1-mini", "o1-preview", "o3-mini",
+        "gpt-4-turbo", "gpt-4", "gpt-3.5-turbo",
+    ],
+    "anthropic": [
+        "claude-3-5-sonnet-20241022", "claude-3-5-sonnet-20240620", "claude-3-5-haiku-20241022",
+        "claude-3-opus-20240229", "claude-3-sonnet-20240229", "claude-3-haiku-20240307",
+    ],
+    "google": ["gemini-1.5-pro", "gemini-1.5-flash"],
+    "perplexity": ["sonar", "sonar-pro", "sonar-reasoning", "sonar-reasoning-pro"],
+    "meta": [
+        "meta-llama/Llama-3.3-70B-Instruct-Turbo",
+        "meta-llama/Llama-3.2-90B-Vision-Instruct-Turbo",
+        "meta-llama/Meta-Llama-3.1-405B-Instruct-Turbo",
+        "meta-llama/Meta-Llama-3-70B-Instruct-Turbo",
+    ],
+    "mistral": [
+        "mistral-large-latest", "mistral-small-latest", "codestral-latest",
+        "open-mistral-nemo", "ministral-8b-latest",
+    ],
+}
+
+# USD per million (input, output) tokens, matched by longest model name prefix,
+# for providers whose models endpoint does not report prices
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "o1-mini": (1.10, 4.40),
+    "o1": (15.00, 60.00),
+    "o3-mini": (1.10, 4.40),
+    "claude-3-5-sonnet": (3.00, 15.00),
+    "claude-3-5-haiku": (0.80, 4.00),
+    "claude-3-opus": (15.00, 75.00),
+    "claude-3-sonnet": (3.00, 15.00),
+    "claude-3-haiku": (0.25, 1.25),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "sonar-pro": (3.00, 15.00),
+    "sonar": (1.00, 1.00),
+    "mistral-large": (2.00, 6.00),
+    "mistral-small": (0.20, 0.60),
+}
+
+# Parts of model ids that mark embedding, speech, image and moderation models, which can't chat
+NON_CHAT_MARKERS = (
+    "embed", "whisper", "tts", "dall-e", "moderation", "transcribe", "image", "davinci", "babbage", "rerank",
+)
+
+@dataclass
+class ModelInfo:
+    """A model in the catalog, with its context window, streaming support and prices"""
+    id: str
+    context_length: int = None
+    streaming: bool = True
+    input_price: float = None
+    output_price: float = None
+
+def get_model_prices(model):
+    """Get a model's known (input, output) USD per million tokens, or (None, None)"""
+    name = model.lower()
+    matches = [prefix for prefix in MODEL_PRICES if name.startswith(prefix)]
+    if not matches:
+        return None, None
+    return MODEL_PRICES[max(matches, key=len)]
+
+def build_model_info(provider, item):
+    """Fill in what a provider's model listing leaves out from the built-in tables"""
+    known_input, known_output = get_model_prices(item["id"])
+    streaming = item.get("streaming")
+    return ModelInfo(
+        id=item["id"],
+        context_length=item.get("context_length") or get_context_limit(item["id"], provider),
+        streaming=get_capabilities(provider).streaming if streaming is None else streaming,
+        input_price=item.get("input_price") if item.get("input_price") is not None else known_input,
+        output_price=item.get("output_price") if item.get("output_price") is not None else known_output,
+    )
+
+def is_chat_model(model_id):
+    name = model_id.lower()
+    return not any(marker in name for marker in NON_CHAT_MARKERS)
+
+def is_listed(model, model_ids):
+    """Whether a model name is one of model_ids or an alias of one"""
+    if model in model_ids:
+        return True
+    # "-latest" and ":tag" name the newest of a family whose members are listed by full id
+    base = model[:-len("-latest")] if model.endswith("-latest") else model.split(":", 1)[0]
+    return any(
+        model_id == base or model_id.startswith(base + "-") or model_id.startswith(base + ":")
+        for model_id in model_ids
+    )
+
+def describe_model(info):
+    """One-line summary of a model's limits and prices for the UI"""
+    parts = []
+    if info.context_length:
+        parts.append(f"{info.context_length:,} token context")
+    if info.input_price is not None and info.output_price is not None:
+        parts.append(f"${info.input_price:g} / ${info.output_price:g} per 1M tokens in / out")
+    parts.append("streaming" if info.streaming else "no streaming")
+    return " · ".join(parts)
+
+class ModelCatalog:
+    """
+    Index of the models each provider key can use
+
+    Lists come from the providers' models endpoints and are cached in memory
+    and on disk, one file per provider and key hash, for `ttl` seconds.
+    Lookups never wait on the network: a missing or stale list is fetched on
+    a background thread while the cached (or built-in) list is served.
+    """
+
+    def __init__(self, directory=None, ttl=CATALOG_TTL):
+        self.directory = Path(directory) if directory else Path.home() / ".streamlit_chatbot" / "models"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._entries = {}
+        self._failed_at = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get_models(self, provider, api_key):
+        """Get the models for this provider and key from the cache, or the built-in list before the first fetch"""
+        entry = self._get_entry(provider, api_key)
+        if entry is None:
+            return [build_model_info(provider, {"id": model}) for model in KNOWN_MODELS.get(provider, [])]
+        return list(entry["models"].values())
+
+    def get_model_info(self, provider, model, api_key):
+        """Get one model's catalog entry, falling back to the built-in tables"""
+        entry = self._get_entry(provider, api_key)
+        if entry is not None and model in entry["models"]:
+            return entry["models"][model]
+        return build_model_info(provider, {"id": model})
+
+    def validate(self, provider, model, api_key):
+        """
+        Check a model name against the provider's list for this key
+
+        Aliases of listed models (claude-3-5-haiku-latest for a dated
+        snapshot, an Ollama name:tag) count as listed. Keys can often use
+        models their list doesn't show, so callers should treat the result as
+        a warning rather than refuse the name.
+
+        Returns a message, or None if the name is listed or there is no
+        fetched list to check it against yet.
+        """
+        if not model or not model.strip():
+            return "Enter a model name."
+        entry = self._get_entry(provider, api_key)
+        if entry is None or not entry["live"] or is_listed(model, entry["models"]):
+            return None
+        suggestions = difflib.get_close_matches(model, list(entry["models"]), n=3, cutoff=0.6)
+        message = f"{provider} has no model named '{model}' for this API key."
+        if suggestions:
+            message += f" Did you mean {', '.join(suggestions)}?"
+        return message
+
+    def refresh(self, provider, api_key):
+        """Fetch a provider's model list now and cache it"""
+        key = (provider, hash_api_key(api_key))
+        try:
+            items = [item for item in get_adapter(provider).list_models(api_key) if is_chat_model(item["id"])]
+            live = True
+        except NotImplementedError:
+            # No models endpoint: cache the built-in list so it isn't asked again until the TTL passes
+            items = [{"id": model} for model in KNOWN_MODELS.get(provider, [])]
+            live = False
+        except Exception:
+            with self._lock:
+                self._failed_at[key] = time.time()
+            raise
+
+        entry = {
+            "fetched_at": time.time(),
+            "live": live,
+            "models": {item["id"]: build_model_info(provider, item) for item in sorted(items, key=lambda i: i["id"])},
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._failed_at.pop(key, None)
+        self._save(key, entry)
+        return list(entry["models"].values())
+
+    def refresh_in_background(self, provider, api_key):
+        """Start a refresh on a worker thread unless one is already running for this key"""
+        key = (provider, hash_api_key(api_key))
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self.refresh(provider, api_key)
+            except Exception:
+                # Served from the cache (or built-in list) until the retry delay passes
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name=f"model-catalog-{provider}", daemon=True).start()
+
+    def _get_entry(self, provider, api_key):
+        key = (provider, hash_api_key(api_key))
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            entry = self._load(key)
+            if entry is not None:
+                with self._lock:
+                    self._entries.setdefault(key, entry)
+
+        now = time.time()
+        stale = entry is None or now - entry["fetched_at"] > self.ttl
+        recently_failed = now - self._failed_at.get(key, 0) < FAILED_FETCH_RETRY
+        needs_key = get_capabilities(provider).requires_api_key
+        if stale and not recently_failed and (api_key or not needs_key):
+            self.refresh_in_background(provider, api_key)
+        return entry
+
+    def _path(self, key):
+        provider, key_hash = key
+        return self.directory / f"{provider}-{key_hash}.json"
+
+    def _load(self, key):
+        try:
+            data = json.loads(self._path(key).read_text())
+        except (OSError, ValueError):
+            return None
+        return {
+            "fetched_at": data["fetched_at"],
+            "live": data["live"],
+            "models": {item["id"]: ModelInfo(**item) for item in data["models"]},
+        }
+
+    def _save(self, key, entry):
+        data = {
+            "fetched_at": entry["fetched_at"],
+            "live": entry["live"],
+            "models": [asdict(info) for info in entry["models"].values()],
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-", suffix=".json")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+@st.cache_resource
+def get_model_catalog():
+    """
+    Get the process-wide model catalog
+
+    An optional [model_catalog] section in Streamlit secrets sets `path` (the
+    cache directory) and `ttl` (seconds between refreshes).
+    """
+    config = st.secrets.get("model_catalog", None) or {}
+    return ModelCatalog(config.get("path"), ttl=int(config.get("ttl", CATALOG_TTL)))
+
+def get_context_length(provider, model, api_key):
+    """
+    Get a model's context window without waiting on the network
+
+    Uses the length the provider's model list reported, then the built-in
+    table, then the provider's declared context size.
+    """
+    try:
+        catalog = get_model_catalog()
+    except Exception:
+        # No catalog outside a configured app, e.g. in benchmarks
+        return get_context_limit(model, provider)
+    return catalog.get_model_info(provider, model, api_key).context_length
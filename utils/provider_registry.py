@@ -0,0 +1,138 @@
+import importlib
+import os
+import threading
+import time
+from dataclasses import dataclass, field, replace
+
+@dataclass
+class ProviderCapabilities:
+    """What a provider backend supports, known without importing its SDK"""
+    streaming: bool = True
+    system_prompt: bool = True
+    tools: bool = False
+    batch: bool = False
+    context_size: int = 8192
+    requires_api_key: bool = True
+
+@dataclass
+class ProviderSpec:
+    """Where a provider's adapter lives and how to build it"""
+    module: str
+    adapter: str
+    capabilities: ProviderCapabilities = field(default_factory=ProviderCapabilities)
+    base_url: str = None
+    label: str = None
+
+OPENAI_MODULE = "utils.providers.openai_provider"
+
+# Adapter modules are imported on first use so a worker only pays for the SDKs
+# its sessions actually call (google.generativeai alone pulls in protobuf and grpc)
+PROVIDERS = {
+    "openai": ProviderSpec(
+        OPENAI_MODULE, "OpenAIAdapter",
+        ProviderCapabilities(tools=True, batch=True, context_size=128000),
+        label="OpenAI"
+    ),
+    "anthropic": ProviderSpec(
+        "utils.providers.anthropic_provider", "AnthropicAdapter",
+        ProviderCapabilities(tools=True, batch=True, context_size=200000),
+        label="Anthropic"
+    ),
+    "google": ProviderSpec(
+        "utils.providers.google_provider", "GoogleAdapter",
+        ProviderCapabilities(tools=True, context_size=1000000),
+        label="Google AI"
+    ),
+    "perplexity": ProviderSpec(
+        "utils.providers.perplexity_provider", "PerplexityAdapter",
+        ProviderCapabilities(context_size=127072),
+        label="Perplexity"
+    ),
+    "mistral": ProviderSpec(
+        OPENAI_MODULE, "OpenAIAdapter",
+        # Mistral's batch API is not OpenAI's, and the OpenAI adapter only batches against OpenAI itself
+        ProviderCapabilities(tools=True, context_size=32768),
+        base_url=os.environ.get("MISTRAL_BASE_URL", "https://api.mistral.ai/v1"),
+        label="Mistral"
+    ),
+    # Hosted Llama models (Together by default; Fireworks and similar hosts via META_BASE_URL)
+    "meta": ProviderSpec(
+        OPENAI_MODULE, "OpenAIAdapter",
+        ProviderCapabilities(tools=True, context_size=128000),
+        base_url=os.environ.get("META_BASE_URL", "https://api.together.xyz/v1"),
+        label="Meta Llama"
+    ),
+}
+
+PROVIDER_ALIASES = {
+    "llama": "meta",
+}
+
+_adapters = {}
+_import_times = {}
+_lock = threading.Lock()
+
+def register_provider(name, spec):
+    """Register (or replace) a provider backend"""
+    with _lock:
+        PROVIDERS[name] = spec
+        _adapters.pop(name, None)
+
+def register_openai_compatible(name, base_url, requires_api_key=False, context_size=32768, label=None):
+    """Register a server that speaks the OpenAI chat API, e.g. a local vLLM or Ollama"""
+    register_provider(name, ProviderSpec(
+        OPENAI_MODULE, "OpenAIAdapter",
+        ProviderCapabilities(requires_api_key=requires_api_key, context_size=context_size),
+        base_url=base_url,
+        label=label or name
+    ))
+
+def list_providers():
+    """Get the names of all registered providers"""
+    return list(PROVIDERS)
+
+def get_provider_spec(name):
+    """
+    Get a provider's spec
+
+    Unregistered names are treated as OpenAI-compatible servers whose base URL
+    is read from the environment, e.g. OLLAMA_BASE_URL for provider "ollama".
+    """
+    name = PROVIDER_ALIASES.get(name, name)
+    spec = PROVIDERS.get(name)
+    if spec is not None:
+        return spec
+
+    base_url = os.environ.get(f"{name.upper()}_BASE_URL")
+    if not base_url:
+        raise ValueError(f"No base URL configured for provider '{name}'. Set {name.upper()}_BASE_URL.")
+    return ProviderSpec(OPENAI_MODULE, "OpenAIAdapter", ProviderCapabilities(requires_api_key=False), base_url=base_url)
+
+def get_capabilities(name):
+    """Get a provider's capabilities without importing its SDK"""
+    try:
+        return get_provider_spec(name).capabilities
+    except ValueError:
+        return replace(ProviderCapabilities(), requires_api_key=False)
+
+def get_adapter(name):
+    """Get a provider's adapter, importing its module (and SDK) on first use"""
+    adapter = _adapters.get(name)
+    if adapter is not None:
+        return adapter
+
+    spec = get_provider_spec(name)
+    with _lock:
+        adapter = _adapters.get(name)
+        if adapter is None:
+            start = time.perf_counter()
+            module = importlib.import_module(spec.module)
+            _import_times.setdefault(spec.module, time.perf_counter() - start)
+            adapter = getattr(module, spec.adapter)(name, spec.capabilities, base_url=spec.base_url)
+            _adapters[name] = adapter
+    return adapter
+
+def get_import_times():
+    """Get the seconds each provider module took to import in this process"""
+    with _lock:
+        return dict(_import_times)
@@ -0,0 +1,141 @@
+from anthropic import Anthropic, AsyncAnthropic
+from utils.client_pool import get_client_pool
+from utils.context_window import count_tokens
+from utils.providers.base import ProviderAdapter, merge_turns
+
+def get_anthropic_client(api_key):
+    """Get a pooled Anthropic client"""
+    return get_client_pool().get("anthropic", api_key, None, lambda: Anthropic(api_key=api_key, max_retries=0))
+
+# Anthropic ignores cache breakpoints on shorter prefixes (2048 tokens for Haiku models)
+MIN_CACHE_TOKENS = 1024
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+def convert_anthropic_messages(messages):
+    """
+    Convert messages to Anthropic format, returning (system, messages)
+    
+    Long stable prefixes get prompt-caching breakpoints: the system prompt,
+    the previous user turn (read from the cache written on the last turn)
+    and the latest user turn (written for the next one).
+    """
+    system_text, turns = merge_turns(messages)
+    
+    system = [{"type": "text", "text": system_text}] if system_text else []
+    anthropic_messages = [
+        {"role": turn["role"], "content": [{"type": "text", "text": turn["content"]}]}
+        for turn in turns
+    ]
+    
+    prefix_tokens = count_tokens(system_text)
+    if prefix_tokens >= MIN_CACHE_TOKENS:
+        system[0]["cache_control"] = CACHE_CONTROL
+    
+    prefix_lengths = []
+    for turn in turns:
+        prefix_tokens += count_tokens(turn["content"])
+        prefix_lengths.append(prefix_tokens)
+    
+    user_indexes = [i for i, turn in enumerate(turns) if turn["role"] == "user"]
+    for index in user_indexes[-2:]:
+        if prefix_lengths[index] >= MIN_CACHE_TOKENS:
+            anthropic_messages[index]["content"][-1]["cache_control"] = CACHE_CONTROL
+    
+    return system, anthropic_messages
+
+def build_request(model, messages):
+    """Build the keyword arguments of a Messages API call"""
+    system, anthropic_messages = convert_anthropic_messages(messages)
+    request = {"model": model, "messages": anthropic_messages, "max_tokens": 1024}
+    if system:
+        request["system"] = system
+    return request
+
+def get_completion(model, messages, api_key, base_url=None):
+    """Get completion from Anthropic"""
+    client = get_anthropic_client(api_key)
+    
+    response = client.messages.create(**build_request(model, messages))
+    
+    return response.content[0].text
+
+def stream_completion(model, messages, api_key, base_url=None, on_connect=None):
+    """Stream completion from Anthropic"""
+    client = get_anthropic_client(api_key)
+    
+    with client.messages.stream(**build_request(model, messages)) as stream:
+        if on_connect:
+            on_connect()
+        for text in stream.text_stream:
+            yield text
+
+async def aget_completion(model, messages, api_key, base_url=None):
+    """Get completion from Anthropic without blocking the event loop"""
+    request = build_request(model, messages)
+    
+    async with AsyncAnthropic(api_key=api_key, max_retries=0) as client:
+        response = await client.messages.create(**request)
+    
+    return response.content[0].text
+
+def list_models(api_key):
+    """List the Claude models available to this key"""
+    client = get_anthropic_client(api_key)
+    
+    return [
+        {
+            "id": model.id,
+            "context_length": getattr(model, "max_input_tokens", None),
+            "streaming": True,
+            "input_price": None,
+            "output_price": None,
+        }
+        for model in client.models.list(limit=1000)
+    ]
+
+def submit_batch(requests, api_key):
+    """Start an Anthropic Message Batch"""
+    client = get_anthropic_client(api_key)
+    
+    batch = client.messages.batches.create(requests=[
+        {"custom_id": custom_id, "params": build_request(model, messages)}
+        for custom_id, model, messages in requests
+    ])
+    return batch.id
+
+def get_batch_results(batch_id, api_key):
+    """Get the results of an ended Anthropic Message Batch, or None while it is processing"""
+    client = get_anthropic_client(api_key)
+    
+    if client.messages.batches.retrieve(batch_id).processing_status != "ended":
+        return None
+    
+    results = []
+    for entry in client.messages.batches.results(batch_id):
+        if entry.result.type == "succeeded":
+            results.append((entry.custom_id, entry.result.message.content[0].text, None))
+        elif entry.result.type == "errored":
+            results.append((entry.custom_id, None, str(entry.result.error)))
+        else:
+            results.append((entry.custom_id, None, f"Request {entry.result.type}"))
+    return results
+
+class AnthropicAdapter(ProviderAdapter):
+    def complete(self, model, messages, api_key):
+        return get_completion(model, messages, api_key)
+    
+    def stream(self, model, messages, api_key, on_connect=None):
+        return stream_completion(model, messages, api_key, on_connect=on_connect)
+    
+    async def acomplete(self, model, messages, api_key):
+        return await aget_completion(model, messages, api_key)
+    
+    def list_models(self, api_key):
+        return list_models(api_key)
+    
+    def submit_batch(self, requests, api_key):
+        return submit_batch(requests, api_key)
+    
+    def get_batch_results(self, batch_id, api_key):
+        return get_batch_results(batch_id, api_key)
@@ -0,0 +1,81 @@
+import asyncio
+
+class ProviderAdapter:
+    """
+    Shared interface of every provider backend
+
+    Subclasses implement complete(); stream() and acomplete() fall back to
+    a single delta and a worker thread when a backend has no native version.
+    """
+
+    def __init__(self, name, capabilities, base_url=None):
+        self.name = name
+        self.capabilities = capabilities
+        self.base_url = base_url
+
+    def complete(self, model, messages, api_key):
+        """Get the full completion text"""
+        raise NotImplementedError
+
+    def stream(self, model, messages, api_key, on_connect=None):
+        """Yield completion text deltas"""
+        response = self.complete(model, messages, api_key)
+        if on_connect:
+            on_connect()
+        if response:
+            yield response
+
+    async def acomplete(self, model, messages, api_key):
+        """Get the full completion text without blocking the event loop"""
+        return await asyncio.to_thread(self.complete, model, messages, api_key)
+
+    def list_models(self, api_key):
+        """
+        Get the models this key can use
+
+        Returns [{"id", "context_length", "streaming", "input_price", "output_price"}]
+        with None for anything the provider does not report (prices are USD per
+        million tokens). Backends without a models endpoint raise NotImplementedError.
+        """
+        raise NotImplementedError(f"{self.name} has no models endpoint")
+
+    def submit_batch(self, requests, api_key):
+        """
+        Submit [(custom_id, model, messages)] to the provider's discounted batch API
+
+        Returns the batch id. Backends without a batch API raise NotImplementedError.
+        """
+        raise NotImplementedError(f"{self.name} has no batch API")
+
+    def get_batch_results(self, batch_id, api_key):
+        """Get [(custom_id, text, error)] once a batch has ended, or None while it is still running"""
+        raise NotImplementedError(f"{self.name} has no batch API")
+
+def merge_turns(messages, assistant_role="assistant"):
+    """
+    Split a chat history into system text and strictly alternating turns
+
+    System messages are joined into one instruction, consecutive turns from
+    the same role are merged, and leading assistant turns are dropped since
+    Anthropic and Gemini both require the conversation to open with the user.
+
+    Returns:
+        tuple: (system text, [{"role": "user" | assistant_role, "content": str}, ...])
+    """
+    system_parts = []
+    turns = []
+    for msg in messages:
+        if msg["role"] == "system":
+            system_parts.append(msg["content"])
+            continue
+        role = "user" if msg["role"] == "user" else assistant_role
+        if not turns and role != "user":
+            continue
+        if turns and turns[-1]["role"] == role:
+            turns[-1]["content"] = f"{turns[-1]['content']}\n\n{msg['content']}"
+        else:
+            turns.append({"role": role, "content": msg["content"]})
+
+    if not turns:
+        raise ValueError("No user messages found")
+    return "\n\n".join(system_parts), turns
@@ -0,0 +1,197 @@
+import asyncio
+import datetime
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import Future
+import google.generativeai as genai
+from google.ai import generativelanguage as glm
+from utils.client_pool import get_client_pool, hash_api_key
+from utils.context_window import count_tokens
+from utils.providers.base import ProviderAdapter, merge_turns
+
+# Point Gemini elsewhere (e.g. the mock server in benchmarks/) over REST
+GEMINI_BASE_URL = os.environ.get("GEMINI_BASE_URL")
+
+# Gemini only accepts cached content above a minimum size, so shorter system prompts are sent inline
+CACHE_MIN_TOKENS = 32768
+
+# Lifetime of a cached system prompt; it is recreated shortly before it expires
+CACHE_TTL = 3600
+CACHE_REFRESH_MARGIN = 120
+
+_cached_contents = {}
+_creating_contents = {}
+_cached_contents_lock = threading.Lock()
+
+def get_cached_content(model, api_key, system_instruction):
+    """
+    Get the Gemini cached content holding a long system prompt
+    
+    Caches are shared by every session using the same key, model and prompt.
+    Returns None when the prompt is too short or the model does not support
+    caching, in which case the prompt is sent inline. The cache is created
+    outside the module lock, so a slow create only holds up callers waiting
+    for the same prompt; while one is being renewed the old one keeps serving.
+    """
+    if GEMINI_BASE_URL or count_tokens(system_instruction) < CACHE_MIN_TOKENS:
+        return None
+    
+    key = (hash_api_key(api_key), model, hashlib.sha256(system_instruction.encode("utf-8")).hexdigest())
+    now = time.time()
+    with _cached_contents_lock:
+        entry = _cached_contents.get(key)
+        if entry is not None and entry[1] - now > CACHE_REFRESH_MARGIN:
+            return entry[0]
+        
+        # Another thread may already be creating this prompt's cache
+        future = _creating_contents.get(key)
+        owner = future is None
+        if owner:
+            future = Future()
+            _creating_contents[key] = future
+        elif entry is not None and entry[1] > now:
+            return entry[0]
+    
+    if not owner:
+        return future.result()
+    
+    try:
+        cache_client = get_client_pool().get(
+            "google-cache", api_key, None,
+            lambda: glm.CacheServiceClient(client_options={"api_key": api_key})
+        )
+        cached = cache_client.create_cached_content(cached_content=glm.CachedContent(
+            model=model if model.startswith("models/") else f"models/{model}",
+            system_instruction=glm.Content(parts=[glm.Part(text=system_instruction)]),
+            ttl=datetime.timedelta(seconds=CACHE_TTL)
+        ))
+    except Exception:
+        # Not every model supports caching; don't retry on every turn
+        cached = None
+    
+    with _cached_contents_lock:
+        _cached_contents[key] = (cached, time.time() + CACHE_TTL)
+        del _creating_contents[key]
+    future.set_result(cached)
+    return cached
+
+def get_google_model(model, api_key, system_instruction=None):
+    """Get a Gemini model bound to a pooled per-key client, with its system prompt"""
+    
+    def create_client():
+        if GEMINI_BASE_URL:
+            return glm.GenerativeServiceClient(
+                client_options={"api_key": api_key, "api_endpoint": GEMINI_BASE_URL},
+                transport="rest"
+            )
+        return glm.GenerativeServiceClient(client_options={"api_key": api_key})
+    
+    client = get_client_pool().get("google", api_key, GEMINI_BASE_URL, create_client)
+    
+    # genai.configure() sets one process-wide key, which is unsafe when sessions
+    # use different keys, so hand the model its own client instead
+    cached_content = get_cached_content(model, api_key, system_instruction) if system_instruction else None
+    gemini_model = build_gemini_model(model, system_instruction, cached_content)
+    gemini_model._client = client
+    return gemini_model
+
+def build_gemini_model(model, system_instruction=None, cached_content=None):
+    """Build a Gemini model with its system prompt inline or, when cached_content is given, from the cache"""
+    if cached_content:
+        # The system prompt lives in the cache, so it is not sent again. Passing
+        # the created resource (name and model) rather than its name avoids a
+        # lookup through the process-wide default client.
+        return genai.GenerativeModel.from_cached_content(cached_content)
+    return genai.GenerativeModel(model, system_instruction=system_instruction or None)
+
+def convert_gemini_messages(messages):
+    """Convert messages to Gemini format, returning (system instruction, contents)"""
+    system_instruction, turns = merge_turns(messages, assistant_role="model")
+    contents = [{"role": turn["role"], "parts": [{"text": turn["content"]}]} for turn in turns]
+    return system_instruction, contents
+
+def get_completion(model, messages, api_key, base_url=None):
+    """Get completion from Google Gemini"""
+    system_instruction, gemini_messages = convert_gemini_messages(messages)
+    
+    model = get_google_model(model, api_key, system_instruction)
+    response = model.generate_content(gemini_messages)
+    
+    return response.text
+
+def stream_completion(model, messages, api_key, base_url=None, on_connect=None):
+    """Stream completion from Google Gemini"""
+    system_instruction, gemini_messages = convert_gemini_messages(messages)
+    
+    model = get_google_model(model, api_key, system_instruction)
+    response = model.generate_content(gemini_messages, stream=True)
+    if on_connect:
+        on_connect()
+    
+    for chunk in response:
+        # Chunks without candidates (e.g. safety feedback only) have no text
+        if chunk.candidates and chunk.candidates[0].content.parts:
+            yield chunk.text
+
+async def aget_completion(model, messages, api_key, base_url=None):
+    """Get completion from Google Gemini without blocking the event loop"""
+    if GEMINI_BASE_URL:
+        # The async client only speaks gRPC, so an overridden REST endpoint is served by the sync path
+        return await asyncio.to_thread(get_completion, model, messages, api_key)
+    
+    system_instruction, gemini_messages = convert_gemini_messages(messages)
+    
+    # Creating the prompt cache is a blocking call, shared with the sync path
+    cached_content = None
+    if system_instruction:
+        cached_content = await asyncio.to_thread(get_cached_content, model, api_key, system_instruction)
+    gemini_model = build_gemini_model(model, system_instruction, cached_content)
+    
+    # A per-key async client instead of the process-wide genai.configure() key.
+    # Its gRPC channel is tied to this event loop, so it is closed, not pooled.
+    async with glm.GenerativeServiceAsyncClient(client_options={"api_key": api_key}) as async_client:
+        gemini_model._async_client = async_client
+        response = await gemini_model.generate_content_async(gemini_messages)
+    
+    return response.text
+
+def list_models(api_key):
+    """List the Gemini models this key can generate content with"""
+    
+    def create_client():
+        if GEMINI_BASE_URL:
+            return glm.ModelServiceClient(
+                client_options={"api_key": api_key, "api_endpoint": GEMINI_BASE_URL},
+                transport="rest"
+            )
+        return glm.ModelServiceClient(client_options={"api_key": api_key})
+    
+    client = get_client_pool().get("google-models", api_key, GEMINI_BASE_URL, create_client)
+    
+    models = []
+    for model in client.list_models(glm.ListModelsRequest(page_size=1000)):
+        if "generateContent" not in model.supported_generation_methods:
+            continue
+        models.append({
+            "id": model.name.removeprefix("models/"),
+            "context_length": model.input_token_limit or None,
+            "streaming": True,
+            "input_price": None,
+            "output_price": None,
+        })
+    return models
+
+class GoogleAdapter(ProviderAdapter):
+    def complete(self, model, messages, api_key):
+        return get_completion(model, messages, api_key)
+    
+    def stream(self, model, messages, api_key, on_connect=None):
+        return stream_completion(model, messages, api_key, on_connect=on_connect)
+    
+    async def acomplete(self, model, messages, api_key):
+        return await aget_completion(model, messages, api_key)
+    
+    def list_models(self, api_key):
+        return list_models(api_key)
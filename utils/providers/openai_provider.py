@@ -0,0 +1,145 @@
+import json
+import openai
+from utils.client_pool import get_client_pool
+from utils.providers.base import ProviderAdapter
+
+def get_openai_client(api_key, base_url=None):
+    """Get a pooled OpenAI client (or one for an OpenAI-compatible base URL)"""
+    # SDK retries are off; utils.rate_limit retries with backoff shared across the key
+    return get_client_pool().get(
+        "openai", api_key, base_url,
+        lambda: openai.OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+    )
+
+def get_completion(model, messages, api_key, base_url=None):
+    """Get completion from OpenAI (or any OpenAI-compatible base URL)"""
+    client = get_openai_client(api_key, base_url=base_url)
+    
+    response = client.chat.completions.create(
+        model=model,
+        messages=messages,
+    )
+    
+    return response.choices[0].message.content
+
+def stream_completion(model, messages, api_key, base_url=None, on_connect=None):
+    """Stream completion from OpenAI (or any OpenAI-compatible base URL)"""
+    client = get_openai_client(api_key, base_url=base_url)
+    
+    stream = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        stream=True,
+    )
+    if on_connect:
+        on_connect()
+    
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+async def aget_completion(model, messages, api_key, base_url=None):
+    """Get completion from OpenAI without blocking the event loop"""
+    # Async clients are bound to the loop that created them, so they are not pooled
+    async with openai.AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0) as client:
+        response = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+        )
+    
+    return response.choices[0].message.content
+
+def list_models(api_key, base_url=None):
+    """List models from /models, with the context and pricing fields some OpenAI-compatible hosts add"""
+    client = get_openai_client(api_key, base_url=base_url)
+    
+    models = []
+    for model in client.models.list():
+        extra = model.model_extra or {}
+        pricing = extra.get("pricing") or {}
+        models.append({
+            "id": model.id,
+            "context_length": extra.get("context_length") or extra.get("max_context_length"),
+            "streaming": None,
+            "input_price": pricing.get("input"),
+            "output_price": pricing.get("output"),
+        })
+    return models
+
+def submit_batch(requests, api_key, base_url=None):
+    """Upload requests as a JSONL file and start an OpenAI Batch job"""
+    client = get_openai_client(api_key, base_url=base_url)
+    
+    lines = [
+        json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {"model": model, "messages": messages},
+        })
+        for custom_id, model, messages in requests
+    ]
+    batch_file = client.files.create(file=("batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch")
+    batch = client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    return batch.id
+
+def get_batch_results(batch_id, api_key, base_url=None):
+    """Get the results of a finished OpenAI Batch job, or None while it is running"""
+    client = get_openai_client(api_key, base_url=base_url)
+    
+    batch = client.batches.retrieve(batch_id)
+    if batch.status not in ("completed", "failed", "expired", "cancelled"):
+        return None
+    
+    results = []
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        for line in client.files.content(file_id).text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            body = response.get("body") or {}
+            if response.get("status_code") == 200:
+                results.append((item["custom_id"], body["choices"][0]["message"]["content"], None))
+            else:
+                error = item.get("error") or body.get("error") or {}
+                results.append((item["custom_id"], None, error.get("message") or f"HTTP {response.get('status_code')}"))
+    return results
+
+class OpenAIAdapter(ProviderAdapter):
+    """OpenAI, or any server speaking the OpenAI chat completions API"""
+    
+    def complete(self, model, messages, api_key):
+        return get_completion(model, messages, self._api_key(api_key), base_url=self.base_url)
+    
+    def stream(self, model, messages, api_key, on_connect=None):
+        return stream_completion(model, messages, self._api_key(api_key), base_url=self.base_url, on_connect=on_connect)
+    
+    async def acomplete(self, model, messages, api_key):
+        return await aget_completion(model, messages, self._api_key(api_key), base_url=self.base_url)
+    
+    def list_models(self, api_key):
+        return list_models(self._api_key(api_key), base_url=self.base_url)
+    
+    def submit_batch(self, requests, api_key):
+        # OpenAI-compatible hosts (Mistral, Together, local servers) have different or no batch APIs
+        if self.base_url:
+            return super().submit_batch(requests, api_key)
+        return submit_batch(requests, api_key)
+    
+    def get_batch_results(self, batch_id, api_key):
+        if self.base_url:
+            return super().get_batch_results(batch_id, api_key)
+        return get_batch_results(batch_id, api_key)
+    
+    def _api_key(self, api_key):
+        # Local servers such as Ollama or vLLM accept any key, but the SDK requires one
+        if not api_key and not self.capabilities.requires_api_key:
+            return "not-needed"
+        return api_key
@@ -0,0 +1,103 @@
+import json
+import os
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from utils.client_pool import get_client_pool
+from utils.providers.base import ProviderAdapter
+
+# Point Perplexity elsewhere (e.g. the mock server in benchmarks/)
+PERPLEXITY_URL = os.environ.get("PERPLEXITY_BASE_URL", "https://api.perplexity.ai").rstrip("/") + "/chat/completions"
+
+def get_http_session(provider, api_key):
+    """Get a pooled keep-alive HTTP session for providers called over plain HTTP"""
+    def create_session():
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+    
+    return get_client_pool().get(provider, api_key, None, create_session)
+
+def get_completion(model, messages, api_key, base_url=None):
+    """Get completion from Perplexity"""
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    
+    # Convert messages format if needed
+    data = {
+        "model": model,
+        "messages": messages
+    }
+    
+    session = get_http_session("perplexity", api_key)
+    response = session.post(PERPLEXITY_URL, json=data, headers=headers)
+    response.raise_for_status()
+    
+    return response.json()["choices"][0]["message"]["content"]
+
+def stream_completion(model, messages, api_key, base_url=None, on_connect=None):
+    """Stream completion from Perplexity"""
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+        "Accept": "text/event-stream"
+    }
+    
+    data = {
+        "model": model,
+        "messages": messages,
+        "stream": True
+    }
+    
+    session = get_http_session("perplexity", api_key)
+    with session.post(PERPLEXITY_URL, json=data, headers=headers, stream=True) as response:
+        response.raise_for_status()
+        if on_connect:
+            on_connect()
+        yield from iter_sse_deltas(response.iter_lines(decode_unicode=True))
+
+async def aget_completion(model, messages, api_key, base_url=None):
+    """Get completion from Perplexity without blocking the event loop"""
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    
+    data = {
+        "model": model,
+        "messages": messages
+    }
+    
+    async with httpx.AsyncClient(timeout=None) as client:
+        response = await client.post(PERPLEXITY_URL, json=data, headers=headers)
+        response.raise_for_status()
+    
+    return response.json()["choices"][0]["message"]["content"]
+
+def iter_sse_deltas(lines):
+    """Extract text deltas from OpenAI-style server-sent event lines"""
+    for line in lines:
+        if not line or not line.startswith("data:"):
+            continue
+        payload = line[len("data:"):].strip()
+        if payload == "[DONE]":
+            break
+        choices = json.loads(payload).get("choices") or []
+        if choices:
+            content = (choices[0].get("delta") or {}).get("content")
+            if content:
+                yield content
+
+class PerplexityAdapter(ProviderAdapter):
+    def complete(self, model, messages, api_key):
+        return get_completion(model, messages, api_key)
+    
+    def stream(self, model, messages, api_key, on_connect=None):
+        return stream_completion(model, messages, api_key, on_connect=on_connect)
+    
+    async def acomplete(self, model, messages, api_key):
+        return await aget_completion(model, messages, api_key)
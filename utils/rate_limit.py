@@ -0,0 +1,379 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import CancelledError
+from itertools import count
+import streamlit as st
+from utils.client_pool import hash_api_key
+from utils.state_backend import get_state_backend
+
+# Status codes worth retrying: rate limits, server errors and Anthropic's "overloaded"
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 20.0
+
+# How often a waiting caller is told its queue position
+WAIT_REPORT_INTERVAL = 0.5
+
+# Seconds an idle key's shared bucket levels are kept (a bucket refills completely within a minute)
+BUCKET_STATE_TTL = 120
+
+# Seconds a session's last-served time counts for fairness; older entries are forgotten
+LAST_SERVED_TTL = 60
+
+class TokenBucket:
+    """Continuously refilling bucket holding up to `capacity` units per minute"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.time()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` units are available (amounts above capacity wait for a full bucket)"""
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+class KeyRateLimiter:
+    """
+    Requests/min and tokens/min limiter for one (provider, API key)
+
+    Callers wait in a fair queue: sessions are served round-robin, oldest
+    request first within a session, so one busy session cannot starve the
+    others. A 429 from the provider pauses the whole key for its retry-after.
+
+    With a shared state backend the bucket levels and pause live in the
+    backend under state_key, so every worker process draws on one budget;
+    the fair queue is still per process.
+    """
+
+    def __init__(self, rpm=None, tpm=None, state_backend=None, state_key=None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.paused_until = 0.0
+        self._state_backend = state_backend if state_backend is not None and state_backend.shared else None
+        self._state_key = state_key
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._last_served = {}
+        self._tickets = count()
+
+    def acquire(self, tokens=0, session_id=None, on_wait=None, cancelled=None):
+        """
+        Block until a request of about `tokens` tokens may be sent; returns seconds waited
+
+        Raises CancelledError if the cancelled event is set while waiting.
+        """
+        ticket = (next(self._tickets), session_id)
+        start = time.monotonic()
+        last_report = 0.0
+
+        with self._condition:
+            self._waiting.append(ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._next_ticket() == ticket:
+                        delay = self._with_buckets(lambda wall_now: self._take_if_ready(tokens, wall_now))
+                        if delay == 0:
+                            self._last_served[session_id] = now
+                            self._prune_last_served(now)
+                            return now - start
+                    else:
+                        delay = self._with_buckets(lambda wall_now: self._delay(tokens, wall_now), write=False)
+
+                    if on_wait and now - last_report >= WAIT_REPORT_INTERVAL:
+                        last_report = now
+                        position = self._position(ticket)
+                        self._condition.release()
+                        try:
+                            on_wait(position, delay)
+                        finally:
+                            self._condition.acquire()
+
+                    if cancelled is not None and cancelled.is_set():
+                        raise CancelledError()
+                    self._condition.wait(min(max(delay, 0.05), WAIT_REPORT_INTERVAL))
+            finally:
+                self._waiting.remove(ticket)
+                self._condition.notify_all()
+
+    def adjust(self, tokens):
+        """Correct the tokens charged at acquire() once the real usage is known"""
+        if self.tokens is None or not tokens:
+            return
+
+        def charge(now):
+            self.tokens.refill(now)
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level - tokens)
+
+        with self._condition:
+            self._with_buckets(charge)
+            self._condition.notify_all()
+
+    def pause(self, seconds):
+        """Hold every request on this key, e.g. after a 429 with retry-after"""
+        def hold(now):
+            self.paused_until = max(self.paused_until, now + seconds)
+
+        with self._condition:
+            self._with_buckets(hold)
+
+    def queue_length(self):
+        with self._condition:
+            return len(self._waiting)
+
+    def _delay(self, tokens, now):
+        delay = max(0.0, self.paused_until - now)
+        if self.requests is not None:
+            self.requests.refill(now)
+            delay = max(delay, self.requests.wait_time(1))
+        if self.tokens is not None and tokens:
+            self.tokens.refill(now)
+            delay = max(delay, self.tokens.wait_time(tokens))
+        return delay
+
+    def _take_if_ready(self, tokens, now):
+        delay = self._delay(tokens, now)
+        if delay == 0:
+            if self.requests is not None:
+                self.requests.level -= 1
+            if self.tokens is not None and tokens:
+                self.tokens.level -= min(tokens, self.tokens.capacity)
+        return delay
+
+    def _with_buckets(self, apply, write=True):
+        """
+        Run apply(now) on the buckets, loading and saving them through the shared backend if there is one
+
+        Called with the condition held. If the backend can't be reached, the
+        local buckets keep limiting this process on its own.
+        """
+        if self._state_backend is None:
+            return apply(time.time())
+
+        def update(state):
+            self._load_state(state)
+            result.append(apply(time.time()))
+            return self._dump_state()
+
+        result = []
+        try:
+            if write:
+                self._state_backend.update("rate_limits", self._state_key, update, ttl=BUCKET_STATE_TTL)
+            else:
+                self._load_state(self._state_backend.get("rate_limits", self._state_key))
+                result.append(apply(time.time()))
+        except Exception:
+            return apply(time.time())
+        return result[-1]
+
+    def _load_state(self, state):
+        now = time.time()
+        state = state or {}
+        for name, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+            if bucket is None:
+                continue
+            # A key no worker has used recently starts with full buckets
+            bucket.level, bucket.updated = state.get(name) or (bucket.capacity, now)
+        self.paused_until = state.get("paused_until", 0.0)
+
+    def _dump_state(self):
+        return {
+            "requests": [self.requests.level, self.requests.updated] if self.requests is not None else None,
+            "tokens": [self.tokens.level, self.tokens.updated] if self.tokens is not None else None,
+            "paused_until": self.paused_until,
+        }
+
+    def _prune_last_served(self, now):
+        # A session served long ago and not waiting now would be ordered first anyway
+        waiting = {session for _, session in self._waiting}
+        for session, served in list(self._last_served.items()):
+            if now - served > LAST_SERVED_TTL and session not in waiting:
+                del self._last_served[session]
+
+    def _order(self):
+        # Round-robin across sessions: the session served longest ago goes first
+        first_ticket = {}
+        for ticket in self._waiting:
+            first_ticket.setdefault(ticket[1], ticket)
+        sessions = sorted(first_ticket, key=lambda session: (self._last_served.get(session, 0.0), first_ticket[session][0]))
+        return [first_ticket[session] for session in sessions]
+
+    def _next_ticket(self):
+        order = self._order()
+        return order[0] if order else None
+
+    def _position(self, ticket):
+        order = self._order()
+        return order.index(ticket) + 1 if ticket in order else len(self._waiting)
+
+_limiters = {}
+_limits = {}
+_limiters_lock = threading.Lock()
+_state_backend = None
+
+def configure_rate_limits(limits, state_backend=None):
+    """
+    Set per-provider limits, e.g. {"openai": {"rpm": 500, "tpm": 200000}}
+
+    Providers without limits are not throttled up front, but still pause on
+    429s. With a shared state_backend, limits apply across worker processes.
+    """
+    global _state_backend
+
+    with _limiters_lock:
+        _limits.clear()
+        _limits.update({provider: dict(values) for provider, values in limits.items()})
+        _limiters.clear()
+        _state_backend = state_backend
+
+@st.cache_resource
+def load_rate_limits():
+    """
+    Apply the limits in the [rate_limits] section of Streamlit secrets, e.g.
+
+        [rate_limits.openai]
+        rpm = 500
+        tpm = 200000
+
+    Runs once per process. Buckets are kept in the state backend, so with a
+    shared one the limits hold for all worker processes together.
+    """
+    config = st.secrets.get("rate_limits", None) or {}
+    configure_rate_limits(config, state_backend=get_state_backend())
+    return True
+
+_bound_session = threading.local()
+
+def bind_session(session_id):
+    """Attribute calls from this worker thread to a Streamlit session (None to unbind)"""
+    _bound_session.id = session_id
+
+def current_session_id():
+    """Get the Streamlit session making this call, or None outside a script run"""
+    session_id = getattr(_bound_session, "id", None)
+    if session_id is not None:
+        return session_id
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx(suppress_warning=True)
+    except Exception:
+        return None
+    return ctx.session_id if ctx is not None else None
+
+def get_rate_limiter(provider, api_key):
+    """Get the limiter shared by every session using this provider key"""
+    key = (provider, hash_api_key(api_key))
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limits = _limits.get(provider, {})
+            limiter = KeyRateLimiter(
+                rpm=limits.get("rpm"),
+                tpm=limits.get("tpm"),
+                state_backend=_state_backend,
+                state_key=f"{provider}:{key[1]}"
+            )
+            _limiters[key] = limiter
+        return limiter
+
+def get_status_code(error):
+    """Get the HTTP status of a provider SDK or HTTP library error, if any"""
+    for candidate in (error, getattr(error, "response", None)):
+        if candidate is None:
+            continue
+        status = getattr(candidate, "status_code", None)
+        if isinstance(status, int):
+            return status
+    # google.api_core exceptions carry the HTTP status in .code
+    code = getattr(error, "code", None)
+    return code if isinstance(code, int) else None
+
+def get_retry_after(error):
+    """Get the provider's requested wait in seconds from retry-after headers, if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        return None
+    return None
+
+def is_retryable(error):
+    """Whether an error is a rate limit, server error or dropped connection"""
+    status = get_status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    name = type(error).__name__
+    return any(marker in name for marker in ("Connection", "Timeout", "ResourceExhausted", "ServiceUnavailable"))
+
+def backoff_delay(attempt, retry_after=None):
+    """Seconds to wait before a retry: the provider's retry-after, else full-jitter exponential backoff"""
+    if retry_after is not None:
+        return retry_after + random.uniform(0, BACKOFF_BASE)
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+def call_with_retries(call, limiter=None, on_retry=None, max_retries=MAX_RETRIES, acquire=None, cancelled=None):
+    """
+    Run call() and retry rate limits and server errors with backoff
+
+    A retry-after from the provider also pauses the key's limiter, so other
+    sessions sharing the key back off instead of adding to a 429 storm.
+    acquire() is called before each retry, so retries wait their turn in
+    the key's rate limits and fair queue like a new request. Setting the
+    cancelled event ends a backoff early with CancelledError.
+    """
+    attempt = 0
+    while True:
+        try:
+            return call()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            retry_after = get_retry_after(e)
+            delay = backoff_delay(attempt, retry_after)
+            if limiter is not None and (retry_after is not None or get_status_code(e) == 429):
+                limiter.pause(delay)
+            if on_retry:
+                on_retry(attempt + 1, delay, e)
+            if cancelled is None:
+                time.sleep(delay)
+            elif cancelled.wait(delay):
+                raise CancelledError() from e
+            if acquire:
+                acquire()
+            attempt += 1
+
+async def acall_with_retries(call, limiter=None, on_retry=None, max_retries=MAX_RETRIES, acquire=None):
+    """Async version of call_with_retries for a coroutine factory; acquire is a coroutine factory too"""
+    attempt = 0
+    while True:
+        try:
+            return await call()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            retry_after = get_retry_after(e)
+            delay = backoff_delay(attempt, retry_after)
+            if limiter is not None and (retry_after is not None or get_status_code(e) == 429):
+                limiter.pause(delay)
+            if on_retry:
+                on_retry(attempt + 1, delay, e)
+            await asyncio.sleep(delay)
+            if acquire:
+                await acquire()
+            attempt += 1
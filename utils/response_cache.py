@@ -0,0 +1,275 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+import streamlit as st
+from utils.embeddings import cosine_similarity, embed_text
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_messages(messages):
+    """Normalize a message list so trivially different prompts share a cache key"""
+    return [[msg["role"], _WHITESPACE.sub(" ", msg["content"] or "").strip()] for msg in messages]
+
+def make_cache_key(provider, model, messages, params=None):
+    """Hash (provider, model, normalized messages, generation params) into a cache key"""
+    payload = json.dumps(
+        [provider, model, normalize_messages(messages), params or {}],
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class MemoryCacheBackend:
+    """In-process LRU cache with TTL"""
+
+    def __init__(self, max_entries=1000, ttl=86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+class SQLiteCacheBackend:
+    """On-disk cache in a SQLite file, shared by all worker processes on a host"""
+
+    def __init__(self, path=None, max_entries=10000, ttl=86400):
+        if path is None:
+            path = Path.home() / ".streamlit_chatbot" / "response_cache.sqlite3"
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, stored_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, stored_at, used_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            # Drop expired rows, then the least recently used beyond the size limit
+            self._conn.execute("DELETE FROM responses WHERE stored_at < ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+class SupabaseCacheBackend:
+    """Cache stored in a Supabase table (key, value, created_at), shared across hosts"""
+
+    def __init__(self, supabase, table="response_cache", ttl=86400):
+        self.supabase = supabase
+        self.table = table
+        self.ttl = ttl
+
+    def get(self, key):
+        cutoff = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(time.time() - self.ttl))
+        response = (
+            self.supabase.table(self.table)
+            .select("value")
+            .eq("key", key)
+            .gte("created_at", cutoff)
+            .limit(1)
+            .execute()
+        )
+        rows = response.data if hasattr(response, "data") else []
+        return rows[0]["value"] if rows else None
+
+    def set(self, key, value):
+        self.supabase.table(self.table).upsert({
+            "key": key,
+            "value": value,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime())
+        }).execute()
+
+class StateCacheBackend:
+    """Cache kept in the shared state backend (SQLite or Redis), expiring through the backend's TTL"""
+
+    def __init__(self, state_backend, ttl=86400):
+        self.state_backend = state_backend
+        self.ttl = ttl
+
+    def get(self, key):
+        return self.state_backend.get("response_cache", key)
+
+    def set(self, key, value):
+        self.state_backend.set("response_cache", key, value, ttl=self.ttl)
+
+class ResponseCache:
+    """
+    Cache of provider responses for identical (and optionally similar) prompts
+
+    The exact tier looks up a hash of (provider, model, normalized messages,
+    params) in the backend. The optional semantic tier keeps embeddings of the
+    last user message, grouped by the conversation before it, and reuses a
+    response when a new question is similar enough.
+    """
+
+    def __init__(self, backend, semantic=False, similarity_threshold=0.92, max_semantic_entries=5000):
+        self.backend = backend
+        self.semantic = semantic
+        self.similarity_threshold = similarity_threshold
+        self.max_semantic_entries = max_semantic_entries
+        self._semantic_index = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def get(self, provider, model, messages, params=None):
+        """Get a cached response, or None on a miss"""
+        key = make_cache_key(provider, model, messages, params)
+        try:
+            value = self.backend.get(key)
+        except Exception:
+            value = None
+
+        if value is None and self.semantic:
+            value = self._semantic_lookup(provider, model, messages, params)
+            if value is not None:
+                with self._lock:
+                    self.semantic_hits += 1
+                return value
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, provider, model, messages, response, params=None):
+        """Store a provider response"""
+        if not response:
+            return
+        key = make_cache_key(provider, model, messages, params)
+        try:
+            self.backend.set(key, response)
+        except Exception:
+            return
+
+        if self.semantic and messages and messages[-1]["role"] == "user":
+            group = self._semantic_group(provider, model, messages, params)
+            with self._lock:
+                self._semantic_index[(group, key)] = embed_text(messages[-1]["content"])
+                while len(self._semantic_index) > self.max_semantic_entries:
+                    self._semantic_index.popitem(last=False)
+
+    def stats(self):
+        """Get hit/miss counters and the hit rate"""
+        with self._lock:
+            hits = self.hits + self.semantic_hits
+            total = hits + self.misses
+            return {
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+            }
+
+    def _semantic_group(self, provider, model, messages, params):
+        # Questions only match when everything before them is identical
+        return make_cache_key(provider, model, messages[:-1], params)
+
+    def _semantic_lookup(self, provider, model, messages, params):
+        if not messages or messages[-1]["role"] != "user":
+            return None
+
+        group = self._semantic_group(provider, model, messages, params)
+        query = embed_text(messages[-1]["content"])
+
+        best_key, best_score = None, self.similarity_threshold
+        with self._lock:
+            for (entry_group, entry_key), embedding in self._semantic_index.items():
+                if entry_group != group:
+                    continue
+                score = cosine_similarity(query, embedding)
+                if score >= best_score:
+                    best_key, best_score = entry_key, score
+
+        if best_key is None:
+            return None
+        try:
+            return self.backend.get(best_key)
+        except Exception:
+            return None
+
+@st.cache_resource
+def get_response_cache():
+    """
+    Get the process-wide response cache, or None when it is not enabled
+
+    Enabled with a [response_cache] section in Streamlit secrets, e.g.
+    backend = "sqlite", ttl = 86400, max_entries = 10000, semantic = true
+
+    backend = "state" keeps entries in the [state] backend, shared by every worker.
+    """
+    config = st.secrets.get("response_cache", None)
+    if not config or not config.get("enabled", True):
+        return None
+
+    backend_name = config.get("backend", "memory")
+    ttl = config.get("ttl", 86400)
+    max_entries = config.get("max_entries", 1000)
+
+    if backend_name == "sqlite":
+        backend = SQLiteCacheBackend(config.get("path"), max_entries=max_entries, ttl=ttl)
+    elif backend_name == "state":
+        from utils.state_backend import get_state_backend
+        backend = StateCacheBackend(get_state_backend(), ttl=ttl)
+    elif backend_name == "supabase":
+        from utils.supabase_client import init_supabase
+        backend = SupabaseCacheBackend(init_supabase(), table=config.get("table", "response_cache"), ttl=ttl)
+    else:
+        backend = MemoryCacheBackend(max_entries=max_entries, ttl=ttl)
+
+    return ResponseCache(
+        backend,
+        semantic=config.get("semantic", False),
+        similarity_threshold=config.get("similarity_threshold", 0.92)
+    )
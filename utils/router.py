@@ -0,0 +1,408 @@
+import json
+import queue
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, CancelledError, ThreadPoolExecutor, wait
+from utils.api_clients import get_chat_completion_result, stream_chat_completion
+from utils.metrics import percentile
+
+# Seconds to wait before hedging when a target has too few samples for a p95
+DEFAULT_HEDGE_DELAY = 8.0
+
+# Samples needed before a target's own percentiles are trusted
+MIN_SAMPLES = 10
+
+# Seconds between checks of a stream's cancel event while waiting for its targets
+CANCEL_POLL_INTERVAL = 0.25
+
+class RoutingPolicy:
+    """
+    How a chat spreads requests over several (provider, model) targets
+
+    mode is "ordered" (try targets in order) or "weighted" (pick by weight,
+    favouring faster targets). With hedge enabled a second target is started
+    when the first has not answered by its own p95 latency.
+    """
+
+    def __init__(self, targets, mode="ordered", hedge=False, hedge_delay=None):
+        self.targets = targets
+        self.mode = mode
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+
+def parse_policy(value):
+    """
+    Parse a routing policy from the chat record
+
+    Accepts a dict or JSON string such as
+    {"mode": "ordered", "hedge": true,
+     "targets": ["openai/gpt-4o", {"target": "anthropic/claude-3-5-sonnet-20241022", "weight": 2}]}
+
+    Returns None when no policy is set.
+    """
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = json.loads(value)
+
+    targets = []
+    for item in value.get("targets", []):
+        if isinstance(item, str):
+            item = {"target": item}
+        provider, _, model = item["target"].partition("/")
+        if not provider or not model:
+            raise ValueError(f"Invalid routing target '{item['target']}', expected provider/model")
+        targets.append((provider.lower(), model, float(item.get("weight", 1))))
+
+    if not targets:
+        return None
+
+    mode = value.get("mode", "ordered")
+    if mode not in ("ordered", "weighted"):
+        raise ValueError(f"Unknown routing mode '{mode}'")
+
+    return RoutingPolicy(targets, mode=mode, hedge=bool(value.get("hedge", False)), hedge_delay=value.get("hedge_delay"))
+
+class TargetStats:
+    """Rolling latency and error window plus a circuit breaker for one target"""
+
+    def __init__(self, window=100, failure_threshold=5, cooldown=30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.latencies = deque(maxlen=window)
+        self.ttfts = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_started_at = None
+
+    def record_success(self, latency, ttft=None, cached=False):
+        self.trial_started_at = None
+        if cached:
+            # A response cache hit never reached the provider: it says nothing about
+            # its health, and its near-zero latency would skew the p50 ordering and
+            # p95 hedge delay
+            return
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.latencies.append(latency)
+        if ttft is not None:
+            self.ttfts.append(ttft)
+        self.outcomes.append(True)
+
+    def record_failure(self):
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        self.trial_started_at = None
+        if self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def available(self):
+        """Closed circuits are available; an open one allows a single trial after the cooldown"""
+        if self.opened_at is None:
+            return True
+        now = time.monotonic()
+        if now - self.opened_at < self.cooldown:
+            return False
+        # A trial whose request was abandoned never reports back, so it expires after another cooldown
+        return self.trial_started_at is None or now - self.trial_started_at >= self.cooldown
+
+    def try_acquire_trial(self):
+        """Claim the right to send a request, which for an open circuit is its single half-open trial"""
+        if not self.available():
+            return False
+        if self.opened_at is not None:
+            self.trial_started_at = time.monotonic()
+        return True
+
+    def error_rate(self):
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def p50(self):
+        return percentile(list(self.latencies), 50) if len(self.latencies) >= MIN_SAMPLES else None
+
+    def p95(self, streamed=False):
+        samples = self.ttfts if streamed else self.latencies
+        return percentile(list(samples), 95) if len(samples) >= MIN_SAMPLES else None
+
+class Router:
+    """Route completions over a policy's targets with failover, circuit breaking and hedging"""
+
+    def __init__(self, max_workers=32):
+        self._stats = {}
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="router")
+
+    def stats(self, provider, model):
+        with self._lock:
+            key = (provider, model)
+            if key not in self._stats:
+                self._stats[key] = TargetStats()
+            return self._stats[key]
+
+    def snapshot(self):
+        """Get rolling stats of every target for display"""
+        with self._lock:
+            items = list(self._stats.items())
+        return [
+            {
+                "target": f"{provider}/{model}",
+                "p50 latency (s)": stats.p50(),
+                "p95 latency (s)": stats.p95(),
+                "error rate": stats.error_rate(),
+                "circuit": "open" if stats.opened_at is not None else "closed",
+            }
+            for (provider, model), stats in items
+        ]
+
+    def order_targets(self, policy):
+        """Get the policy's targets in the order they should be tried, skipping open circuits"""
+        with self._lock:
+            available = [
+                (provider, model, weight) for provider, model, weight in policy.targets
+                if self._stats.get((provider, model)) is None or self._stats[(provider, model)].available()
+            ]
+
+        if policy.mode == "weighted":
+            # Weighted shuffle where faster targets get proportionally more traffic
+            def effective_weight(target):
+                provider, model, weight = target
+                p50 = self.stats(provider, model).p50()
+                return weight / max(p50, 0.05) if p50 else weight
+
+            available = sorted(
+                available,
+                key=lambda target: random.random() ** (1.0 / max(effective_weight(target), 1e-6)),
+                reverse=True
+            )
+
+        # When every circuit is open, fall back to trying them all in policy order
+        return [(provider, model) for provider, model, _ in available] or [
+            (provider, model) for provider, model, _ in policy.targets
+        ]
+
+    def hedge_delay(self, policy, provider, model, streamed=False):
+        if policy.hedge_delay is not None:
+            return float(policy.hedge_delay)
+        return self.stats(provider, model).p95(streamed) or DEFAULT_HEDGE_DELAY
+
+    def claim_next(self, targets, start, force=False):
+        """
+        Get the index of the first target from start that can take a request, or None
+
+        Claims the half-open trial of a recovering target, so only targets
+        actually sent a request are marked. With force, the target at start
+        is used even if its circuit is open, so a request whose targets are
+        all tripped is still tried.
+        """
+        with self._lock:
+            for index in range(start, len(targets)):
+                if self.stats(*targets[index]).try_acquire_trial():
+                    return index
+        return start if force and start < len(targets) else None
+
+    def complete(self, policy, messages, api_keys, cache=None):
+        """
+        Get a completion from the first target that answers
+
+        Returns:
+            tuple: (CompletionResult, (provider, model) that produced it)
+        """
+        targets = self.order_targets(policy)
+        errors = []
+        pending = {}
+        next_index = 0
+
+        def launch(force=False):
+            nonlocal next_index
+            index = self.claim_next(targets, next_index, force=force)
+            if index is None:
+                next_index = len(targets)
+                return
+            provider, model = targets[index]
+            next_index = index + 1
+            future = self._executor.submit(
+                get_chat_completion_result, provider, model, messages, api_keys.get(provider), cache
+            )
+            pending[future] = (provider, model)
+
+        launch(force=True)
+        while pending:
+            provider, model = next(iter(pending.values()))
+            timeout = None
+            if policy.hedge and next_index < len(targets) and len(pending) == 1:
+                timeout = self.hedge_delay(policy, provider, model)
+
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # The first target is slower than its p95, race a second one
+                launch()
+                continue
+
+            for future in done:
+                target = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    with self._lock:
+                        self.stats(*target).record_failure()
+                    errors.append(f"{target[0]}/{target[1]}: {e}")
+                    continue
+
+                with self._lock:
+                    self.stats(*target).record_success(
+                        result.metrics.latency, result.metrics.ttft, cached=result.metrics.cached
+                    )
+                return result, target
+
+            if not pending and next_index < len(targets):
+                launch(force=True)
+
+        raise RuntimeError("All routing targets failed: " + "; ".join(errors))
+
+    def stream(self, policy, messages, api_keys, cache=None, on_complete=None, on_target=None, cancelled=None):
+        """
+        Stream a completion, failing over or hedging until a target produces its first token
+
+        Once a target has sent text the stream is committed to it; a failure
+        after that is raised, since switching would repeat or mix answers.
+        on_target is called with (provider, model) when a target is committed.
+        Setting the cancelled event stops the targets, including ones still
+        waiting on rate limits or retries, and raises CancelledError.
+        """
+        targets = self.order_targets(policy)
+        events = queue.Queue()
+        stopped = {}
+        started = {}
+        errors = []
+        next_index = 0
+
+        def run(index, provider, model):
+            def finished(result):
+                with self._lock:
+                    self.stats(provider, model).record_success(
+                        result.metrics.latency, result.metrics.ttft, cached=result.metrics.cached
+                    )
+                events.put((index, "complete", result))
+
+            try:
+                for delta in stream_chat_completion(
+                    provider, model, messages, api_keys.get(provider),
+                    cache=cache, on_complete=finished, cancelled=stopped[index]
+                ):
+                    if stopped[index].is_set():
+                        return
+                    events.put((index, "delta", delta))
+                events.put((index, "done", None))
+            except CancelledError:
+                # Stopped while still waiting on rate limits or a retry; not the target's fault
+                return
+            except Exception as e:
+                with self._lock:
+                    self.stats(provider, model).record_failure()
+                events.put((index, "error", e))
+
+        def launch(force=False):
+            nonlocal next_index
+            index = self.claim_next(targets, next_index, force=force)
+            if index is None:
+                next_index = len(targets)
+                return
+            provider, model = targets[index]
+            next_index = index + 1
+            stopped[index] = threading.Event()
+            started[index] = (provider, model)
+            running.add(index)
+            self._executor.submit(run, index, provider, model)
+
+        committed = None
+        running = set()
+        result = None
+        launch(force=True)
+
+        try:
+            while True:
+                timeout = None
+                if committed is None and policy.hedge and next_index < len(targets) and len(running) == 1:
+                    provider, model = started[next(iter(running))]
+                    timeout = self.hedge_delay(policy, provider, model, streamed=True)
+
+                try:
+                    index, kind, payload = next_event(events, timeout, cancelled)
+                except queue.Empty:
+                    # No first token within the first target's p95 TTFT, race a second one
+                    launch()
+                    continue
+
+                if committed is not None and index != committed:
+                    continue
+
+                if kind == "delta":
+                    if committed is None:
+                        committed = index
+                        for other in running - {index}:
+                            stopped[other].set()
+                        if on_target:
+                            on_target(started[index])
+                    yield payload
+                elif kind == "complete":
+                    result = payload
+                elif kind == "done":
+                    if committed is None:
+                        committed = index
+                        if on_target:
+                            on_target(started[index])
+                    break
+                elif kind == "error":
+                    if committed is not None:
+                        raise payload
+                    running.discard(index)
+                    errors.append(f"{started[index][0]}/{started[index][1]}: {payload}")
+                    if not running:
+                        if next_index < len(targets):
+                            launch(force=True)
+                        if not running:
+                            raise RuntimeError("All routing targets failed: " + "; ".join(errors))
+
+            # The completion callback is queued just before "done", so drain it
+            while result is None:
+                try:
+                    index, kind, payload = events.get(timeout=1)
+                except queue.Empty:
+                    break
+                if index == committed and kind == "complete":
+                    result = payload
+        finally:
+            # Also reached when the consumer closes the stream (Stop, job cancel, rerun),
+            # so workers stop pulling upstream streams nobody will read
+            for event in stopped.values():
+                event.set()
+
+        if on_complete and result is not None:
+            on_complete(result)
+
+def next_event(events, timeout, cancelled=None):
+    """events.get(timeout=timeout) that raises CancelledError once cancelled is set"""
+    if cancelled is None:
+        return events.get(timeout=timeout)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        if cancelled.is_set():
+            raise CancelledError()
+        wait_for = CANCEL_POLL_INTERVAL
+        if deadline is not None:
+            wait_for = min(wait_for, deadline - time.monotonic())
+            if wait_for <= 0:
+                raise queue.Empty
+        try:
+            return events.get(timeout=wait_for)
+        except queue.Empty:
+            continue
+
+_router = Router()
+
+def get_router():
+    """Get the process-wide router shared by all sessions"""
+    return _router
@@ -0,0 +1,363 @@
+import hashlib
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+import streamlit as st
+from utils.embeddings import EMBEDDING_DIM, embed_text, tokenize
+from utils.message_store import iter_chat_messages
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Most recent messages scored by the pure-Python vector scan when numpy is not installed
+SEMANTIC_SCAN_LIMIT = 50000
+
+# Message vectors kept in memory across all users; the least recently searched users are evicted first
+VECTOR_CACHE_LIMIT = 200000
+
+# Minimum cosine similarity for a semantic-only match
+SEMANTIC_MIN_SIMILARITY = 0.3
+
+# Rank fusion constant: higher values flatten the difference between ranks
+RRF_K = 60
+
+# Rows fetched per request while backfilling existing messages
+BACKFILL_PAGE_SIZE = 500
+
+def owner_token(user_id):
+    """FTS token identifying a user, so the owner filter is part of the index lookup"""
+    return "u" + "".join(ch for ch in str(user_id) if ch.isalnum())
+
+def normalize_timestamp(value):
+    """Normalize ISO timestamps so the writer's and Supabase's formats compare equal"""
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).isoformat()
+    except ValueError:
+        return str(value)
+
+def message_doc_key(row):
+    """
+    Document key of a saved message, the same whether it arrives from the writer or the backfill
+
+    Messages can share a timestamp (e.g. an imported batch), so a hash of the
+    role and content tells them apart.
+    """
+    digest = hashlib.sha1(f"{row['role']}\0{row['content'] or ''}".encode("utf-8")).hexdigest()[:16]
+    return f"message:{row['chat_id']}:{normalize_timestamp(row['created_at'])}:{digest}"
+
+def build_match_query(user_id, query):
+    """Build an FTS5 query for a user's documents containing every word, the last as a prefix"""
+    words = tokenize(query)
+    if not words:
+        return None
+    terms = [f'content:"{word}"' for word in words[:-1]] + [f'content:"{words[-1]}"*']
+    return f'owner:"{owner_token(user_id)}" AND ' + " AND ".join(terms)
+
+class SearchIndex:
+    """
+    Local full-text and semantic index over a user's chat titles and messages
+
+    Documents live in a SQLite FTS5 table ranked with bm25; the owner column
+    holds a per-user token so the user filter is resolved by the index
+    itself. With semantic search enabled each message also gets a hashed
+    embedding, and results of both are merged with reciprocal rank fusion.
+    Messages are indexed as the message writer saves them; chats created
+    before the index existed are backfilled from Supabase in the background.
+    """
+
+    def __init__(self, path=None, semantic=False):
+        if path is None:
+            path = Path.home() / ".streamlit_chatbot" / "search_index.sqlite3"
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.semantic = semantic
+        self._lock = threading.Lock()
+        # user_id -> (ids, vectors), loaded from the vectors table on a user's first semantic search
+        self._vectors = OrderedDict()
+        self._cached_vector_count = 0
+        # Bumped whenever cached vectors go stale, so a load racing with it isn't cached
+        self._vectors_version = 0
+        self._backfilling = set()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chats (
+                chat_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, title TEXT, backfilled INTEGER DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY, doc_key TEXT UNIQUE NOT NULL, user_id TEXT NOT NULL,
+                chat_id TEXT NOT NULL, role TEXT, created_at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS documents_chat_id ON documents (chat_id);
+            CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+                content, owner, tokenize = 'unicode61 remove_diacritics 2'
+            );
+            CREATE TABLE IF NOT EXISTS vectors (
+                id INTEGER PRIMARY KEY, user_id TEXT NOT NULL, embedding BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS vectors_user_id ON vectors (user_id);
+        """)
+
+    def register_chats(self, user_id, chats):
+        """Record chat ownership and index titles, e.g. for each chat list page"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for chat in chats:
+                    row = self._conn.execute("SELECT title FROM chats WHERE chat_id = ?", (chat["id"],)).fetchone()
+                    if row is not None and row[0] == chat.get("title"):
+                        continue
+                    self._conn.execute(
+                        "INSERT INTO chats (chat_id, user_id, title) VALUES (?, ?, ?) "
+                        "ON CONFLICT (chat_id) DO UPDATE SET title = excluded.title",
+                        (chat["id"], str(user_id), chat.get("title"))
+                    )
+                    self._replace_document(f"title:{chat['id']}", user_id, chat["id"], "title", None, chat.get("title") or "")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def index_messages(self, rows):
+        """
+        Index saved message rows ({"chat_id", "role", "content", "created_at"})
+
+        Used as a MessageWriter listener. Rows of chats not registered yet are
+        picked up by the backfill instead.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for row in rows:
+                    owner = self._conn.execute(
+                        "SELECT user_id FROM chats WHERE chat_id = ?", (row["chat_id"],)
+                    ).fetchone()
+                    if owner is None:
+                        continue
+                    self._insert_document(
+                        message_doc_key(row),
+                        owner[0], row["chat_id"], row["role"], row["created_at"], row["content"] or ""
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def rename_chat(self, user_id, chat_id, title):
+        self.register_chats(user_id, [{"id": chat_id, "title": title}])
+
+    def remove_chat(self, chat_id):
+        """Drop a chat and all of its documents"""
+        with self._lock:
+            ids = [row[0] for row in self._conn.execute("SELECT id FROM documents WHERE chat_id = ?", (chat_id,))]
+            owner = self._conn.execute("SELECT user_id FROM chats WHERE chat_id = ?", (chat_id,)).fetchone()
+            self._conn.execute("BEGIN")
+            for doc_id in ids:
+                self._conn.execute("DELETE FROM documents_fts WHERE rowid = ?", (doc_id,))
+                self._conn.execute("DELETE FROM vectors WHERE id = ?", (doc_id,))
+            self._conn.execute("DELETE FROM documents WHERE chat_id = ?", (chat_id,))
+            self._conn.execute("DELETE FROM chats WHERE chat_id = ?", (chat_id,))
+            self._conn.execute("COMMIT")
+            if owner is not None:
+                self._drop_vectors(owner[0])
+
+    def search(self, user_id, query, limit=10):
+        """
+        Find a user's messages and chat titles matching a query, best first
+
+        Returns:
+            list: dicts with chat_id, title, role, snippet (with **highlights**), created_at
+        """
+        match_query = build_match_query(user_id, query)
+        if match_query is None:
+            return []
+
+        with self._lock:
+            keyword_rows = self._conn.execute(
+                "SELECT documents_fts.rowid, snippet(documents_fts, 0, '**', '**', '…', 12) "
+                "FROM documents_fts WHERE documents_fts MATCH ? "
+                "ORDER BY bm25(documents_fts, 1.0, 0.0) LIMIT ?",
+                (match_query, limit * 2)
+            ).fetchall()
+
+        snippets = dict(keyword_rows)
+        rankings = [[doc_id for doc_id, _ in keyword_rows]]
+        if self.semantic:
+            rankings.append(self._vector_search(str(user_id), query, limit * 2))
+
+        # Reciprocal rank fusion of the keyword and semantic rankings
+        scores = {}
+        for ranking in rankings:
+            for rank, doc_id in enumerate(ranking):
+                scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (RRF_K + rank)
+        ranked = sorted(scores, key=scores.get, reverse=True)[:limit]
+        if not ranked:
+            return []
+
+        placeholders = ", ".join("?" for _ in ranked)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT d.id, d.chat_id, c.title, d.role, d.created_at, f.content "
+                "FROM documents d JOIN chats c ON c.chat_id = d.chat_id "
+                f"JOIN documents_fts f ON f.rowid = d.id WHERE d.id IN ({placeholders})",
+                ranked
+            ).fetchall()
+
+        by_id = {row[0]: row for row in rows}
+        results = []
+        for doc_id in ranked:
+            if doc_id not in by_id:
+                continue
+            _, chat_id, title, role, created_at, content = by_id[doc_id]
+            results.append({
+                "chat_id": chat_id,
+                "title": title,
+                "role": role,
+                "snippet": snippets.get(doc_id) or (content[:120] + ("…" if len(content) > 120 else "")),
+                "created_at": created_at,
+            })
+        return results
+
+    def backfill(self, supabase, user_id):
+        """Index a user's existing chats and messages from Supabase once, in a background thread"""
+        user_id = str(user_id)
+        with self._lock:
+            if user_id in self._backfilling:
+                return
+            self._backfilling.add(user_id)
+        threading.Thread(target=self._backfill, args=(supabase, user_id), name="search-backfill", daemon=True).start()
+
+    def _backfill(self, supabase, user_id):
+        try:
+            start = 0
+            while True:
+                response = (
+                    supabase.table("chats").select("id, title").eq("user_id", user_id)
+                    .order("created_at").range(start, start + BACKFILL_PAGE_SIZE - 1).execute()
+                )
+                chats = response.data if hasattr(response, "data") else []
+                self.register_chats(user_id, chats)
+                if len(chats) < BACKFILL_PAGE_SIZE:
+                    break
+                start += BACKFILL_PAGE_SIZE
+
+            with self._lock:
+                pending = [row[0] for row in self._conn.execute(
+                    "SELECT chat_id FROM chats WHERE user_id = ? AND backfilled = 0", (user_id,)
+                )]
+
+            for chat_id in pending:
+                # Keyset-paginated on (created_at, id), so messages sharing a timestamp across a page boundary aren't skipped
+                batch = []
+                for message in iter_chat_messages(supabase, chat_id, chunk_size=BACKFILL_PAGE_SIZE):
+                    batch.append(dict(message, chat_id=chat_id))
+                    if len(batch) >= BACKFILL_PAGE_SIZE:
+                        self.index_messages(batch)
+                        batch = []
+                if batch:
+                    self.index_messages(batch)
+                with self._lock:
+                    self._conn.execute("UPDATE chats SET backfilled = 1 WHERE chat_id = ?", (chat_id,))
+        except Exception:
+            # Try again on the next search
+            with self._lock:
+                self._backfilling.discard(user_id)
+
+    def _insert_document(self, doc_key, user_id, chat_id, role, created_at, content):
+        cursor = self._conn.execute(
+            "INSERT OR IGNORE INTO documents (doc_key, user_id, chat_id, role, created_at) VALUES (?, ?, ?, ?, ?)",
+            (doc_key, str(user_id), chat_id, role, created_at)
+        )
+        if cursor.rowcount == 0:
+            return
+        doc_id = cursor.lastrowid
+        self._conn.execute(
+            "INSERT INTO documents_fts (rowid, content, owner) VALUES (?, ?, ?)",
+            (doc_id, content, owner_token(user_id))
+        )
+        if self.semantic and role != "title":
+            embedding = array("f", embed_text(content))
+            self._conn.execute(
+                "INSERT INTO vectors (id, user_id, embedding) VALUES (?, ?, ?)",
+                (doc_id, str(user_id), embedding.tobytes())
+            )
+            self._drop_vectors(str(user_id))
+
+    def _replace_document(self, doc_key, user_id, chat_id, role, created_at, content):
+        row = self._conn.execute("SELECT id FROM documents WHERE doc_key = ?", (doc_key,)).fetchone()
+        if row is not None:
+            self._conn.execute("DELETE FROM documents_fts WHERE rowid = ?", (row[0],))
+            self._conn.execute("DELETE FROM documents WHERE id = ?", (row[0],))
+        self._insert_document(doc_key, user_id, chat_id, role, created_at, content)
+
+    def _drop_vectors(self, user_id):
+        # Called with the lock held
+        cached = self._vectors.pop(user_id, None)
+        if cached is not None:
+            self._cached_vector_count -= len(cached[0])
+        self._vectors_version += 1
+
+    def _load_vectors(self, user_id):
+        # Kept in memory per user until their next indexed message, a deleted chat or eviction
+        with self._lock:
+            cached = self._vectors.get(user_id)
+            if cached is not None:
+                self._vectors.move_to_end(user_id)
+                return cached
+            version = self._vectors_version
+            rows = self._conn.execute(
+                "SELECT id, embedding FROM vectors WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                (user_id, -1 if np is not None else SEMANTIC_SCAN_LIMIT)
+            ).fetchall()
+
+        ids = [row[0] for row in rows]
+        if np is not None:
+            matrix = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+            cached = (ids, matrix)
+        else:
+            cached = (ids, [array("f", row[1]) for row in rows])
+        with self._lock:
+            # A user with more vectors than the whole cache is served without caching
+            if version == self._vectors_version and user_id not in self._vectors and len(ids) <= VECTOR_CACHE_LIMIT:
+                self._vectors[user_id] = cached
+                self._cached_vector_count += len(ids)
+                while self._cached_vector_count > VECTOR_CACHE_LIMIT:
+                    _, (evicted_ids, _) = self._vectors.popitem(last=False)
+                    self._cached_vector_count -= len(evicted_ids)
+        return cached
+
+    def _vector_search(self, user_id, query, limit):
+        ids, vectors = self._load_vectors(user_id)
+        if not ids:
+            return []
+        query_vector = embed_text(query)
+        if np is not None:
+            scores = vectors @ np.asarray(query_vector, dtype=np.float32)
+            top = np.argsort(-scores)[:limit]
+            return [ids[i] for i in top if scores[i] >= SEMANTIC_MIN_SIMILARITY]
+
+        # A short query only has a few non-zero dimensions, so only those are multiplied
+        dimensions = [(i, value) for i, value in enumerate(query_vector) if value]
+        scored = sorted(
+            ((sum(vector[i] * value for i, value in dimensions), doc_id) for doc_id, vector in zip(ids, vectors)),
+            reverse=True
+        )[:limit]
+        return [doc_id for score, doc_id in scored if score >= SEMANTIC_MIN_SIMILARITY]
+
+@st.cache_resource
+def get_search_index():
+    """
+    Get the process-wide search index, or None when it is disabled
+
+    Configured with an optional [search] section in Streamlit secrets, e.g.
+    enabled = true, path = "/data/search_index.sqlite3", semantic = true
+    """
+    config = st.secrets.get("search", None) or {}
+    if not config.get("enabled", True):
+        return None
+    return SearchIndex(config.get("path"), semantic=config.get("semantic", False))
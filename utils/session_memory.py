@@ -0,0 +1,223 @@
+import json
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+import streamlit as st
+from utils.rate_limit import current_session_id
+
+# Resident conversation bytes allowed per session before idle chats are evicted
+DEFAULT_MAX_SESSION_BYTES = 8 * 1024 * 1024
+
+# Seconds before an evicted chat that was never reopened is dropped from the spill file
+SPILL_TTL = 86400
+
+# Per-chat session keys moved out together on eviction
+CHAT_STATE_PREFIXES = ("messages_", "older_cursor_", "visible_count_")
+
+class ChatMessage:
+    """
+    Compact chat message: two slots instead of a dict, with an interned role
+
+    Supports message["role"] / message["content"] so code written for
+    {"role", "content"} dicts keeps working.
+    """
+
+    __slots__ = ("role", "content")
+
+    def __init__(self, role, content):
+        self.role = sys.intern(role)
+        self.content = content
+
+    def __getitem__(self, key):
+        if key == "role":
+            return self.role
+        if key == "content":
+            return self.content
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        return {"role": self.role, "content": self.content}
+
+    def __repr__(self):
+        return f"ChatMessage({self.role!r}, {self.content[:40]!r})"
+
+def compact_messages(messages):
+    """Convert {"role", "content"} dicts into ChatMessage records"""
+    return [msg if isinstance(msg, ChatMessage) else ChatMessage(msg["role"], msg["content"]) for msg in messages]
+
+def message_bytes(message):
+    """Approximate resident size of one message"""
+    return sys.getsizeof(message) + sys.getsizeof(message["content"])
+
+class SpillStore:
+    """Local SQLite file holding evicted chats' session state until they are reopened"""
+
+    def __init__(self, path=None):
+        if path is None:
+            path = Path.home() / ".streamlit_chatbot" / "session_spill.sqlite3"
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS spilled_chats "
+            "(session_id TEXT, chat_id TEXT, state TEXT NOT NULL, stored_at REAL NOT NULL, "
+            "PRIMARY KEY (session_id, chat_id))"
+        )
+        self._conn.execute("DELETE FROM spilled_chats WHERE stored_at < ?", (time.time() - SPILL_TTL,))
+
+    def put(self, session_id, chat_id, state):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO spilled_chats (session_id, chat_id, state, stored_at) VALUES (?, ?, ?, ?)",
+                (session_id, chat_id, json.dumps(state), time.time())
+            )
+
+    def take(self, session_id, chat_id):
+        """Remove and return a chat's spilled state, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM spilled_chats WHERE session_id = ? AND chat_id = ?", (session_id, chat_id)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "DELETE FROM spilled_chats WHERE session_id = ? AND chat_id = ?", (session_id, chat_id)
+            )
+        return json.loads(row[0])
+
+    def drop_session(self, session_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM spilled_chats WHERE session_id = ?", (session_id,))
+
+class SessionMemory:
+    """
+    Caps the conversation bytes one session keeps in st.session_state
+
+    Chats are tracked in least-recently-viewed order. When the resident
+    total exceeds max_bytes, the oldest chats (never the open one) have their
+    session keys spilled to the SpillStore; reopening a chat restores them.
+    """
+
+    def __init__(self, session_id, spill_store, max_bytes=DEFAULT_MAX_SESSION_BYTES):
+        self.session_id = session_id
+        self.spill_store = spill_store
+        self.max_bytes = max_bytes
+        self._viewed = OrderedDict()
+        self._sizes = {}
+        self._evicted = set()
+        self.evictions = 0
+        weakref.finalize(self, spill_store.drop_session, session_id)
+
+    def open_chat(self, session_state, chat_id):
+        """Mark a chat as viewed, restoring it if it was evicted, then enforce the cap"""
+        if chat_id in self._evicted and f"messages_{chat_id}" not in session_state:
+            state = self.spill_store.take(self.session_id, chat_id)
+            if state is not None:
+                cursor = state["older_cursor"]
+                session_state[f"messages_{chat_id}"] = compact_messages(state["messages"])
+                session_state[f"older_cursor_{chat_id}"] = tuple(cursor) if cursor else None
+                session_state[f"visible_count_{chat_id}"] = state["visible_count"]
+        self._evicted.discard(chat_id)
+
+        self._viewed[chat_id] = time.time()
+        self._viewed.move_to_end(chat_id)
+        self.enforce(session_state, keep=chat_id)
+
+    def enforce(self, session_state, keep=None):
+        """Evict least-recently-viewed chats until the session is under its cap"""
+        total = sum(self._chat_bytes(session_state, chat_id) for chat_id in list(self._viewed))
+        for chat_id in list(self._viewed):
+            if total <= self.max_bytes:
+                break
+            if chat_id == keep:
+                continue
+            total -= self._chat_bytes(session_state, chat_id)
+            self._evict(session_state, chat_id)
+
+    def usage(self, session_state):
+        """Get this session's resident and evicted conversation totals"""
+        resident = [chat_id for chat_id in self._viewed if f"messages_{chat_id}" in session_state]
+        return {
+            "session": self.session_id,
+            "resident_chats": len(resident),
+            "resident_messages": sum(len(session_state[f"messages_{chat_id}"]) for chat_id in resident),
+            "resident_bytes": sum(self._chat_bytes(session_state, chat_id) for chat_id in resident),
+            "evicted_chats": len(self._evicted),
+            "evictions": self.evictions,
+            "max_bytes": self.max_bytes,
+        }
+
+    def _chat_bytes(self, session_state, chat_id):
+        messages = session_state.get(f"messages_{chat_id}")
+        if messages is None:
+            self._sizes.pop(chat_id, None)
+            return 0
+        # Histories only grow or gain older pages, so the size is only recomputed when the length changes
+        cached = self._sizes.get(chat_id)
+        if cached is None or cached[0] != len(messages):
+            cached = (len(messages), sys.getsizeof(messages) + sum(message_bytes(msg) for msg in messages))
+            self._sizes[chat_id] = cached
+        return cached[1]
+
+    def _evict(self, session_state, chat_id):
+        messages = session_state.get(f"messages_{chat_id}")
+        if messages is not None:
+            state = {
+                "messages": [msg.to_dict() if isinstance(msg, ChatMessage) else msg for msg in messages],
+                "older_cursor": session_state.get(f"older_cursor_{chat_id}"),
+                "visible_count": session_state.get(f"visible_count_{chat_id}"),
+            }
+            self.spill_store.put(self.session_id, chat_id, state)
+            for prefix in CHAT_STATE_PREFIXES:
+                session_state.pop(f"{prefix}{chat_id}", None)
+            self._evicted.add(chat_id)
+            self.evictions += 1
+        self._viewed.pop(chat_id, None)
+        self._sizes.pop(chat_id, None)
+
+_sessions = weakref.WeakValueDictionary()
+
+@st.cache_resource
+def get_spill_store():
+    """Get the process-wide spill store for evicted chats"""
+    config = st.secrets.get("session_memory", None) or {}
+    return SpillStore(config.get("spill_path"))
+
+def get_session_memory():
+    """Get this session's memory manager, creating it on first use"""
+    if "session_memory" not in st.session_state:
+        config = st.secrets.get("session_memory", None) or {}
+        session_id = current_session_id() or str(id(st.session_state))
+        memory = SessionMemory(
+            session_id,
+            get_spill_store(),
+            max_bytes=int(config.get("max_bytes", DEFAULT_MAX_SESSION_BYTES))
+        )
+        st.session_state.session_memory = memory
+        _sessions[session_id] = memory
+    return st.session_state.session_memory
+
+def get_all_session_usage():
+    """Get usage of every live session's manager in this process, for the admin view"""
+    return [
+        {
+            "session": memory.session_id,
+            "resident_chats": len(memory._viewed),
+            "resident_bytes": sum(size for _, size in memory._sizes.values()),
+            "evicted_chats": len(memory._evicted),
+            "evictions": memory.evictions,
+        }
+        for memory in list(_sessions.values())
+    ]
@@ -1,4 +1,11 @@
 import streamlit as st
+from utils.state_backend import get_state_backend
+
+# Session keys saved per user, so a browser reconnecting to any worker process picks up where it left off
+PERSISTED_KEYS = ("selected_chat",)
+
+# Seconds a user's saved session keys are kept
+USER_STATE_TTL = 7 * 86400
 
 def initialize_session_state():
     """Initialize session state variables"""
@@ -7,4 +14,24 @@ def initialize_session_state():
         st.session_state.user = None
         
     if "selected_chat" not in st.session_state:
-        st.session_state.selected_chat = None 
\ No newline at end of file
+        st.session_state.selected_chat = None
+
+def restore_user_state(user):
+    """Restore the user's saved session keys once per session, e.g. after landing on another worker"""
+    if st.session_state.get("user_state_restored") == user.id:
+        return
+    st.session_state.user_state_restored = user.id
+    
+    saved = get_state_backend().get("user_state", str(user.id)) or {}
+    for key in PERSISTED_KEYS:
+        if st.session_state.get(key) is None and saved.get(key) is not None:
+            st.session_state[key] = saved[key]
+    st.session_state.saved_user_state = {key: st.session_state.get(key) for key in PERSISTED_KEYS}
+
+def save_user_state(user):
+    """Save the user's persisted session keys if they changed in this run"""
+    state = {key: st.session_state.get(key) for key in PERSISTED_KEYS}
+    if st.session_state.get("saved_user_state") == state:
+        return
+    get_state_backend().set("user_state", str(user.id), state, ttl=USER_STATE_TTL)
+    st.session_state.saved_user_state = state
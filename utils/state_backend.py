@@ -0,0 +1,210 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+import streamlit as st
+
+# Writes between sweeps of expired SQLite rows
+SQLITE_PURGE_EVERY = 1000
+
+class MemoryStateBackend:
+    """
+    State kept in this process only, the default for a single worker
+
+    Every backend stores JSON-serializable values under (namespace, key),
+    optionally expiring after `ttl` seconds. update() applies a function to
+    the current value atomically; it may be called more than once under
+    contention, so it must not have side effects.
+    """
+
+    shared = False
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self._lock:
+            return self._live_value((namespace, key), time.time())
+
+    def set(self, namespace, key, value, ttl=None):
+        with self._lock:
+            self._entries[(namespace, key)] = (value, time.time() + ttl if ttl else None)
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._entries.pop((namespace, key), None)
+
+    def update(self, namespace, key, update, ttl=None):
+        """Replace a value with update(current value or None) atomically; returns the new value"""
+        with self._lock:
+            now = time.time()
+            value = update(self._live_value((namespace, key), now))
+            self._entries[(namespace, key)] = (value, now + ttl if ttl else None)
+            return value
+
+    def scan(self, namespace):
+        """Get every live {key: value} in a namespace"""
+        with self._lock:
+            now = time.time()
+            return {
+                key: entry[0] for (entry_namespace, key), entry in list(self._entries.items())
+                if entry_namespace == namespace and self._live_value((entry_namespace, key), now) is not None
+            }
+
+    def _live_value(self, entry_key, now):
+        entry = self._entries.get(entry_key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            del self._entries[entry_key]
+            return None
+        return entry[0]
+
+class SQLiteStateBackend:
+    """State in a SQLite file in WAL mode, shared by every worker process on one host"""
+
+    shared = True
+
+    def __init__(self, path=None):
+        if path is None:
+            path = Path.home() / ".streamlit_chatbot" / "state.sqlite3"
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state "
+            "(namespace TEXT, key TEXT, value TEXT NOT NULL, expires_at REAL, PRIMARY KEY (namespace, key))"
+        )
+        self._purge()
+
+    def get(self, namespace, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, namespace, key, value, ttl=None):
+        with self._lock:
+            self._put(namespace, key, value, ttl, time.time())
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def update(self, namespace, key, update, ttl=None):
+        """Replace a value with update(current value or None) atomically; returns the new value"""
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so other processes can't interleave
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._conn.execute(
+                    "SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                    (namespace, key, now)
+                ).fetchone()
+                value = update(json.loads(row[0]) if row else None)
+                self._put(namespace, key, value, ttl, now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return value
+
+    def scan(self, namespace):
+        """Get every live {key: value} in a namespace"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM state WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, time.time())
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def _put(self, namespace, key, value, ttl, now):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value), now + ttl if ttl else None)
+        )
+        self._writes += 1
+        if self._writes % SQLITE_PURGE_EVERY == 0:
+            self._purge()
+
+    def _purge(self):
+        self._conn.execute("DELETE FROM state WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+
+class RedisStateBackend:
+    """State in Redis (or a server speaking its protocol), shared by worker processes on any host"""
+
+    shared = True
+
+    def __init__(self, url="redis://localhost:6379/0", prefix="chatbot:"):
+        # Imported here so single-host deployments don't need the redis package
+        import redis
+
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, namespace, key):
+        raw = self._client.get(self._key(namespace, key))
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, namespace, key, value, ttl=None):
+        self._client.set(self._key(namespace, key), json.dumps(value), px=int(ttl * 1000) if ttl else None)
+
+    def delete(self, namespace, key):
+        self._client.delete(self._key(namespace, key))
+
+    def update(self, namespace, key, update, ttl=None):
+        """Replace a value with update(current value or None) atomically; returns the new value"""
+        redis_key = self._key(namespace, key)
+        result = {}
+
+        def transaction(pipe):
+            # WATCHed by transaction(): a concurrent write makes redis-py rerun this function
+            raw = pipe.get(redis_key)
+            result["value"] = update(json.loads(raw) if raw is not None else None)
+            pipe.multi()
+            pipe.set(redis_key, json.dumps(result["value"]), px=int(ttl * 1000) if ttl else None)
+
+        self._client.transaction(transaction, redis_key)
+        return result["value"]
+
+    def scan(self, namespace):
+        """Get every live {key: value} in a namespace"""
+        pattern_prefix = self._key(namespace, "")
+        redis_keys = list(self._client.scan_iter(match=pattern_prefix + "*", count=500))
+        if not redis_keys:
+            return {}
+        values = self._client.mget(redis_keys)
+        return {
+            redis_key.decode("utf-8")[len(pattern_prefix):]: json.loads(raw)
+            for redis_key, raw in zip(redis_keys, values) if raw is not None
+        }
+
+    def _key(self, namespace, key):
+        return f"{self.prefix}{namespace}:{key}"
+
+@st.cache_resource
+def get_state_backend():
+    """
+    Get the process-wide state backend
+
+    Chosen with a [state] section in Streamlit secrets: backend = "memory"
+    (the default, one worker process), "sqlite" (with an optional `path`, for
+    several worker processes on one host) or "redis" (with `url` and
+    `prefix`, for workers on several hosts).
+    """
+    config = st.secrets.get("state", None) or {}
+    backend_name = config.get("backend", "memory")
+
+    if backend_name == "sqlite":
+        return SQLiteStateBackend(config.get("path"))
+    if backend_name == "redis":
+        return RedisStateBackend(config.get("url", "redis://localhost:6379/0"), prefix=config.get("prefix", "chatbot:"))
+    return MemoryStateBackend()
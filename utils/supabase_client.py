@@ -1,15 +1,51 @@
 import streamlit as st
-from supabase import create_client
+from supabase import ClientOptions, create_client
+
+def create_supabase_client():
+    """
+    Create a new Supabase client from Streamlit secrets
+
+    Token refresh is handled by utils.auth_session, so the client's own
+    refresh timer and session storage are turned off.
+    """
 
-@st.cache_resource
-def init_supabase():
-    """Initialize Supabase client"""
-    
     # Get Supabase credentials from Streamlit secrets
     supabase_url = st.secrets["supabase"]["url"]
     supabase_key = st.secrets["supabase"]["key"]
-    
-    # Create Supabase client
-    client = create_client(supabase_url, supabase_key)
-    
-    return client 
\ No newline at end of file
+
+    return create_client(
+        supabase_url,
+        supabase_key,
+        options=ClientOptions(auto_refresh_token=False, persist_session=False)
+    )
+
+@st.cache_resource
+def init_supabase():
+    """
+    Initialize the process-wide Supabase client
+
+    Never signed in as any user, so it only sees what the project key allows;
+    per-user queries go through get_session_supabase().
+    """
+    return create_supabase_client()
+
+def get_session_supabase():
+    """
+    Get this browser session's own Supabase client
+
+    Sign-in and access tokens are applied to this client only, so row level
+    security sees the session's user and never another session's.
+    """
+    client = st.session_state.get("supabase_client")
+    if client is None:
+        client = create_supabase_client()
+        st.session_state.supabase_client = client
+    return client
+
+def reset_session_supabase():
+    """Drop this session's client, e.g. on sign-out, so the next one starts anonymous"""
+    st.session_state.pop("supabase_client", None)
+
+def authorize_client(client, access_token):
+    """Run a client's database queries as the user the access token belongs to"""
+    client.postgrest.auth(access_token)